@@ -0,0 +1,241 @@
+"""
+Benchmark of DynamoDB and Stripe calls under concurrent load, with the default clients
+and with the pooled clients from ClientFactory
+
+Both clients talk to a local HTTPS server that plays DynamoDB (POST, GetItem) and Stripe
+(GET, Account.retrieve). Every new connection waits --handshake-ms before its TLS
+handshake to stand in for the round trips of connecting to a remote service, and every
+request takes --service-ms. Each round sends --concurrency calls at once from a thread
+pool that lives for the whole run, like a warm container's. The server runs in its own
+process so it doesn't compete with the clients for the GIL.
+
+Usage:
+    python benchmark_clients.py --concurrency 50 --rounds 10
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import boto3
+import stripe
+
+from src.utils import ClientFactory
+
+DYNAMODB_ITEM = {"Item": {"email": {"S": "bench@example.com"}}}
+STRIPE_ACCOUNT = {
+    "id": "fca_benchmark0000000000000000",
+    "object": "financial_connections.account",
+}
+
+
+class BenchmarkServer(ThreadingHTTPServer):
+    """HTTPS server that delays new connections and counts their handshakes"""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(
+        self, context: ssl.SSLContext, delays: tuple[float, float], handshakes
+    ):
+        super().__init__(("127.0.0.1", 0), BenchmarkHandler)
+        self.context = context
+        self.handshake_delay, self.service_delay = delays
+        self.handshakes = handshakes
+
+    def finish_request(self, request, client_address):
+        time.sleep(self.handshake_delay)
+        try:
+            request = self.context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        with self.handshakes.get_lock():
+            self.handshakes.value += 1
+        super().finish_request(request, client_address)
+
+
+def serve(cert: str, key: str, delays: tuple[float, float], handshakes, port):
+    """Runs the benchmark server, publishing the port it listens on"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = BenchmarkServer(context, delays, handshakes)
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+class BenchmarkHandler(BaseHTTPRequestHandler):
+    """Answers DynamoDB GetItem (POST) and Stripe Account.retrieve (GET) calls"""
+
+    protocol_version = "HTTP/1.1"
+    server: BenchmarkServer
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answers a DynamoDB call"""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.__respond(DYNAMODB_ITEM, "application/x-amz-json-1.0")
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answers a Stripe call"""
+        self.__respond(STRIPE_ACCOUNT, "application/json")
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keeps the output to the results"""
+
+    def __respond(self, body: dict, content_type: str):
+        """Sends a JSON response after the simulated service time"""
+        time.sleep(self.server.service_delay)
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_certificate(directory: str) -> tuple[str, str]:
+    """Creates a self-signed certificate for 127.0.0.1 with openssl"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+            "-subj",
+            "/CN=127.0.0.1",
+            "-addext",
+            "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Gets the nearest rank percentile of sorted values"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_rounds(call, concurrency: int, rounds: int) -> list[float]:
+    """Makes concurrency calls at once, rounds times, returning their latencies in ms"""
+
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return (time.perf_counter() - start) * 1000
+
+    latencies: list[float] = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(rounds):
+            latencies.extend(pool.map(timed, range(concurrency)))
+    return latencies
+
+
+def summarize(latencies: list[float], handshakes: int) -> dict:
+    """Summarizes the latencies of a run"""
+    ordered = sorted(latencies)
+    return {
+        "calls": len(ordered),
+        "p50_ms": round(percentile(ordered, 50), 1),
+        "p95_ms": round(percentile(ordered, 95), 1),
+        "p99_ms": round(percentile(ordered, 99), 1),
+        "max_ms": round(ordered[-1], 1),
+        "new_connections": handshakes,
+    }
+
+
+def benchmark(endpoint: str, cert: str, handshakes, pooled: bool, args) -> dict:
+    """Runs the DynamoDB and Stripe calls with the default or the pooled clients"""
+    dynamodb_kwargs: dict[str, Any] = {
+        "endpoint_url": endpoint,
+        "region_name": "us-east-1",
+        "aws_access_key_id": "benchmark",
+        "aws_secret_access_key": "benchmark",
+        "verify": cert,
+    }
+
+    stripe.api_key = "sk_test_benchmark"
+    stripe.api_base = endpoint
+    stripe.ca_bundle_path = cert
+    factory = ClientFactory.from_env()
+    if pooled:
+        table = factory.get_dynamodb(**dynamodb_kwargs).Table("customers")
+        factory.configure_stripe(stripe)
+    else:
+        table = boto3.resource("dynamodb", **dynamodb_kwargs).Table("customers")
+        stripe.default_http_client = None
+
+    results = {}
+    for name, call in (
+        ("dynamodb", lambda: table.get_item(Key={"email": "bench@example.com"})),
+        (
+            "stripe",
+            lambda: stripe.financial_connections.Account.retrieve(STRIPE_ACCOUNT["id"]),
+        ),
+    ):
+        handshakes.value = 0
+        latencies = run_rounds(call, args.concurrency, args.rounds)
+        results[name] = summarize(latencies, handshakes.value)
+
+    if pooled:
+        results["pools"] = factory.get_pool_stats()
+    return results
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    parser.add_argument("--service-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = create_certificate(directory)
+        handshakes = multiprocessing.Value("i", 0)
+        port = multiprocessing.Value("i", 0)
+        delays = (args.handshake_ms / 1000, args.service_ms / 1000)
+        server = multiprocessing.Process(
+            target=serve, args=(cert, key, delays, handshakes, port), daemon=True
+        )
+        server.start()
+        while not port.value:
+            time.sleep(0.01)
+
+        endpoint = f"https://127.0.0.1:{port.value}"
+        try:
+            report = {
+                "default": benchmark(
+                    endpoint, cert, handshakes, pooled=False, args=args
+                ),
+                "pooled": benchmark(endpoint, cert, handshakes, pooled=True, args=args),
+            }
+        finally:
+            server.terminate()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
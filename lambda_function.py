@@ -1,6 +1,29 @@
 """Lambda function entry point"""
-from src.main import handler
+
+import os
+
+from src.main import clients, handler, warm_up
+from src.utils import build_response
+
+# Provisioned concurrency runs this module ahead of traffic, so prime while we can
+if os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE") == "provisioned-concurrency":
+    warm_up()
+
+
+def is_warm_up_event(event) -> bool:
+    """
+    Checks if the event is the keep-warm ping template.yaml schedules, {"warmup": true},
+    rather than an API request
+    """
+    return isinstance(event, dict) and event.get("warmup") is True
+
 
 def lambda_handler(event, context):
     """Lambda handler function that delegates to Mangum handler"""
-    return handler(event, context)
\ No newline at end of file
+    if is_warm_up_event(event):
+        timings = warm_up(context)
+        return build_response(
+            200,
+            {"message": "warm", "timings": timings, "pools": clients.get_pool_stats()},
+        )
+    return handler(event, context)
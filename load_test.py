@@ -0,0 +1,503 @@
+"""
+Load tester that replays API Gateway proxy events through lambda_function.lambda_handler
+
+Every request goes through the same path as in production (Mangum, then FastAPI, then
+the services), with the local DynamoDB, Stripe and model stand-ins behind it. Events are
+generated for every route of the app, or replayed from a JSON lines file.
+
+Cold starts are simulated by dropping the app modules from sys.modules and importing
+lambda_function again, which rebuilds every service and clears the in-process caches and
+the local snapshot directory. The interpreter and the framework stay imported, so the
+init time only covers the app itself. The DynamoDB and Stripe stand-ins are kept across
+cold starts, like the real services would be.
+
+Warm requests run on a thread pool with --concurrency workers in one process, so they
+share the GIL and the caches like requests in one container would, but unlike separate
+Lambda containers.
+
+Usage:
+    python load_test.py --requests 50 --concurrency 8 --cold-starts 3
+    python load_test.py --dump-events events.jsonl
+    python load_test.py --events events.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Optional
+from unittest.mock import patch
+from urllib.parse import quote
+
+from local_backends import LocalDynamoDBResource, LocalModelClient, LocalStripe
+
+CUSTOMER_ID = "cus_loadtest0000001"
+EMAIL = "loadtest@example.com"
+SESSION_ID = "0b9e5c1e-2f4a-4c7e-9a52-6d1f0c3b8e21"
+APP_MODULES = ("lambda_function", "src.main", "src.modules")
+
+# Query string and body for the routes that need them, keyed by (method, route path)
+RANGE_BODY = {"customer_id": CUSTOMER_ID, "range": "month"}
+ROUTE_SAMPLES: dict[tuple[str, str], dict] = {
+    ("GET", "/financial-connections/transactions/search"): {
+        "query": {"customer_id": CUSTOMER_ID, "q": "star", "limit": "50"}
+    },
+    ("GET", "/financial-connections/transactions/export"): {
+        "query": {"customer_id": CUSTOMER_ID, "range": "month"}
+    },
+    ("GET", "/financial-connections/transactions/recurring"): {
+        "query": {"customer_id": CUSTOMER_ID}
+    },
+    ("POST", "/financial-connections/transactions/data"): {"body": RANGE_BODY},
+    ("POST", "/financial-connections/transactions/summary"): {"body": RANGE_BODY},
+    ("POST", "/financial-connections/balances/history"): {"body": RANGE_BODY},
+    ("POST", "/financial-connections/accounts"): {"body": {"email": EMAIL}},
+    ("POST", "/financial-connections/accounts/batch"): {
+        "body": {"ids": ["{account_id}"]}
+    },
+    ("POST", "/financial-connections/transactions/batch"): {
+        "body": {"ids": ["{transaction_id}"]}
+    },
+    ("POST", "/sessions/{session_id}/generate"): {
+        "body": {
+            "user_id": "loadtest",
+            "session_id": SESSION_ID,
+            "thread_id": SESSION_ID,
+            "message_content": "How much did I spend on coffee this month?",
+            "history": [
+                {
+                    "message_id": "loadtest-message",
+                    "user_id": "loadtest",
+                    "message_content": "Hi",
+                    "message_type": "user",
+                    "session_id": SESSION_ID,
+                    "timestamp": "2024-01-01T00:00:00.000000+00:00",
+                    "graph_data": None,
+                }
+            ],
+            "context": [],
+            "customer_id": CUSTOMER_ID,
+            "range": "month",
+        }
+    },
+}
+
+
+def build_event(
+    method: str, path: str, query: Optional[dict] = None, body=None
+) -> dict:
+    """Builds an API Gateway REST (v1) proxy event, like the one API Gateway sends"""
+    headers = {"host": "localhost", "user-agent": "load-test"}
+    if body is not None:
+        headers["content-type"] = "application/json"
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": headers,
+        "multiValueHeaders": {key: [value] for key, value in headers.items()},
+        "queryStringParameters": query or None,
+        "multiValueQueryStringParameters": (
+            {key: [value] for key, value in query.items()} if query else None
+        ),
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": path,
+            "httpMethod": method,
+            "path": path,
+            "stage": "load-test",
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+def generate_events(app, path_values: dict) -> list[tuple[str, dict]]:
+    """Generates one (label, event) for every method of every API route of the app"""
+    # pylint: disable=import-outside-toplevel
+    from fastapi.routing import APIRoute
+
+    events = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        path = route.path
+        for name, value in path_values.items():
+            path = path.replace(f"{{{name}}}", quote(value, safe="@"))
+        for method in sorted(route.methods):
+            sample = ROUTE_SAMPLES.get((method, route.path), {})
+            body = sample.get("body")
+            if body is not None:
+                # Bodies can refer to path parameter values, as in {"ids": ["{account_id}"]}
+                text = json.dumps(body)
+                for name, value in path_values.items():
+                    text = text.replace(f"{{{name}}}", value)
+                body = json.loads(text)
+            event = build_event(method, path, sample.get("query"), body)
+            events.append((f"{method} {route.path}", event))
+    return events
+
+
+def read_events(filename: str) -> list[tuple[str, dict]]:
+    """Reads API Gateway events from a JSON lines file, labelled by method and path"""
+    events = []
+    with open(filename, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                label = f"{event.get('httpMethod')} {event.get('resource') or event.get('path')}"
+                events.append((label, event))
+    return events
+
+
+class RssSampler:
+    """Samples the resident set size of the process in a background thread"""
+
+    def __init__(self, interval: float = 0.01):
+        self.__interval = interval
+        self.__peak = 0
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__page_size = (
+            os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        )
+
+    def start(self):
+        """Starts sampling"""
+        self.__thread.start()
+
+    def stop(self):
+        """Stops sampling"""
+        self.__stop.set()
+        self.__thread.join()
+
+    def reset(self):
+        """Starts a new peak from the current RSS"""
+        self.__peak = self.__read()
+
+    def peak(self) -> int:
+        """Gets the peak RSS in bytes since the last reset"""
+        self.__peak = max(self.__peak, self.__read())
+        return self.__peak
+
+    def __run(self):
+        """Keeps the peak up to date until stopped"""
+        while not self.__stop.wait(self.__interval):
+            self.__peak = max(self.__peak, self.__read())
+
+    def __read(self) -> int:
+        """Reads the current RSS, falling back to the max RSS where /proc isn't there"""
+        try:
+            with open("/proc/self/statm", encoding="utf-8") as file:
+                return int(file.read().split()[1]) * self.__page_size
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Container:
+    """A simulated Lambda container, importing the app against the local stand-ins"""
+
+    def __init__(self, dynamodb, stripe, model_client, snapshot_dir: str):
+        self.__dynamodb = dynamodb
+        self.__stripe = stripe
+        self.__model_client = model_client
+        self.__snapshot_dir = snapshot_dir
+        self.lambda_function: Optional[ModuleType] = None
+        self.init_ms = 0.0
+
+    def start(self):
+        """Imports lambda_function from scratch, timing the init phase"""
+        for name in list(sys.modules):
+            if name in APP_MODULES or name.startswith("src.modules."):
+                del sys.modules[name]
+        shutil.rmtree(self.__snapshot_dir, ignore_errors=True)
+
+        original_stripe = sys.modules.get("stripe")
+        sys.modules["stripe"] = self.__stripe
+        try:
+            with patch("boto3.resource", return_value=self.__dynamodb), patch(
+                "src.utils.OpenAIModelClient", lambda **kwargs: self.__model_client
+            ), patch.dict(
+                os.environ, {"TRANSACTION_SNAPSHOT_DIR": self.__snapshot_dir}
+            ):
+                start = time.perf_counter()
+                self.lambda_function = importlib.import_module("lambda_function")
+                self.init_ms = (time.perf_counter() - start) * 1000
+        finally:
+            if original_stripe is not None:
+                sys.modules["stripe"] = original_stripe
+            else:
+                del sys.modules["stripe"]
+
+        # Keep the server-sent event streams short enough to measure
+        sessions_service = sys.modules["src.modules.sessions.sessions_service"]
+        sessions_service.EVENTS_MAX_DURATION = 0.2
+        sessions_service.EVENTS_POLL_INTERVAL = 0.1
+
+    @property
+    def app(self):
+        """The FastAPI app of the container"""
+        return sys.modules["src.main"].app
+
+    def invoke(self, event: dict) -> tuple[float, bool]:
+        """Invokes the handler with an event, returning (latency in ms, succeeded)"""
+        if self.lambda_function is None:
+            raise RuntimeError("The container hasn't been started")
+
+        start = time.perf_counter()
+        try:
+            response = self.lambda_function.lambda_handler(event, None)
+            succeeded = 200 <= response.get("statusCode", 500) < 300
+        except Exception as e:
+            print(e)
+            succeeded = False
+        return (time.perf_counter() - start) * 1000, succeeded
+
+
+def seed(dynamodb):
+    """Stores the customer and session the generated events refer to"""
+    dynamodb.Table("customers").put_item(
+        Item={"email": EMAIL, "customer_id": CUSTOMER_ID}
+    )
+    dynamodb.Table("session_info").put_item(
+        Item={
+            "session_id": SESSION_ID,
+            "session_name": "Load Test",
+            "updated_at": "2024-01-01T00:00:00.000000+00:00",
+        }
+    )
+    dynamodb.Table("chat_logs").put_item(
+        Item={
+            "id": "loadtest-message",
+            "session_id": SESSION_ID,
+            "thread_id": SESSION_ID,
+            "message_content": "Hi",
+            "message_type": "user",
+            "timestamp": "2024-01-01T00:00:00.000000+00:00",
+        }
+    )
+
+
+def get_path_values(stripe) -> dict:
+    """Gets the values of the path parameters used in generated events"""
+    account = stripe.list_accounts(account_holder={"customer": CUSTOMER_ID}).data[0]
+    transaction = stripe.list_transactions(account=account.id, limit=1).data[0]
+    return {
+        "customer_id": CUSTOMER_ID,
+        "email": EMAIL,
+        "account_id": account.id,
+        "transaction_id": transaction.id,
+        "session_id": SESSION_ID,
+    }
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Gets the nearest rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float, peak_rss: int):
+    """Summarizes the results of one route"""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 50), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "p99_ms": round(percentile(ordered, 99), 2),
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+    }
+
+
+def run_cold_starts(container: Container, events, count: int, sampler: RssSampler):
+    """Starts count fresh containers, timing init and the first request of every route"""
+    init_ms = []
+    first_requests: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    for _ in range(count):
+        container.start()
+        init_ms.append(container.init_ms)
+        for label, event in events:
+            latency, succeeded = container.invoke(event)
+            first_requests[label].append(latency)
+            errors[label] += not succeeded
+
+    return {
+        "count": count,
+        "init_ms": round(sum(init_ms) / len(init_ms), 2) if init_ms else 0.0,
+        "first_request_ms": {
+            label: round(sum(values) / len(values), 2)
+            for label, values in first_requests.items()
+        },
+        "errors": dict(errors),
+        "peak_rss_mb": round(sampler.peak() / 2**20, 1),
+    }
+
+
+def run_warm(container: Container, events, requests: int, concurrency: int, sampler):
+    """Sends every route requests times with concurrency workers, one route at a time"""
+    results = {}
+    with ThreadPoolExecutor(
+        max_workers=concurrency,
+        initializer=lambda: asyncio.set_event_loop(asyncio.new_event_loop()),
+    ) as pool:
+        by_label: dict[str, list[dict]] = defaultdict(list)
+        for label, event in events:
+            by_label[label].append(event)
+
+        for label, label_events in by_label.items():
+            batch = [label_events[i % len(label_events)] for i in range(requests)]
+            sampler.reset()
+            start = time.perf_counter()
+            outcomes = list(pool.map(container.invoke, batch))
+            elapsed = time.perf_counter() - start
+            latencies = [latency for latency, _ in outcomes]
+            errors = sum(not succeeded for _, succeeded in outcomes)
+            results[label] = summarize(latencies, errors, elapsed, sampler.peak())
+    return results
+
+
+def replay(container: Container, events, concurrency: int, sampler: RssSampler):
+    """Replays events in order with concurrency workers, summarized by route"""
+    with ThreadPoolExecutor(
+        max_workers=concurrency,
+        initializer=lambda: asyncio.set_event_loop(asyncio.new_event_loop()),
+    ) as pool:
+        start = time.perf_counter()
+        outcomes = list(
+            pool.map(lambda item: (item[0], container.invoke(item[1])), events)
+        )
+        elapsed = time.perf_counter() - start
+
+    grouped: dict[str, list[tuple[float, bool]]] = defaultdict(list)
+    for label, outcome in outcomes:
+        grouped[label].append(outcome)
+    peak = sampler.peak()
+    return {
+        label: summarize(
+            [latency for latency, _ in values],
+            sum(not succeeded for _, succeeded in values),
+            elapsed,
+            peak,
+        )
+        for label, values in grouped.items()
+    }
+
+
+def print_report(report: dict):
+    """Prints the results as tables"""
+    cold = report.get("cold_starts")
+    if cold:
+        print(f"\nCold starts: {cold['count']}, init {cold['init_ms']} ms (mean)")
+        print(f"{'route':<64} {'first request ms':>17} {'errors':>7}")
+        for label, latency in cold["first_request_ms"].items():
+            print(f"{label:<64} {latency:>17} {cold['errors'].get(label, 0):>7}")
+
+    warm = report.get("warm") or {}
+    if warm:
+        print(
+            f"\nWarm: {report['requests']} requests per route, concurrency {report['concurrency']}"
+        )
+        print(
+            f"{'route':<64} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'errors':>7} {'rss MB':>7}"
+        )
+        for label, row in warm.items():
+            print(
+                f"{label:<64} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+                f"{row['throughput_rps']:>8} {row['errors']:>7} {row['peak_rss_mb']:>7}"
+            )
+
+
+def parse_args():
+    """Parses the command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--requests", type=int, default=50, help="warm requests per route"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cold-starts", type=int, default=1)
+    parser.add_argument(
+        "--events", help="JSON lines file of API Gateway events to replay"
+    )
+    parser.add_argument("--dump-events", help="write the generated events to this file")
+    parser.add_argument("--accounts", type=int, default=3, help="accounts per customer")
+    parser.add_argument("--transactions", type=int, default=500, help="per account")
+    parser.add_argument("--stripe-latency-ms", type=float, default=0.0)
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    """Runs the load test"""
+    args = parse_args()
+    dynamodb = LocalDynamoDBResource(latency=args.dynamodb_latency_ms / 1000)
+    stripe = LocalStripe(
+        accounts_per_customer=args.accounts,
+        transactions_per_account=args.transactions,
+        latency=args.stripe_latency_ms / 1000,
+    )
+    seed(dynamodb)
+
+    snapshot_dir = tempfile.mkdtemp(prefix="load_test_snapshots_")
+    container = Container(dynamodb, stripe, LocalModelClient(), snapshot_dir)
+    sampler = RssSampler()
+    sampler.start()
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    try:
+        if args.events:
+            events = read_events(args.events)
+        else:
+            container.start()
+            events = generate_events(container.app, get_path_values(stripe))
+
+        if args.dump_events:
+            with open(args.dump_events, "w", encoding="utf-8") as file:
+                for _, event in events:
+                    file.write(json.dumps(event) + "\n")
+            return
+
+        report = {"requests": args.requests, "concurrency": args.concurrency}
+        if args.cold_starts:
+            report["cold_starts"] = run_cold_starts(
+                container, events, args.cold_starts, sampler
+            )
+        elif container.lambda_function is None:
+            container.start()
+
+        if args.events:
+            report["warm"] = replay(container, events, args.concurrency, sampler)
+        else:
+            report["warm"] = run_warm(
+                container, events, args.requests, args.concurrency, sampler
+            )
+    finally:
+        sampler.stop()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
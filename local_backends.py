@@ -0,0 +1,544 @@
+"""
+This module contains in-memory stand-ins for DynamoDB, Stripe and the language model,
+used for tests, local load tests and development without AWS, Stripe or OpenAI
+credentials
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+from src.utils import estimate_tokens
+
+# Method and argument names mirror boto3 and stripe
+# pylint: disable=invalid-name
+
+# Key schema (hash key, range key) of every table the app uses
+LOCAL_TABLE_KEYS: dict[str, tuple[str, Optional[str]]] = {
+    "chat_logs": ("session_id", "timestamp"),
+    "session_info": ("session_id", None),
+    "customers": ("email", None),
+    "users": ("email", None),
+    "daily_rollups": ("account_id", "day"),
+}
+
+CONDITION_FAILED = "ConditionalCheckFailedException"
+SECONDS_PER_DAY = 86400
+# Transaction IDs are fctxn_ + account ID suffix + zero padded index, alphanumeric like Stripe's
+TRANSACTION_INDEX_DIGITS = 6
+
+
+def split_top_level(text: str, separator: str = ",") -> list[str]:
+    """Splits text on a separator that isn't inside parentheses"""
+    parts: list[str] = []
+    current: list[str] = []
+    depth = 0
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+class LocalTable:
+    """
+    In-memory stand-in for a boto3 DynamoDB Table
+
+    Supports the calls the app makes: get/put/update/delete_item, query with boto3 Key
+    conditions, scan, batch_writer and simple attribute_not_exists conditions.
+    """
+
+    def __init__(self, name: str, client, latency: float = 0.0):
+        self.name = name
+        self.meta = type("Meta", (), {"client": client})()
+        self.__hash_key, self.__range_key = LOCAL_TABLE_KEYS.get(name, ("id", None))
+        self.__items: dict[tuple, dict] = {}
+        self.__lock = threading.Lock()
+        self.__latency = latency
+
+    def get_item(self, Key, **kwargs):
+        """Gets an item by its key"""
+        self.__wait()
+        with self.__lock:
+            item = self.__items.get(self.__get_key(Key))
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        """Puts an item, checking an attribute_not_exists condition if given"""
+        self.__wait()
+        with self.__lock:
+            key = self.__get_key(Item)
+            self.__check_condition(ConditionExpression, self.__items.get(key))
+            self.__items[key] = dict(Item)
+        return {}
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression,
+        ExpressionAttributeValues=None,
+        ExpressionAttributeNames=None,
+        **kwargs,
+    ):
+        """Applies a SET update expression, creating the item if needed"""
+        self.__wait()
+        with self.__lock:
+            self.__apply_update(
+                Key,
+                UpdateExpression,
+                ExpressionAttributeValues,
+                ExpressionAttributeNames,
+            )
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        """Deletes an item by its key"""
+        self.__wait()
+        with self.__lock:
+            self.__items.pop(self.__get_key(Key), None)
+        return {}
+
+    def query(
+        self, KeyConditionExpression, ScanIndexForward=True, Limit=None, **kwargs
+    ):
+        """Queries the items matching a boto3 key condition, sorted by range key"""
+        self.__wait()
+        with self.__lock:
+            items = [
+                dict(item)
+                for item in self.__items.values()
+                if self.__matches(KeyConditionExpression, item)
+            ]
+        if self.__range_key:
+            items.sort(key=lambda item: item[self.__range_key])
+        if not ScanIndexForward:
+            items.reverse()
+        return {"Items": items[:Limit] if Limit else items}
+
+    def scan(self, **kwargs):
+        """Gets every item"""
+        self.__wait()
+        with self.__lock:
+            return {"Items": [dict(item) for item in self.__items.values()]}
+
+    @contextmanager
+    def batch_writer(self, **kwargs):
+        """Yields a writer whose puts and deletes go straight to the table"""
+        yield self
+
+    def apply_update(
+        self,
+        Key,
+        UpdateExpression,
+        ExpressionAttributeValues,
+        ExpressionAttributeNames=None,
+    ):
+        """Applies an update as part of a transaction"""
+        with self.__lock:
+            self.__apply_update(
+                Key,
+                UpdateExpression,
+                ExpressionAttributeValues,
+                ExpressionAttributeNames,
+            )
+
+    def __apply_update(self, key, expression, values, names):
+        """Applies a SET update expression with plain and if_not_exists assignments"""
+        values = values or {}
+        names = names or {}
+        item = self.__items.setdefault(self.__get_key(key), dict(key))
+        assignments = re.sub(r"^\s*SET\s+", "", expression, flags=re.IGNORECASE)
+        for assignment in split_top_level(assignments):
+            attribute, value = (part.strip() for part in assignment.split("=", 1))
+            attribute = names.get(attribute, attribute)
+            default = re.fullmatch(r"if_not_exists\(\s*(\S+)\s*,\s*(\S+)\s*\)", value)
+            if default:
+                if attribute not in item:
+                    item[attribute] = values[default.group(2)]
+            else:
+                item[attribute] = values[value]
+
+    def __check_condition(self, condition: Optional[str], existing: Optional[dict]):
+        """Raises like DynamoDB if an attribute_not_exists condition fails"""
+        if not condition:
+            return
+        missing = re.fullmatch(r"\s*attribute_not_exists\((\w+)\)\s*", condition)
+        if missing and existing is not None and missing.group(1) in existing:
+            raise ClientError(
+                {"Error": {"Code": CONDITION_FAILED, "Message": "Condition failed"}},
+                "PutItem",
+            )
+
+    def __matches(self, condition, item: dict) -> bool:
+        """Evaluates a boto3 key condition against an item"""
+        expression = condition.get_expression()
+        operator, values = expression["operator"], expression["values"]
+        if operator == "AND":
+            return self.__matches(values[0], item) and self.__matches(values[1], item)
+
+        value = item.get(values[0].name)
+        if value is None:
+            return False
+        if operator == "=":
+            return value == values[1]
+        if operator == "<":
+            return value < values[1]
+        if operator == "<=":
+            return value <= values[1]
+        if operator == ">":
+            return value > values[1]
+        if operator == ">=":
+            return value >= values[1]
+        if operator == "BETWEEN":
+            return values[1] <= value <= values[2]
+        if operator == "begins_with":
+            return str(value).startswith(values[1])
+        raise ValueError(f"Unsupported key condition: {operator}")
+
+    def __get_key(self, item: dict) -> tuple:
+        """Gets the primary key of an item"""
+        if self.__range_key:
+            return (item[self.__hash_key], item[self.__range_key])
+        return (item[self.__hash_key],)
+
+    def __wait(self):
+        """Simulates the network round trip of a call"""
+        if self.__latency:
+            time.sleep(self.__latency)
+
+
+class LocalDynamoDBClient:
+    """In-memory stand-in for the low level DynamoDB client of a LocalDynamoDBResource"""
+
+    def __init__(self, resource):
+        self.__resource = resource
+
+    def describe_table(self, TableName):
+        """Describes a table"""
+        return {"Table": {"TableName": TableName, "TableStatus": "ACTIVE"}}
+
+    def transact_write_items(self, TransactItems):
+        """Applies Put and Update actions (not atomically)"""
+        for action in TransactItems:
+            if "Put" in action:
+                put = action["Put"]
+                self.__resource.Table(put["TableName"]).put_item(Item=put["Item"])
+            elif "Update" in action:
+                update = action["Update"]
+                self.__resource.Table(update["TableName"]).apply_update(
+                    Key=update["Key"],
+                    UpdateExpression=update["UpdateExpression"],
+                    ExpressionAttributeValues=update.get("ExpressionAttributeValues"),
+                    ExpressionAttributeNames=update.get("ExpressionAttributeNames"),
+                )
+        return {}
+
+
+class LocalDynamoDBResource:
+    """In-memory stand-in for boto3.resource("dynamodb")"""
+
+    def __init__(self, latency: float = 0.0):
+        self.meta = type("Meta", (), {"client": LocalDynamoDBClient(self)})()
+        self.__latency = latency
+        self.__tables: dict[str, LocalTable] = {}
+        self.__lock = threading.Lock()
+
+    def Table(self, name: str) -> LocalTable:
+        """Gets a table, creating it on first use"""
+        with self.__lock:
+            if name not in self.__tables:
+                self.__tables[name] = LocalTable(name, self.meta.client, self.__latency)
+            return self.__tables[name]
+
+
+class LocalStripeObject(dict):
+    """Dict with attribute access, like stripe.StripeObject"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+
+class LocalStripe:
+    """
+    In-memory stand-in for the stripe module, covering the Customer and Financial
+    Connections calls the app makes. Every customer gets accounts_per_customer
+    accounts with transactions_per_account transactions spread over the last six
+    months, generated deterministically on first use. Every call sleeps for latency
+    seconds to simulate the API round trip.
+    """
+
+    def __init__(
+        self,
+        accounts_per_customer: int = 3,
+        transactions_per_account: int = 500,
+        latency: float = 0.0,
+    ):
+        self.api_key: Optional[str] = None
+        self.accounts_per_customer = accounts_per_customer
+        self.transactions_per_account = transactions_per_account
+        self.latency = latency
+        self.__accounts: dict[str, list[LocalStripeObject]] = {}
+        self.__transactions: dict[str, list[LocalStripeObject]] = {}
+        self.__lock = threading.Lock()
+
+        stand_in = self
+        self.Customer = type(
+            "Customer",
+            (),
+            {
+                "create": staticmethod(stand_in.create_customer),
+                "list": staticmethod(stand_in.list_customers),
+            },
+        )
+        self.financial_connections = type(
+            "FinancialConnections",
+            (),
+            {
+                "Account": type(
+                    "Account",
+                    (),
+                    {
+                        "list": staticmethod(stand_in.list_accounts),
+                        "retrieve": staticmethod(stand_in.retrieve_account),
+                        "disconnect": staticmethod(stand_in.disconnect_account),
+                        "subscribe": staticmethod(stand_in.noop),
+                        "refresh_account": staticmethod(stand_in.noop),
+                    },
+                ),
+                "Transaction": type(
+                    "Transaction",
+                    (),
+                    {
+                        "list": staticmethod(stand_in.list_transactions),
+                        "retrieve": staticmethod(stand_in.retrieve_transaction),
+                    },
+                ),
+                "Session": type(
+                    "Session",
+                    (),
+                    {"create": staticmethod(stand_in.create_session)},
+                ),
+            },
+        )
+
+    def create_customer(self, email=None, **kwargs):
+        """Creates a customer"""
+        self.__wait()
+        return LocalStripeObject(id=f"cus_{random.randrange(16**14):014x}", email=email)
+
+    def list_customers(self, **kwargs):
+        """Lists customers"""
+        self.__wait()
+        return LocalStripeObject(data=[], has_more=False)
+
+    def create_session(self, **kwargs):
+        """Creates a Financial Connections session"""
+        self.__wait()
+        return LocalStripeObject(client_secret="fcsess_secret_local")
+
+    def list_accounts(self, account_holder=None, **kwargs):
+        """Lists a customer's accounts"""
+        self.__wait()
+        customer_id = (account_holder or {}).get("customer", "")
+        return LocalStripeObject(data=self.__get_accounts(customer_id), has_more=False)
+
+    def retrieve_account(self, account_id, **kwargs):
+        """Gets an account by its ID"""
+        self.__wait()
+        return self.__find_account(account_id)
+
+    def disconnect_account(self, account_id, **kwargs):
+        """Disconnecting isn't simulated, the account is returned as is"""
+        self.__wait()
+        return LocalStripeObject(data=self.__find_account(account_id))
+
+    def list_transactions(
+        self, account, limit=10, starting_after=None, transacted_at=None, **kwargs
+    ):
+        """Lists an account's transactions newest first, one page at a time"""
+        self.__wait()
+        transactions = self.__transactions.get(account, [])
+        start = 0
+        if starting_after:
+            start = int(starting_after[-TRANSACTION_INDEX_DIGITS:]) + 1
+        since = (transacted_at or {}).get("gte")
+        page = []
+        for txn in transactions[start:]:
+            if since is not None and txn["transacted_at"] < since:
+                break
+            page.append(txn)
+            if len(page) > limit:
+                break
+        has_more = len(page) > limit
+        return LocalStripeObject(data=page[:limit], has_more=has_more)
+
+    def retrieve_transaction(self, txn_id, **kwargs):
+        """Gets a transaction by its ID"""
+        self.__wait()
+        suffix = txn_id.removeprefix("fctxn_")
+        account_id = suffix[:-TRANSACTION_INDEX_DIGITS]
+        index = suffix[-TRANSACTION_INDEX_DIGITS:]
+        transactions = self.__transactions.get(f"fca_{account_id}", [])
+        if int(index) >= len(transactions):
+            raise KeyError(f"No such transaction: {txn_id}")
+        return transactions[int(index)]
+
+    def noop(self, *args, **kwargs):
+        """Accepts a call that has no effect on the stand-in data"""
+        self.__wait()
+        return LocalStripeObject()
+
+    def __get_accounts(self, customer_id: str):
+        """Gets a customer's accounts, generating them on first use"""
+        with self.__lock:
+            if customer_id not in self.__accounts:
+                self.__accounts[customer_id] = self.__generate_accounts(customer_id)
+            return self.__accounts[customer_id]
+
+    def __find_account(self, account_id: str):
+        """Finds an account among the generated ones"""
+        for accounts in self.__accounts.values():
+            for account in accounts:
+                if account["id"] == account_id:
+                    return account
+        raise KeyError(f"No such account: {account_id}")
+
+    def __generate_accounts(self, customer_id: str):
+        """Generates a customer's accounts and their transactions"""
+        rng = random.Random(customer_id)
+        now = int(time.time())
+        accounts = []
+        for i in range(self.accounts_per_customer):
+            account_id = f"fca_{rng.getrandbits(96):024x}"
+            accounts.append(
+                LocalStripeObject(
+                    id=account_id,
+                    object="financial_connections.account",
+                    category="cash",
+                    display_name=f"Local Account {i + 1}",
+                    institution_name="Local Bank",
+                    last4=f"{rng.randrange(10000):04d}",
+                    status="active",
+                    balance=LocalStripeObject(
+                        as_of=now,
+                        current={"usd": rng.randrange(100000, 10000000)},
+                        type="cash",
+                    ),
+                    balance_refresh=LocalStripeObject(
+                        status="succeeded", next_refresh_available_at=now + 86400
+                    ),
+                    transaction_refresh=LocalStripeObject(
+                        id=f"fctxnref_{i}",
+                        status="succeeded",
+                        last_attempted_at=now,
+                        next_refresh_available_at=now + 86400,
+                    ),
+                )
+            )
+            self.__transactions[account_id] = self.__generate_transactions(
+                rng, account_id, now
+            )
+        return accounts
+
+    def __generate_transactions(self, rng: random.Random, account_id: str, now: int):
+        """Generates an account's transactions, newest first with the index in the ID"""
+        count = self.transactions_per_account
+        descriptions = [
+            "STARBUCKS",
+            "AMZN Mktp US",
+            "UBER TRIP",
+            "NETFLIX.COM",
+            "PAYROLL",
+        ]
+        spacing = max(1, 180 * SECONDS_PER_DAY // max(count, 1))
+        transactions = []
+        for i in range(count):
+            transacted_at = now - i * spacing - rng.randrange(spacing)
+            status = "pending" if i < 3 else "posted"
+            transactions.append(
+                LocalStripeObject(
+                    id=f"fctxn_{account_id[4:]}{i:0{TRANSACTION_INDEX_DIGITS}d}",
+                    object="financial_connections.transaction",
+                    account=account_id,
+                    amount=rng.randrange(-20000, 5000),
+                    currency="usd",
+                    description=rng.choice(descriptions),
+                    livemode=False,
+                    status=status,
+                    status_transitions=LocalStripeObject(
+                        posted_at=transacted_at + 3600 if status == "posted" else None,
+                        void_at=None,
+                    ),
+                    transacted_at=transacted_at,
+                    transaction_refresh="fctxnref_local",
+                    updated=now,
+                )
+            )
+        return transactions
+
+    def __wait(self):
+        """Simulates the network round trip of a call"""
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class LocalModelClient:
+    """
+    Stand-in for OpenAIModelClient that returns canned JSON responses without any
+    network calls: `response` is streamed and `completion` is returned by complete().
+    Every received prompt is recorded in `calls`.
+
+    For latency tests, streamed responses are split into chunk_size character chunks,
+    the first one sent after first_token_delay seconds and the rest every chunk_delay.
+    """
+
+    def __init__(
+        self,
+        response: Optional[dict] = None,
+        completion: Optional[dict] = None,
+        chunk_size: int = 4,
+        first_token_delay: float = 0.0,
+        chunk_delay: float = 0.0,
+    ):
+        self.response = response or {"message": "This is a local test response."}
+        self.completion = completion or {"title": "Local Test Chat"}
+        self.calls: List[List[dict]] = []
+        self.__chunk_size = chunk_size
+        self.__first_token_delay = first_token_delay
+        self.__chunk_delay = chunk_delay
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens in a piece of text"""
+        return estimate_tokens(text)
+
+    def complete(self, messages: List[dict]) -> str:
+        """Returns the canned completion as JSON"""
+        self.calls.append(messages)
+        return json.dumps(self.completion)
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        """Yields the canned response as JSON in small chunks"""
+        self.calls.append(messages)
+        text = json.dumps(self.response)
+        time.sleep(self.__first_token_delay)
+        for start in range(0, len(text), self.__chunk_size):
+            if start:
+                time.sleep(self.__chunk_delay)
+            stop = start + self.__chunk_size
+            yield text[start:stop]
@@ -2,6 +2,7 @@
 
 import logging
 import os
+import time
 
 import boto3
 import stripe
@@ -11,13 +12,27 @@ from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
 
 from src.modules import (
+    DailyRollupStore,
     FinancialConnectionsHandler,
     FinancialConnectionsService,
+    FinancialContextBuilder,
+    GenerationService,
+    LocalSessionEventBus,
     SessionsHandler,
     SessionsService,
+    TransactionSnapshotStore,
     UsersHandler,
     UsersService,
 )
+from src.utils import (
+    ClientFactory,
+    LocalProfileSink,
+    OpenAIModelClient,
+    ProfileMode,
+    ProfileSink,
+    ProfilingMiddleware,
+    S3ProfileSink,
+)
 
 load_dotenv()
 
@@ -27,44 +42,87 @@ logger.setLevel(logging.INFO)
 # Keys
 DYNAMODB_ENDPOINT = os.getenv("DYNAMODB_ENDPOINT")
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Local disk
+TRANSACTION_SNAPSHOT_DIR = os.getenv(
+    "TRANSACTION_SNAPSHOT_DIR", "/tmp/transaction_snapshots"
+)
+TRANSACTION_SNAPSHOT_MAX_BYTES = int(
+    os.getenv("TRANSACTION_SNAPSHOT_MAX_BYTES", str(128 * 1024 * 1024))
+)
 
-# Clients
+# Profiling, off unless a secret or a sample rate is set
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+try:
+    PROFILE_MODE = ProfileMode(os.getenv("PROFILE_MODE", ProfileMode.PSTATS.value))
+except ValueError as e:
+    print(e)
+    PROFILE_MODE = ProfileMode.PSTATS
+PROFILE_SINK = os.getenv("PROFILE_SINK", "/tmp/profiles")
+
+# Clients, pooled connections are kept across warm invocations
+clients = ClientFactory.from_env()
 stripe.api_key = STRIPE_API_KEY
+clients.configure_stripe(stripe)
+model_client = OpenAIModelClient(api_key=OPENAI_API_KEY)
 
 # Database
 if os.getenv("ENV") == "local":
     logger.info(f"Connecting to local DynamoDB at: {DYNAMODB_ENDPOINT}")
-    dynamodb = boto3.resource(
-        "dynamodb",
+    dynamodb = clients.get_dynamodb(
         endpoint_url=DYNAMODB_ENDPOINT,
         region_name="us-east-1",
         aws_access_key_id="dummy",
         aws_secret_access_key="dummy",
     )
 else:
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = clients.get_dynamodb()
 
 CHAT_LOGS_TABLE_NAME = "chat_logs"
 SESSION_INFO_TABLE_NAME = "session_info"
 CUSTOMERS_TABLE_NAME = "customers"
 USERS_TABLE_NAME = "users"
+DAILY_ROLLUPS_TABLE_NAME = "daily_rollups"
 
 chat_logs_db = dynamodb.Table(CHAT_LOGS_TABLE_NAME)
 session_info_db = dynamodb.Table(SESSION_INFO_TABLE_NAME)
 customers_db = dynamodb.Table(CUSTOMERS_TABLE_NAME)
 users_db = dynamodb.Table(USERS_TABLE_NAME)
+daily_rollups_db = dynamodb.Table(DAILY_ROLLUPS_TABLE_NAME)
 
 # Services
+daily_rollups = DailyRollupStore(db=daily_rollups_db)
+transaction_snapshots = TransactionSnapshotStore(
+    directory=TRANSACTION_SNAPSHOT_DIR, max_bytes=TRANSACTION_SNAPSHOT_MAX_BYTES
+)
 financial_connections_service = FinancialConnectionsService(
-    db=customers_db, stripe=stripe
+    db=customers_db,
+    stripe=stripe,
+    rollups=daily_rollups,
+    snapshots=transaction_snapshots,
 )
 sessions_service = SessionsService(
-    chat_logs_db=chat_logs_db, session_info_db=session_info_db
+    chat_logs_db=chat_logs_db,
+    session_info_db=session_info_db,
+    event_bus=LocalSessionEventBus(),
 )
 users_service = UsersService(db=users_db)
+context_builder = FinancialContextBuilder(
+    financial_connections_service=financial_connections_service,
+    model_client=model_client,
+)
+generation_service = GenerationService(
+    chat_logs_db=chat_logs_db,
+    session_info_db=session_info_db,
+    sessions_service=sessions_service,
+    model_client=model_client,
+    context_builder=context_builder,
+)
 
 # Handlers
-sessions_handler = SessionsHandler(sessions_service)
+sessions_handler = SessionsHandler(sessions_service, generation_service)
 financial_connections_handler = FinancialConnectionsHandler(
     financial_connections_service
 )
@@ -81,6 +139,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+profile_sink: ProfileSink
+if PROFILE_SINK.startswith("s3://"):
+    bucket, _, prefix = PROFILE_SINK.removeprefix("s3://").partition("/")
+    profile_sink = S3ProfileSink(boto3.client("s3"), bucket=bucket, prefix=prefix)
+else:
+    profile_sink = LocalProfileSink(directory=PROFILE_SINK)
+
+app.add_middleware(
+    ProfilingMiddleware,
+    sink=profile_sink,
+    secret=PROFILE_SECRET,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    mode=PROFILE_MODE,
+)
+
 app.include_router(sessions_handler.router)
 app.include_router(financial_connections_handler.router)
 app.include_router(users_handler.router)
@@ -94,3 +167,63 @@ async def root():
 
 
 handler = Mangum(app)
+
+# Synthetic API Gateway event used to push one request through Mangum and FastAPI
+WARM_UP_ASGI_EVENT = {
+    "resource": "/",
+    "path": "/",
+    "httpMethod": "GET",
+    "headers": {},
+    "multiValueHeaders": {},
+    "queryStringParameters": None,
+    "multiValueQueryStringParameters": None,
+    "pathParameters": None,
+    "stageVariables": None,
+    "requestContext": {
+        "resourcePath": "/",
+        "httpMethod": "GET",
+        "path": "/",
+        "stage": "warmup",
+        "identity": {"sourceIp": "127.0.0.1"},
+    },
+    "body": None,
+    "isBase64Encoded": False,
+}
+
+
+def warm_up(context=None):
+    """
+    Primes the container so the first real request doesn't pay setup costs.
+
+    Opens pooled connections to DynamoDB and Stripe (TLS handshakes included) and routes
+    one request through the ASGI stack. Each step is best effort; a failing step is
+    logged and never fails the warm-up. The in-process caches are all keyed by customer,
+    so they fill on each customer's first request rather than here.
+    """
+    timings = {}
+
+    def timed(name, step):
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    for table_name in (
+        CHAT_LOGS_TABLE_NAME,
+        SESSION_INFO_TABLE_NAME,
+        CUSTOMERS_TABLE_NAME,
+        USERS_TABLE_NAME,
+        DAILY_ROLLUPS_TABLE_NAME,
+    ):
+        timed(
+            f"dynamodb:{table_name}",
+            lambda name=table_name: dynamodb.meta.client.describe_table(TableName=name),
+        )
+    timed("stripe", lambda: stripe.Customer.list(limit=1))
+    timed("asgi", lambda: handler(WARM_UP_ASGI_EVENT, context))
+
+    logger.info(f"Warm-up timings (ms): {timings}")
+    logger.info(f"Connection pools: {clients.get_pool_stats()}")
+    return timings
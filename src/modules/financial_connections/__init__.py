@@ -1,8 +1,12 @@
 """Financial Connections Module"""
 
+from src.modules.financial_connections.daily_rollups import DailyRollupStore
 from src.modules.financial_connections.financial_connections_handler import (
     FinancialConnectionsHandler,
 )
 from src.modules.financial_connections.financial_connections_service import (
     FinancialConnectionsService,
 )
+from src.modules.financial_connections.transaction_snapshots import (
+    TransactionSnapshotStore,
+)
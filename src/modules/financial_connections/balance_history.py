@@ -0,0 +1,71 @@
+"""
+This module reconstructs daily account balances from a current balance and transactions
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import cast
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+
+def get_current_balance(account):
+    """
+    Gets the current balance of an account as (currency, amount, as_of)
+
+    Returns None if the balance hasn't been refreshed yet.
+    """
+    balance = account.get("balance") or {}
+    current = balance.get("current") or {}
+    as_of = balance.get("as_of")
+    if not current or as_of is None:
+        return None
+    currency, amount = next(iter(current.items()))
+    return currency, int(amount), int(as_of)
+
+
+def reconstruct_daily_balances(
+    current_balance: int, as_of: int, amounts, posted_at, from_day: str
+) -> list[dict]:
+    """
+    Works backward from a balance to the closing balance of every UTC day
+
+    Args:
+        current_balance (int): The balance in cents at as_of
+        as_of (int): The unix timestamp the balance was taken at
+        amounts (np.ndarray): Amounts in cents of the account's posted transactions
+        posted_at (np.ndarray): When each transaction posted, as unix timestamps
+        from_day (str): The first day key (YYYY-MM-DD) of the series
+
+    Returns a list of {"day", "balance"} from from_day through the day of as_of. A day's
+    closing balance is the current balance minus everything that posted after it, so
+    the net amount of each day is summed with one bincount and turned into the amounts
+    posted after each day with one reversed cumulative sum.
+    """
+    start = datetime.strptime(from_day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    first = int(start.timestamp())
+    last = as_of - as_of % SECONDS_PER_DAY
+    if last < first:
+        return []
+    n_days = (last - first) // SECONDS_PER_DAY + 1
+
+    posted_at = np.asarray(posted_at, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.int64)
+    # Only transactions posted after the first day closes, up to as_of, move a balance
+    affecting = (posted_at >= first + SECONDS_PER_DAY) & (posted_at <= as_of)
+    days = (posted_at[affecting] - first) // SECONDS_PER_DAY
+    net = np.bincount(days, weights=amounts[affecting], minlength=n_days)
+
+    # posted_after[d] = sum of net[d + 1:]
+    posted_after = np.zeros(n_days, dtype=np.int64)
+    posted_after[:-1] = np.rint(np.cumsum(net[::-1])[::-1][1:]).astype(np.int64)
+    balances = cast(list[int], (current_balance - posted_after).tolist())
+
+    return [
+        {
+            "day": (start + timedelta(days=i)).strftime("%Y-%m-%d"),
+            "balance": balance,
+        }
+        for i, balance in enumerate(balances)
+    ]
@@ -0,0 +1,233 @@
+"""
+This module contains the per account, per day rollups of transaction amounts
+"""
+
+import time
+from typing import Optional
+
+from boto3.dynamodb.conditions import Key
+
+from src.utils import next_day_key, previous_day_key, to_day_key
+
+# Sort key of the row recording which days an account's rollups are complete for.
+# "_" sorts after every YYYY-MM-DD key, so it is read along with the day rows.
+COVERAGE_DAY = "_coverage"
+# Seconds an account's rollups are served from memory before DDB is read again, since
+# other containers write to the same rows
+ROLLUP_CACHE_TTL = 60
+
+
+def aggregate_transactions(transactions, first_days: dict[str, str]):
+    """
+    Groups transactions into (debits, credits, count) per account and day
+
+    Only the accounts in first_days are counted, from their first day onward.
+    """
+    computed: dict[str, dict[str, list[int]]] = {}
+    for txn in transactions:
+        account_id = txn.get("account")
+        first_day = first_days.get(account_id)
+        transacted_at = txn.get("transacted_at")
+        if first_day is None or transacted_at is None:
+            continue
+
+        day = to_day_key(transacted_at)
+        if day < first_day:
+            continue
+
+        totals = computed.setdefault(account_id, {}).setdefault(day, [0, 0, 0])
+        amount = int(txn.get("amount", 0))
+        if amount < 0:
+            totals[0] += -amount
+        else:
+            totals[1] += amount
+        totals[2] += 1
+
+    return {
+        account_id: {day: tuple(totals) for day, totals in days.items()}
+        for account_id, days in computed.items()
+    }
+
+
+class DailyRollupStore:
+    """
+    Stores the sum of debits, sum of credits and count of transactions for every
+    account and UTC day, backed by DynamoDB (account_id hash key, day range key).
+
+    Rollups are kept up to date from the transactions fetched by get_transaction_data,
+    so range summaries can be answered in O(days) instead of O(transactions). Coverage
+    only ever runs through yesterday, since the current day is still changing.
+    """
+
+    def __init__(self, db):
+        self.__db = db
+        # account_id -> day -> (debits, credits, count), for the covered days only
+        self.__days: dict[str, dict[str, tuple[int, int, int]]] = {}
+        # account_id -> (from_day, to_day) that the rollups are complete for
+        self.__coverage: dict[str, Optional[tuple[str, str]]] = {}
+        # account_id -> when its rollups were last read from DDB
+        self.__loaded_at: dict[str, float] = {}
+
+    def ingest(self, windows: dict[str, int], transactions, today: str):
+        """
+        Folds freshly fetched transactions into the rollups
+
+        Args:
+            windows (dict): Maps each fetched account ID to the timestamp its fetch
+                started at. Only the whole days after that timestamp are trusted.
+            transactions (list): The cleaned transactions of those accounts
+            today (str): The current UTC day key
+
+        Days are compared against the rollups in memory, read from DDB at most every
+        ROLLUP_CACHE_TTL seconds, and only the ones whose totals changed are written, so
+        re-ingesting the same data costs no DDB calls and a pending transaction that posts
+        only rewrites its own day. Today is written too, but the rollups are only marked
+        complete through yesterday. Before a window that doesn't extend the coverage
+        replaces it, the rollups are read again so fresher rows aren't deleted.
+        """
+        first_days = {
+            account_id: next_day_key(to_day_key(since))
+            for account_id, since in windows.items()
+        }
+        computed = aggregate_transactions(transactions, first_days)
+        yesterday = previous_day_key(today)
+
+        with self.__db.batch_writer(overwrite_by_pkeys=["account_id", "day"]) as batch:
+            for account_id, first_day in first_days.items():
+                if first_day > today:
+                    continue
+
+                self.__load(account_id)
+                if not self.__extends_coverage(account_id, first_day):
+                    self.__load(account_id, max_age=0)
+                existing = self.__days[account_id]
+                fresh = computed.get(account_id, {})
+
+                for day, totals in fresh.items():
+                    if existing.get(day) != totals:
+                        batch.put_item(Item=self.__to_item(account_id, day, totals))
+                for day in [d for d in existing if d >= first_day and d not in fresh]:
+                    batch.delete_item(Key={"account_id": account_id, "day": day})
+                    del existing[day]
+                existing.update(fresh)
+
+                coverage = self.__coverage[account_id]
+                from_day = first_day
+                if coverage and self.__extends_coverage(account_id, first_day):
+                    from_day = coverage[0]
+                else:
+                    # The new window doesn't touch the old one, only keep the new days
+                    for day in [d for d in existing if d < first_day]:
+                        batch.delete_item(Key={"account_id": account_id, "day": day})
+                        del existing[day]
+
+                if from_day <= yesterday and coverage != (from_day, yesterday):
+                    batch.put_item(
+                        Item={
+                            "account_id": account_id,
+                            "day": COVERAGE_DAY,
+                            "from_day": from_day,
+                            "to_day": yesterday,
+                        }
+                    )
+                    self.__coverage[account_id] = (from_day, yesterday)
+
+    def __extends_coverage(self, account_id: str, first_day: str) -> bool:
+        """Checks if a window starting on first_day continues an account's coverage"""
+        coverage = self.__coverage[account_id]
+        return coverage is not None and coverage[0] <= first_day <= next_day_key(
+            coverage[1]
+        )
+
+    def is_covered(self, account_id: str, from_day: str, to_day: str) -> bool:
+        """Checks if the rollups of an account are complete from from_day to to_day"""
+        self.__load(account_id)
+        coverage = self.__coverage[account_id]
+        return (
+            coverage is not None and coverage[0] <= from_day and coverage[1] >= to_day
+        )
+
+    def summarize(self, account_id: str, from_day: str, to_day: str):
+        """Sums an account's rollups from from_day to to_day, both inclusive"""
+        self.__load(account_id)
+        debits, credits, count = 0, 0, 0
+        for day, totals in self.__days[account_id].items():
+            if from_day <= day <= to_day:
+                debits += totals[0]
+                credits += totals[1]
+                count += totals[2]
+
+        return {"debits": debits, "credits": credits, "count": count}
+
+    def clear(self, account_id: str):
+        """Deletes all rollups of an account, used before rebuilding them"""
+        response = self.__db.query(
+            KeyConditionExpression=Key("account_id").eq(account_id),
+            ProjectionExpression="account_id, #day",
+            ExpressionAttributeNames={"#day": "day"},
+        )
+        keys = response.get("Items", [])
+        while "LastEvaluatedKey" in response:
+            response = self.__db.query(
+                KeyConditionExpression=Key("account_id").eq(account_id),
+                ProjectionExpression="account_id, #day",
+                ExpressionAttributeNames={"#day": "day"},
+                ExclusiveStartKey=response["LastEvaluatedKey"],
+            )
+            keys.extend(response.get("Items", []))
+
+        with self.__db.batch_writer(overwrite_by_pkeys=["account_id", "day"]) as batch:
+            for key in keys:
+                batch.delete_item(
+                    Key={"account_id": key["account_id"], "day": key["day"]}
+                )
+
+        self.__days[account_id] = {}
+        self.__coverage[account_id] = None
+        self.__loaded_at[account_id] = time.monotonic()
+
+    def __load(self, account_id: str, max_age: float = ROLLUP_CACHE_TTL):
+        """
+        Reads an account's rollups and coverage from DDB, unless they were read in the
+        last max_age seconds
+        """
+        loaded_at = self.__loaded_at.get(account_id)
+        if loaded_at is not None and time.monotonic() - loaded_at < max_age:
+            return
+
+        condition = Key("account_id").eq(account_id)
+        response = self.__db.query(KeyConditionExpression=condition)
+        items = response.get("Items", [])
+        while "LastEvaluatedKey" in response:
+            response = self.__db.query(
+                KeyConditionExpression=condition,
+                ExclusiveStartKey=response["LastEvaluatedKey"],
+            )
+            items.extend(response.get("Items", []))
+
+        days = {}
+        coverage = None
+        for item in items:
+            if item["day"] == COVERAGE_DAY:
+                coverage = (item["from_day"], item["to_day"])
+            else:
+                days[item["day"]] = (
+                    int(item["debits"]),
+                    int(item["credits"]),
+                    int(item["count"]),
+                )
+
+        self.__days[account_id] = days
+        self.__coverage[account_id] = coverage
+        self.__loaded_at[account_id] = time.monotonic()
+
+    def __to_item(self, account_id: str, day: str, totals):
+        """Builds the DDB item for a day's rollup"""
+        debits, credits, count = totals
+        return {
+            "account_id": account_id,
+            "day": day,
+            "debits": debits,
+            "credits": credits,
+            "count": count,
+        }
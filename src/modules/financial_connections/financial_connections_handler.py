@@ -1,11 +1,19 @@
 """This module contains the handler for all Financial Connections functionality"""
 
 import re
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, EmailStr
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
 
-from src.utils import TransactionData, TransactionRange
+from src.modules.financial_connections.transaction_export import iter_csv
+from src.utils import TransactionData, TransactionRange, build_json_response
+
+MAX_BATCH_IDS = 100
+CUSTOMER_ID_PATTERN = re.compile(r"cus_[a-zA-Z0-9]{12,}")
+ACCOUNT_ID_PATTERN = re.compile(r"fca_[a-zA-Z0-9]{24}")
+TRANSACTION_ID_PATTERN = re.compile(r"fctxn_[a-zA-Z0-9]+")
 
 
 class CustomerAuthRequest(BaseModel):
@@ -14,6 +22,12 @@ class CustomerAuthRequest(BaseModel):
     email: EmailStr
 
 
+class BatchLookupRequest(BaseModel):
+    """Request format for looking up several IDs at once"""
+
+    ids: list[str] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
+
 class FinancialConnectionsHandler:
     """This class is responsible for handling financial connections requests"""
 
@@ -34,22 +48,38 @@ class FinancialConnectionsHandler:
         self.router.get("/accounts/{account_id}")(self.get_account_by_id)
         self.router.get("/accounts/{account_id}/transactions")(self.get_transactions)
         self.router.post("/accounts")(self.handle_auth_flow)
+        self.router.post("/accounts/batch")(self.get_accounts_batch)
         self.router.delete("/accounts/{account_id}")(self.disconnect_account)
 
         # Transactions routes
         # self.router.get("/transactions/customer/{customer_id}")(
         #     self.get_customer_transactions
         # )
+        self.router.get("/transactions/search")(self.search_transactions)
+        self.router.get("/transactions/export")(self.export_transactions)
+        self.router.get("/transactions/recurring")(self.get_recurring_payments)
         self.router.get("/transactions/{transaction_id}")(self.get_transaction)
+        self.router.post("/transactions/batch")(self.get_transactions_batch)
         self.router.post("/transactions/data")(self.get_transaction_data)
+        self.router.post("/transactions/summary")(self.get_transaction_summary)
+
+        # Balances routes
+        self.router.post("/balances/history")(self.get_balance_history)
+
+        # Rollups routes
+        self.router.post("/rollups/{customer_id}/rebuild")(self.rebuild_rollups)
 
     def __validate_customer_id(self, customer_id: str) -> bool:
         """Validates the customer ID format"""
-        return bool(re.fullmatch(r"cus_[a-zA-Z0-9]{12,}", customer_id))
+        return bool(CUSTOMER_ID_PATTERN.fullmatch(customer_id))
 
     def __validate_account_id(self, account_id: str) -> bool:
         """Validates the account ID format"""
-        return bool(re.fullmatch(r"fca_[a-zA-Z0-9]{24}", account_id))
+        return bool(ACCOUNT_ID_PATTERN.fullmatch(account_id))
+
+    def __validate_transaction_id(self, transaction_id: str) -> bool:
+        """Validates the transaction ID format"""
+        return bool(TRANSACTION_ID_PATTERN.fullmatch(transaction_id))
 
     async def get_accounts_by_customer(self, customer_id: str):
         """Get accounts for a specific customer"""
@@ -89,6 +119,27 @@ class FinancialConnectionsHandler:
                 status_code=404, detail=f"Account not found: {account_id}\n\nError: {e}"
             ) from e
 
+    async def get_accounts_batch(self, body: BatchLookupRequest):
+        """Get up to MAX_BATCH_IDS accounts by ID, with an error for each one not found"""
+        invalid = [
+            account_id
+            for account_id in body.ids
+            if not self.__validate_account_id(account_id)
+        ]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid account ID format: {', '.join(invalid)}",
+            )
+
+        try:
+            results, errors = self.__financial_connections_service.get_accounts_by_ids(
+                body.ids
+            )
+            return {"results": results, "errors": errors}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
     async def get_transaction(self, transaction_id: str):
         """Gets a transaction by its ID"""
         try:
@@ -101,6 +152,27 @@ class FinancialConnectionsHandler:
                 detail=f"Transaction not found: {transaction_id}\n\nError: {e}",
             ) from e
 
+    async def get_transactions_batch(self, body: BatchLookupRequest):
+        """Get up to MAX_BATCH_IDS transactions by ID, with an error for each one not found"""
+        invalid = [
+            transaction_id
+            for transaction_id in body.ids
+            if not self.__validate_transaction_id(transaction_id)
+        ]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid transaction ID format: {', '.join(invalid)}",
+            )
+
+        try:
+            results, errors = (
+                self.__financial_connections_service.get_transactions_by_ids(body.ids)
+            )
+            return {"results": results, "errors": errors}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
     async def get_transactions(self, account_id: str):
         """Get transactions for a specific account"""
         if not self.__validate_account_id(account_id):
@@ -123,15 +195,134 @@ class FinancialConnectionsHandler:
 
             tx_range = body.get("range", TransactionRange.WEEK)
 
-            return self.__financial_connections_service.get_transaction_data(
+            transactions = self.__financial_connections_service.get_transaction_data(
                 customer_id=customer_id, tx_range=tx_range
             )
+            return build_json_response(transactions)
         except Exception as e:
             raise HTTPException(
                 status_code=404,
                 detail=f"Error retrieving transaction data\n\nError: {e}",
             ) from e
 
+    async def search_transactions(
+        self,
+        customer_id: str,
+        q: str = "",
+        min_amount: Optional[int] = None,
+        max_amount: Optional[int] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        limit: int = Query(50, ge=1, le=500),
+    ):
+        """Search transactions by description prefix, amount range (cents) and date"""
+        if not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            transactions = self.__financial_connections_service.search_transactions(
+                customer_id=customer_id,
+                query=q,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                start=start,
+                end=end,
+                limit=limit,
+            )
+            return build_json_response(transactions)
+        except Exception as e:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error searching transactions\n\nError: {e}",
+            ) from e
+
+    async def export_transactions(
+        self,
+        customer_id: str,
+        tx_range: TransactionRange = Query(TransactionRange.SIX_MONTH, alias="range"),
+    ):
+        """Stream a customer's transactions as a CSV file"""
+        if not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            transactions = self.__financial_connections_service.stream_transaction_data(
+                customer_id=customer_id, tx_range=tx_range
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error exporting transactions\n\nError: {e}",
+            ) from e
+
+        filename = f"transactions-{customer_id}-{tx_range.value}.csv"
+        return StreamingResponse(
+            iter_csv(transactions),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    async def get_recurring_payments(self, customer_id: str):
+        """Get the subscriptions and other recurring payments of a customer"""
+        if not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            return self.__financial_connections_service.get_recurring_payments(
+                customer_id
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error retrieving recurring payments\n\nError: {e}",
+            ) from e
+
+    async def get_transaction_summary(self, body: TransactionData):
+        """Get per account debit and credit totals for a range"""
+        customer_id = body.get("customer_id", None)
+        if not customer_id or not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            tx_range = body.get("range", TransactionRange.WEEK)
+
+            return self.__financial_connections_service.get_transaction_summary(
+                customer_id=customer_id, tx_range=tx_range
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error retrieving transaction summary\n\nError: {e}",
+            ) from e
+
+    async def get_balance_history(self, body: TransactionData):
+        """Get the daily closing balance of each account for a range"""
+        customer_id = body.get("customer_id", None)
+        if not customer_id or not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            tx_range = body.get("range", TransactionRange.MONTH)
+
+            return self.__financial_connections_service.get_balance_history(
+                customer_id=customer_id, tx_range=tx_range
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error retrieving balance history\n\nError: {e}",
+            ) from e
+
+    async def rebuild_rollups(self, customer_id: str):
+        """Rebuild the daily rollups for a customer, used for backfills"""
+        if not self.__validate_customer_id(customer_id):
+            raise HTTPException(status_code=400, detail="Invalid customer ID format")
+
+        try:
+            return self.__financial_connections_service.rebuild_rollups(customer_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
     async def handle_auth_flow(self, body: CustomerAuthRequest):
         """Handle customer authentication flow"""
         try:
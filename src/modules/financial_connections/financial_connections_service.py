@@ -2,17 +2,105 @@
 This module contains all logic needed for interacting with the Stripe Financial Connections API
 """
 
-from datetime import datetime, timedelta, timezone
-
-from src.utils import TransactionRange
+import hashlib
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from src.modules.financial_connections.balance_history import (
+    SECONDS_PER_DAY,
+    get_current_balance,
+    reconstruct_daily_balances,
+)
+from src.modules.financial_connections.daily_rollups import (
+    DailyRollupStore,
+    aggregate_transactions,
+)
+from src.modules.financial_connections.recurring_payments import (
+    RecurringPaymentDetector,
+)
+from src.modules.financial_connections.transaction_index import TransactionIndex
+from src.modules.financial_connections.transaction_records import (
+    AccountMetadata,
+    TransactionRecord,
+)
+from src.modules.financial_connections.transaction_snapshots import (
+    NULL_INT,
+    TransactionSnapshotStore,
+    get_snapshot_version,
+)
+from src.utils import (
+    RANGE_DAYS,
+    TransactionRange,
+    get_range_start,
+    next_day_key,
+    previous_day_key,
+    to_day_key,
+)
+
+# Seconds a customer lookup is served from cache. A "no customer for this email" result
+# expires sooner, in case another container creates the customer.
+CUSTOMER_CACHE_TTL = 900
+NEGATIVE_CUSTOMER_CACHE_TTL = 60
+MAX_CACHED_CUSTOMERS = 1000
+MAX_TRANSACTIONS_PER_ACCOUNT = 5000
+# Most transactions a streamed export holds, newest first
+MAX_EXPORT_TRANSACTIONS = 100000
+# Search indexes older than this are topped up with the last week of transactions
+SEARCH_INDEX_TTL = 900
+MAX_SEARCH_INDEXES = 50
+MAX_BALANCE_HISTORIES = 50
+# Days a transaction can take to post, read before a balance history range starts
+POSTING_LAG_DAYS = 10
+# Recurring payment detectors older than this are topped up with the last week
+RECURRING_PAYMENTS_TTL = 900
+MAX_RECURRING_DETECTORS = 50
+# Seconds a looked up account or posted transaction is served from the lookup caches
+ACCOUNT_CACHE_TTL = 60
+TRANSACTION_CACHE_TTL = 900
+MAX_CACHED_LOOKUPS = 1000
+MAX_LOOKUP_CONCURRENCY = 8
+# Deposits into a Wealthfront Cash Account show up with this in their description
+WEALTHFRONT_DEPOSIT_DESCRIPTION = "Wealthfront EDI PYMNTS"
 
 
 class FinancialConnectionsService:
     """This class contains all logic for interacting with Stripe Financial Connections"""
 
-    def __init__(self, db, stripe):
+    def __init__(
+        self,
+        db,
+        stripe,
+        rollups: DailyRollupStore,
+        snapshots: TransactionSnapshotStore,
+    ):
         self.__db = db
         self.__stripe = stripe
+        self.__rollups = rollups
+        self.__snapshots = snapshots
+        # email -> (expires_at, customer item), least recently used first. Empty items
+        # are negative entries.
+        self.__customer_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # customer_id -> search index, least recently used first
+        self.__search_indexes: OrderedDict[str, TransactionIndex] = OrderedDict()
+        # customer_id -> (cache key, balance history), least recently used first
+        self.__balance_histories: OrderedDict[str, tuple[tuple, list]] = OrderedDict()
+        # customer_id -> recurring payment detector, least recently used first
+        self.__recurring_detectors: OrderedDict[str, RecurringPaymentDetector] = (
+            OrderedDict()
+        )
+        # id -> (expires_at, account or transaction), least recently used first
+        self.__account_cache: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.__transaction_cache: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        # Shared by batch lookups, so warm invocations reuse its threads
+        self.__lookup_pool = ThreadPoolExecutor(max_workers=MAX_LOOKUP_CONCURRENCY)
 
     def handle_auth_flow(self, body):
         """Handles the auth flow for integrating with Stripe"""
@@ -54,6 +142,9 @@ class FinancialConnectionsService:
 
         for account in data:
             self.__update_account(account=account)
+            self.__cache_lookup(
+                self.__account_cache, account.id, account, ACCOUNT_CACHE_TTL
+            )
 
         return data
 
@@ -63,38 +154,81 @@ class FinancialConnectionsService:
 
         return account
 
+    def get_accounts_by_ids(self, account_ids: list[str]):
+        """
+        Gets several accounts by their IDs
+
+        Returns (results, errors), both keyed by account ID. Accounts listed or looked up
+        in the last ACCOUNT_CACHE_TTL seconds are served from cache, the rest are
+        retrieved from Stripe concurrently.
+        """
+        return self.__lookup_batch(
+            ids=account_ids,
+            cache=self.__account_cache,
+            retrieve=self.__stripe.financial_connections.Account.retrieve,
+            ttl=ACCOUNT_CACHE_TTL,
+            is_cacheable=lambda account: True,
+        )
+
     def get_customer_by_email(self, email: str):
-        """Gets a customer record from DDB from the user's email"""
+        """
+        Gets a customer record from DDB from the user's email
+
+        Results are cached in process for the MAX_CACHED_CUSTOMERS most recent emails.
+        Hits are kept for CUSTOMER_CACHE_TTL seconds, while misses expire after
+        NEGATIVE_CUSTOMER_CACHE_TTL seconds in case another container creates the customer.
+        """
+        cached = self.__customer_cache.get(email)
+        if cached is not None and cached[0] > time.monotonic():
+            self.__customer_cache.move_to_end(email)
+            return cached[1]
+
         res = self.__db.get_item(Key={"email": email})
 
         item = res.get("Item", {})
+        self.__cache_customer(email, item)
         return item
 
+    def __cache_customer(self, email: str, item: dict):
+        """Stores a customer lookup result in the in-process cache"""
+        ttl = CUSTOMER_CACHE_TTL if item else NEGATIVE_CUSTOMER_CACHE_TTL
+        self.__cache_lookup(
+            self.__customer_cache, email, item, ttl, max_items=MAX_CACHED_CUSTOMERS
+        )
+
     def get_transactions(
         self, account_id: str, tx_range: TransactionRange = TransactionRange.SIX_MONTH
     ):
         """Gets transactions for an account given its id"""
-        filter_params = {}
-        has_more = True
         all_transactions: list[dict] = []
-        start_after_id = None
+        for page in self.get_transaction_pages(
+            account_id=account_id, tx_range=tx_range
+        ):
+            all_transactions.extend(page)
 
-        now = datetime.now(timezone.utc)
-        start_date = now
+        return all_transactions
 
-        if tx_range == TransactionRange.WEEK:
-            start_date = now - timedelta(days=7)
-        elif tx_range == TransactionRange.MONTH:
-            start_date = now - timedelta(days=30)
-        elif tx_range == TransactionRange.THREE_MONTH:
-            start_date = now - timedelta(days=90)
-        elif tx_range == TransactionRange.SIX_MONTH:
-            start_date = now - timedelta(days=180)
+    def get_transaction_pages(
+        self,
+        account_id: str,
+        tx_range: TransactionRange = TransactionRange.SIX_MONTH,
+        max_transactions: Optional[int] = MAX_TRANSACTIONS_PER_ACCOUNT,
+    ):
+        """
+        Yields the transactions of an account one page at a time, newest first
 
-        start_timestamp = int(start_date.timestamp())
+        Pages are only requested from Stripe as the generator is consumed. Stops once
+        max_transactions have been fetched, pass None to fetch the whole range.
+        """
+        filter_params = {}
+        has_more = True
+        fetched = 0
+        start_after_id = None
+
+        start_timestamp = int(get_range_start(tx_range).timestamp())
         filter_params = {"transacted_at": {"gte": start_timestamp}}
 
-        while has_more and len(all_transactions) < 5000:
+        while has_more and (max_transactions is None or fetched < max_transactions):
             transactions = self.__stripe.financial_connections.Transaction.list(
                 account=account_id,
                 limit=100,
@@ -108,12 +242,8 @@ class FinancialConnectionsService:
             if len(data) > 0 and has_more:
                 start_after_id = data[-1]["id"]
 
-            all_transactions.extend(data)
-
-            if not has_more:
-                break
-
-        return all_transactions
+            fetched += len(data)
+            yield data
 
     def get_transaction_by_id(self, txn_id: str):
         """Gets an transaction by its ID"""
@@ -121,28 +251,122 @@ class FinancialConnectionsService:
 
         return transaction
 
-    def get_transaction_data(self, customer_id: str, tx_range: TransactionRange):
-        """Gets transaction data about an account"""
+    def get_transactions_by_ids(self, txn_ids: list[str]):
+        """
+        Gets several transactions by their IDs
+
+        Returns (results, errors), both keyed by transaction ID. Posted transactions
+        don't change, so they are cached for TRANSACTION_CACHE_TTL seconds, while pending
+        ones are always retrieved again. Retrievals run concurrently.
+        """
+        return self.__lookup_batch(
+            ids=txn_ids,
+            cache=self.__transaction_cache,
+            retrieve=self.__stripe.financial_connections.Transaction.retrieve,
+            ttl=TRANSACTION_CACHE_TTL,
+            is_cacheable=lambda txn: txn.get("status") == "posted",
+        )
+
+    def __lookup_batch(self, ids, cache, retrieve, ttl: float, is_cacheable):
+        """
+        Looks up IDs in a cache, retrieving the misses with at most
+        MAX_LOOKUP_CONCURRENCY calls in flight
+
+        Returns (results, errors) keyed by ID, results in the order the IDs were given.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        now = time.monotonic()
+        found, errors = {}, {}
+        missing = []
+        for item_id in unique_ids:
+            cached = cache.get(item_id)
+            if cached is not None and cached[0] > now:
+                cache.move_to_end(item_id)
+                found[item_id] = cached[1]
+            else:
+                missing.append(item_id)
+
+        futures = {
+            item_id: self.__lookup_pool.submit(retrieve, item_id) for item_id in missing
+        }
+        for item_id, future in futures.items():
+            try:
+                item = future.result()
+            except Exception as e:
+                errors[item_id] = str(e)
+                continue
+            found[item_id] = item
+            if is_cacheable(item):
+                self.__cache_lookup(cache, item_id, item, ttl)
+
+        results = {
+            item_id: found[item_id] for item_id in unique_ids if item_id in found
+        }
+        return results, errors
+
+    def __cache_lookup(
+        self,
+        cache,
+        item_id: str,
+        item,
+        ttl: float,
+        max_items: int = MAX_CACHED_LOOKUPS,
+    ):
+        """Stores a looked up item, evicting the least recently used past max_items"""
+        cache[item_id] = (time.monotonic() + ttl, item)
+        cache.move_to_end(item_id)
+        if len(cache) > max_items:
+            cache.popitem(last=False)
+
+    def get_transaction_data(
+        self, customer_id: str, tx_range: TransactionRange, use_snapshot: bool = True
+    ):
+        """
+        Gets transaction data about an account
+
+        Transactions are returned as TransactionRecords, which serialize as plain dicts.
+        If the customer's snapshot is at the current version of their accounts and
+        covers the range, the transactions are read from it instead of from Stripe.
+        """
         accounts = self.get_accounts(customer_id=customer_id)
+        start_timestamp = int(get_range_start(tx_range).timestamp())
+        version = get_snapshot_version(accounts)
+
+        if use_snapshot:
+            snapshot = self.__snapshots.load(customer_id, version)
+            account_ids = [account.id for account in accounts]
+            if snapshot is not None and snapshot.covers(account_ids, start_timestamp):
+                transactions = snapshot.records(start=start_timestamp)
+                snapshot_windows = {
+                    account_id: start_timestamp for account_id in account_ids
+                }
+                self.__update_customer_indexes(
+                    customer_id, transactions, snapshot_windows
+                )
+                return transactions
 
-        all_transactions = []
+        all_transactions: list[TransactionRecord] = []
+        # account_id -> timestamp from which the fetched transactions are complete
+        windows: dict[str, int] = {}
         for account in accounts:
             try:
                 account_transactions = self.get_transactions(
                     account_id=account.id, tx_range=tx_range
                 )
 
-                txn_with_inst = [
-                    {
-                        **txn,
-                        "institution_name": account.get("institution_name", None),
-                        "acct_display_name": account.get("display_name", None),
-                        "acct_last4": account.get("last4", None),
-                    }
-                    for txn in account_transactions
-                ]
+                meta = AccountMetadata(account)
+                all_transactions.extend(
+                    TransactionRecord(txn, meta) for txn in account_transactions
+                )
 
-                all_transactions.extend(txn_with_inst)
+                windows[account.id] = start_timestamp
+                if len(account_transactions) >= MAX_TRANSACTIONS_PER_ACCOUNT:
+                    windows[account.id] = max(
+                        start_timestamp,
+                        min(
+                            txn.get("transacted_at", 0) for txn in account_transactions
+                        ),
+                    )
             except Exception as e:
                 print(e)
 
@@ -153,18 +377,457 @@ class FinancialConnectionsService:
             key=lambda x: x.get("transacted_at", 0), reverse=True
         )
 
+        self.__update_customer_indexes(customer_id, corrected_transactions, windows)
+
+        try:
+            self.__rollups.ingest(
+                windows=windows,
+                transactions=corrected_transactions,
+                today=to_day_key(int(time.time())),
+            )
+        except Exception as e:
+            print(e)
+
+        try:
+            self.__snapshots.save(
+                customer_id=customer_id,
+                version=version,
+                windows=windows,
+                transactions=corrected_transactions,
+            )
+        except Exception as e:
+            print(e)
+        self.__balance_histories.pop(customer_id, None)
+
         return corrected_transactions
 
+    def __update_customer_indexes(self, customer_id: str, transactions, windows):
+        """Updates the customer's search index and recurring payments, if they're kept"""
+        index = self.__search_indexes.get(customer_id)
+        if index is not None:
+            index.update(transactions=transactions, windows=windows)
+
+        detector = self.__recurring_detectors.get(customer_id)
+        if detector is not None:
+            detector.update(transactions=transactions, windows=windows)
+
+    def get_transaction_snapshot(self, customer_id: str, tx_range: TransactionRange):
+        """
+        Gets the customer's columnar transaction snapshot, for analytics over a range
+
+        The snapshot is refreshed first if it is out of date or doesn't cover the range.
+        Returns None if it couldn't be stored.
+        """
+        accounts = self.get_accounts(customer_id=customer_id)
+        return self.__load_snapshot(customer_id, accounts, tx_range)[0]
+
+    def __load_snapshot(self, customer_id: str, accounts, tx_range: TransactionRange):
+        """
+        Loads the snapshot of the given accounts, refreshing it if needed
+
+        Returns (snapshot, transactions), with the transactions fetched for the refresh
+        or None if the stored snapshot was used.
+        """
+        start_timestamp = int(get_range_start(tx_range).timestamp())
+        version = get_snapshot_version(accounts)
+
+        snapshot = self.__snapshots.load(customer_id, version)
+        account_ids = [account.id for account in accounts]
+        if snapshot is not None and snapshot.covers(account_ids, start_timestamp):
+            return snapshot, None
+
+        transactions = self.get_transaction_data(
+            customer_id=customer_id, tx_range=tx_range, use_snapshot=False
+        )
+        return self.__snapshots.load(customer_id, version), transactions
+
+    def __get_posting_range(self, tx_range: TransactionRange) -> TransactionRange:
+        """Gets the shortest range that also covers transactions posted into tx_range late"""
+        needed = RANGE_DAYS.get(tx_range, 0) + POSTING_LAG_DAYS
+        for candidate, days in sorted(RANGE_DAYS.items(), key=lambda item: item[1]):
+            if days >= needed:
+                return candidate
+        return max(RANGE_DAYS, key=lambda candidate: RANGE_DAYS[candidate])
+
+    def __get_posted_columns(self, snapshot, transactions) -> dict:
+        """
+        Gets the amounts and posting times of posted transactions, per account
+
+        Read from the snapshot's columns, or from the fetched transactions if no
+        snapshot could be stored. Transactions without a posting time use transacted_at.
+        """
+        columns = {}
+        if snapshot is not None:
+            posted_code = snapshot.get_codes("status").get("posted")
+            account_column = snapshot.column("account")
+            amount_column = snapshot.column("amount")
+            posted_column = snapshot.column("posted_at")
+            posted_column = np.where(
+                posted_column == NULL_INT,
+                snapshot.column("transacted_at"),
+                posted_column,
+            )
+            is_posted = snapshot.column("status") == posted_code
+            for account_id, code in snapshot.get_codes("account").items():
+                mask = is_posted & (account_column == code)
+                columns[account_id] = (amount_column[mask], posted_column[mask])
+            return columns
+
+        rows: dict[str, tuple[list, list]] = {}
+        for txn in transactions or []:
+            if txn.get("status") != "posted":
+                continue
+            posted_at = (txn.get("status_transitions") or {}).get("posted_at")
+            amounts, posted = rows.setdefault(txn.get("account", ""), ([], []))
+            amounts.append(txn.get("amount", 0))
+            posted.append(posted_at or txn.get("transacted_at", 0))
+        for account_id, (amounts, posted) in rows.items():
+            columns[account_id] = (
+                np.array(amounts, dtype=np.int64),
+                np.array(posted, dtype=np.int64),
+            )
+        return columns
+
+    def get_balance_history(self, customer_id: str, tx_range: TransactionRange):
+        """
+        Gets the closing balance of every day in a range, per account
+
+        Reconstructed backward from each account's current balance with the posted
+        transactions in the customer's snapshot, or fetched ones if it is unavailable.
+        Results are cached until new transactions are ingested or a balance is refreshed.
+        """
+        accounts = self.get_accounts(customer_id=customer_id)
+        balances = {account.id: get_current_balance(account) for account in accounts}
+        cache_key = (tx_range, tuple(sorted(balances.items(), key=str)))
+
+        cached = self.__get_cached(
+            cache=self.__balance_histories,
+            customer_id=customer_id,
+            build=lambda: ((), []),
+            update=lambda cached: (
+                cached
+                if cached[0] == cache_key
+                else (
+                    cache_key,
+                    self.__build_balance_history(
+                        customer_id, accounts, balances, tx_range
+                    ),
+                )
+            ),
+            max_items=MAX_BALANCE_HISTORIES,
+        )
+        return cached[1]
+
+    def __build_balance_history(
+        self, customer_id: str, accounts, balances: dict, tx_range: TransactionRange
+    ) -> list:
+        """Reconstructs the daily balances of a customer's accounts over a range"""
+        # Balances move when a transaction posts, which can be days after it was made.
+        # If no snapshot could be stored, the transactions fetched for it are used.
+        snapshot, transactions = self.__load_snapshot(
+            customer_id, accounts, self.__get_posting_range(tx_range)
+        )
+        columns = self.__get_posted_columns(snapshot, transactions)
+
+        from_day = to_day_key(int(get_range_start(tx_range).timestamp()))
+        empty = np.zeros(0, dtype=np.int64)
+        history = []
+        for account in accounts:
+            balance = balances[account.id]
+            daily_balances = []
+            if balance is not None:
+                amounts, posted_at = columns.get(account.id, (empty, empty))
+                daily_balances = reconstruct_daily_balances(
+                    current_balance=balance[1],
+                    as_of=balance[2],
+                    amounts=amounts,
+                    posted_at=posted_at,
+                    from_day=from_day,
+                )
+
+            history.append(
+                {
+                    "account_id": account.id,
+                    "institution_name": account.get("institution_name", None),
+                    "acct_display_name": account.get("display_name", None),
+                    "acct_last4": account.get("last4", None),
+                    "currency": balance[0] if balance else None,
+                    "as_of": balance[2] if balance else None,
+                    "balances": daily_balances,
+                }
+            )
+
+        return history
+
+    def stream_transaction_data(
+        self,
+        customer_id: str,
+        tx_range: TransactionRange,
+        max_transactions: int = MAX_EXPORT_TRANSACTIONS,
+    ):
+        """
+        Gets a customer's cleaned transactions as an iterator, newest first
+
+        Applies the same corrections and dedupe as get_transaction_data, but pages are
+        only fetched from Stripe as the iterator is consumed. Each page is sorted newest
+        first and the accounts are merged by transacted_at, so only one page per account
+        plus one group of same-time transactions is held in memory. Stops after the
+        newest max_transactions.
+        """
+        accounts = self.get_accounts(customer_id=customer_id)
+        return itertools.islice(
+            self.__stream_cleaned_transactions(accounts=accounts, tx_range=tx_range),
+            max_transactions,
+        )
+
+    def __stream_cleaned_transactions(self, accounts, tx_range: TransactionRange):
+        """Merges, corrects and dedupes the accounts' transaction pages lazily"""
+        wf_acct = self.__find_wealthfront_cash_account(accounts)
+        wf_meta = self.__get_wealthfront_meta(wf_acct) if wf_acct else None
+        merged = heapq.merge(
+            *(
+                self.__stream_account_transactions(account, tx_range)
+                for account in accounts
+            ),
+            key=lambda txn: txn.get("transacted_at", 0),
+            reverse=True,
+        )
+
+        for _, group in itertools.groupby(
+            merged, key=lambda txn: txn.get("transacted_at", 0)
+        ):
+            time_group = list(group)
+            if wf_meta is not None:
+                corrected = [
+                    self.__correct_wealthfront_deposit(txn, wf_meta)
+                    for txn in time_group
+                    if self.__is_wealthfront_deposit(txn)
+                ]
+                time_group.extend(corrected)
+            yield from self.__dedupe_time_group(time_group)
+
+    def __stream_account_transactions(self, account, tx_range: TransactionRange):
+        """
+        Yields the TransactionRecords of an account, fetching pages as needed
+
+        Each page is sorted newest first. If a page has transactions newer than ones
+        already yielded, Stripe didn't list them in order; they are still yielded, out
+        of order, rather than dropped.
+        """
+        meta = AccountMetadata(account)
+        oldest = None
+        try:
+            for page in self.get_transaction_pages(
+                account_id=account.id, tx_range=tx_range, max_transactions=None
+            ):
+                page = sorted(
+                    page, key=lambda txn: txn.get("transacted_at", 0), reverse=True
+                )
+                if not page:
+                    continue
+                if oldest is not None and page[0].get("transacted_at", 0) > oldest:
+                    print(f"Transactions of {account.id} are out of order")
+                for txn in page:
+                    yield TransactionRecord(txn, meta)
+                oldest = page[-1].get("transacted_at", 0)
+        except Exception as e:
+            print(e)
+
+    def search_transactions(
+        self,
+        customer_id: str,
+        query: str = "",
+        min_amount: Optional[int] = None,
+        max_amount: Optional[int] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        limit: int = 50,
+    ):
+        """
+        Searches the last six months of a customer's transactions
+
+        Uses a per customer inverted index kept across warm invocations. It is built with
+        one six month fetch, kept up to date by every get_transaction_data call, and
+        topped up with the last week once it is older than SEARCH_INDEX_TTL seconds.
+        """
+        index = self.__get_cached(
+            cache=self.__search_indexes,
+            customer_id=customer_id,
+            build=TransactionIndex,
+            update=lambda index: self.__refresh_customer_index(
+                customer_id, index, SEARCH_INDEX_TTL
+            ),
+            max_items=MAX_SEARCH_INDEXES,
+        )
+        return index.search(
+            query=query,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            start=start,
+            end=end,
+            limit=limit,
+        )
+
+    def get_recurring_payments(self, customer_id: str):
+        """
+        Gets the recurring payments found in the last six months of transactions
+
+        Uses a per customer detector kept across warm invocations. Like the search index,
+        it is built with one six month fetch, kept up to date by every
+        get_transaction_data call, and topped up with the last week once it is older
+        than RECURRING_PAYMENTS_TTL seconds.
+        """
+        detector = self.__get_cached(
+            cache=self.__recurring_detectors,
+            customer_id=customer_id,
+            build=RecurringPaymentDetector,
+            update=lambda detector: self.__refresh_customer_index(
+                customer_id, detector, RECURRING_PAYMENTS_TTL
+            ),
+            max_items=MAX_RECURRING_DETECTORS,
+        )
+        return detector.get_series()
+
+    def __get_cached(
+        self,
+        cache: OrderedDict,
+        customer_id: str,
+        build: Callable[[], Any],
+        update: Callable[[Any], Any],
+        max_items: int,
+    ):
+        """
+        Gets a customer's entry in a per customer LRU cache kept across warm invocations
+
+        A missing entry is created with build() and stored before update() first runs, so
+        that the fetches it makes keep the entry up to date. update() gets the entry and
+        returns the one to keep. A new entry is dropped again if update() fails.
+        """
+        entry = cache.get(customer_id)
+        is_new = entry is None
+        if is_new:
+            entry = build()
+            cache[customer_id] = entry
+            if len(cache) > max_items:
+                cache.popitem(last=False)
+
+        try:
+            entry = update(entry)
+        except Exception:
+            if is_new:
+                cache.pop(customer_id, None)
+            raise
+
+        cache[customer_id] = entry
+        cache.move_to_end(customer_id)
+        return entry
+
+    def __refresh_customer_index(self, customer_id: str, index, ttl: float):
+        """
+        Fills a new search index or recurring payment detector with six months of
+        transactions, or tops one up with the last week once it is older than ttl seconds
+        """
+        if not index.refreshed_at:
+            self.get_transaction_data(
+                customer_id=customer_id, tx_range=TransactionRange.SIX_MONTH
+            )
+        elif time.monotonic() - index.refreshed_at > ttl:
+            self.get_transaction_data(
+                customer_id=customer_id, tx_range=TransactionRange.WEEK
+            )
+        return index
+
+    def get_transaction_summary(self, customer_id: str, tx_range: TransactionRange):
+        """
+        Gets the debits, credits and count of transactions per account for a range
+
+        Answered from the daily rollups through yesterday, so only O(days) of data is
+        read. Ranges are day aligned: the partial first day of the range is left out.
+        Accounts whose rollups don't cover the range yet are filled in with one full fetch
+        first. The current day is never covered, so it is recomputed from today's rows of
+        the customer's snapshot, which is only refreshed from Stripe if it is out of date.
+        """
+        accounts = self.get_accounts(customer_id=customer_id)
+        from_day = next_day_key(to_day_key(int(get_range_start(tx_range).timestamp())))
+        now = int(time.time())
+        today = to_day_key(now)
+        yesterday = previous_day_key(today)
+
+        if all(
+            self.__rollups.is_covered(account.id, from_day, yesterday)
+            for account in accounts
+        ):
+            snapshot, fetched = self.__load_snapshot(
+                customer_id, accounts, TransactionRange.WEEK
+            )
+            transactions = fetched or []
+            if snapshot is not None:
+                transactions = snapshot.records(start=now - now % SECONDS_PER_DAY)
+        else:
+            transactions = self.get_transaction_data(
+                customer_id=customer_id, tx_range=tx_range, use_snapshot=False
+            )
+        current_day = aggregate_transactions(
+            transactions, {account.id: today for account in accounts}
+        )
+
+        summaries = []
+        for account in accounts:
+            totals = self.__rollups.summarize(account.id, from_day, yesterday)
+            debits, credits, count = current_day.get(account.id, {}).get(
+                today, (0, 0, 0)
+            )
+            totals["debits"] += debits
+            totals["credits"] += credits
+            totals["count"] += count
+            summaries.append(
+                {
+                    "account_id": account.id,
+                    "institution_name": account.get("institution_name", None),
+                    "acct_display_name": account.get("display_name", None),
+                    "acct_last4": account.get("last4", None),
+                    **totals,
+                    "net": totals["credits"] - totals["debits"],
+                }
+            )
+
+        return summaries
+
+    def rebuild_rollups(self, customer_id: str):
+        """Rebuilds the daily rollups of a customer's accounts from scratch"""
+        accounts = self.get_accounts(customer_id=customer_id)
+        for account in accounts:
+            self.__rollups.clear(account.id)
+
+        self.get_transaction_data(
+            customer_id=customer_id,
+            tx_range=TransactionRange.SIX_MONTH,
+            use_snapshot=False,
+        )
+        return {"accounts_rebuilt": [account.id for account in accounts]}
+
     def disconnect_account(self, account_id: str):
         """Disconnects the account with the given account ID from a users profile"""
         res = self.__stripe.financial_connections.Account.disconnect(account_id)
+        self.__account_cache.pop(account_id, None)
 
         data = res.get("data", {})
         return data
 
     def __create_customer(self, email):
-        """Creates a new Stripe customer and inserts data into DynamoDB"""
-        new_customer = self.__stripe.Customer.create(email=email)
+        """
+        Creates a new Stripe customer and inserts data into DynamoDB
+
+        Concurrent auth flows for the same email are collapsed into one customer: the
+        Stripe call uses an idempotency key derived from the email, and the DDB write is
+        conditional so only the first record is kept.
+        """
+        idempotency_key = (
+            "customer-create-" + hashlib.sha256(email.encode("utf-8")).hexdigest()
+        )
+        new_customer = self.__stripe.Customer.create(
+            email=email, idempotency_key=idempotency_key
+        )
 
         timestamp = datetime.now(timezone.utc).isoformat()
 
@@ -174,8 +837,18 @@ class FinancialConnectionsService:
             "timestamp": str(timestamp),
         }
 
-        self.__db.put_item(Item=item)
-
+        try:
+            self.__db.put_item(
+                Item=item, ConditionExpression="attribute_not_exists(email)"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # Another request already stored a customer for this email, use that one
+            res = self.__db.get_item(Key={"email": email}, ConsistentRead=True)
+            item = res.get("Item", item)
+
+        self.__cache_customer(email, item)
         return item
 
     def __subscribe_to_acct(self, account_id: str):
@@ -246,13 +919,7 @@ class FinancialConnectionsService:
 
     def __handle_wealthfront_edge_case(self, accounts, transactions):
         """Handles fixing Transaction data for Wealthfront Cash Accounts e2e"""
-        wealthfront_cash_acct = next(
-            filter(
-                lambda acct: acct.get("institution_name") == "Wealthfront" and acct.get("category") == "cash",
-                accounts,
-            ),
-            None,
-        )
+        wealthfront_cash_acct = self.__find_wealthfront_cash_account(accounts)
         if wealthfront_cash_acct:
             corrected_transactions = self.__build_wealthfront_history(
                 transactions=transactions, wf_acct=wealthfront_cash_acct
@@ -260,30 +927,53 @@ class FinancialConnectionsService:
             return corrected_transactions
         return transactions
 
+    def __find_wealthfront_cash_account(self, accounts):
+        """Finds the customer's Wealthfront Cash Account, if they have one"""
+        return next(
+            filter(
+                lambda acct: acct.get("institution_name") == "Wealthfront" and acct.get("category") == "cash",
+                accounts,
+            ),
+            None,
+        )
+
     def __build_wealthfront_history(self, transactions, wf_acct):
         """Builds wealthfront deposit history, as Wealthfront doesn't provide this"""
         wealthfront_deposits = [
-            txn
-            for txn in transactions
-            if "Wealthfront EDI PYMNTS" in txn.get("description", "")
+            txn for txn in transactions if self.__is_wealthfront_deposit(txn)
         ]
+        wf_meta = self.__get_wealthfront_meta(wf_acct)
         modified_deposits = [
-            {
-                **txn,
-                "account": wf_acct.get("id", None),
-                "institution_name": wf_acct.get("institution_name", "Wealthfront"),
-                "acct_display_name": wf_acct.get(
-                    "display_name", "Individual Cash Account"
-                ),
-                "acct_last4": wf_acct.get("last4", None),
-                "amount": abs(txn.get("amount", 0)),
-                "description": "Wealthfront Cash Account Deposit",
-            }
+            self.__correct_wealthfront_deposit(txn, wf_meta)
             for txn in wealthfront_deposits
         ]
         transactions.extend(modified_deposits)
         return transactions
 
+    def __is_wealthfront_deposit(self, txn) -> bool:
+        """Checks if a transaction is a deposit into the Wealthfront Cash Account"""
+        return WEALTHFRONT_DEPOSIT_DESCRIPTION in (txn.get("description") or "")
+
+    def __get_wealthfront_meta(self, wf_acct) -> AccountMetadata:
+        """Gets the account metadata used for corrected Wealthfront deposits"""
+        return AccountMetadata(
+            wf_acct,
+            default_institution="Wealthfront",
+            default_display_name="Individual Cash Account",
+        )
+
+    def __correct_wealthfront_deposit(self, txn, wf_meta: AccountMetadata):
+        """Copies a deposit into the Wealthfront Cash Account's history"""
+        return TransactionRecord(
+            txn.txn,
+            wf_meta,
+            overrides={
+                "account": wf_meta.account_id,
+                "amount": abs(txn.get("amount", 0)),
+                "description": "Wealthfront Cash Account Deposit",
+            },
+        )
+
     def __dedupe_pending_transactions(self, transactions):
         """Dedupes transactions that have both a pending and posted status"""
         # Group transactions by their transacted_at timestamp
@@ -294,22 +984,22 @@ class FinancialConnectionsService:
                 grouped_by_time[transacted_at] = []
             grouped_by_time[transacted_at].append(txn)
 
-        # For each group, keep posted transactions and remove pending ones if both exist
         deduped_transactions = []
         for time_group in grouped_by_time.values():
-            if len(time_group) > 1:
-                # Check if we have both posted and pending transactions
-                has_posted = any(txn.get("status") == "posted" for txn in time_group)
-                if has_posted:
-                    # Keep only posted transactions
-                    deduped_transactions.extend(
-                        [txn for txn in time_group if txn.get("status") == "posted"]
-                    )
-                else:
-                    # If no posted transactions, keep all
-                    deduped_transactions.extend(time_group)
-            else:
-                # Only one transaction at this time, keep it
-                deduped_transactions.extend(time_group)
+            deduped_transactions.extend(self.__dedupe_time_group(time_group))
 
         return deduped_transactions
+
+    def __dedupe_time_group(self, time_group):
+        """Dedupes a group of transactions that share a transacted_at timestamp"""
+        # Keep posted transactions and remove pending ones if both exist
+        if len(time_group) > 1:
+            # Check if we have both posted and pending transactions
+            has_posted = any(txn.get("status") == "posted" for txn in time_group)
+            if has_posted:
+                # Keep only posted transactions
+                return [txn for txn in time_group if txn.get("status") == "posted"]
+            # If no posted transactions, keep all
+            return time_group
+        # Only one transaction at this time, keep it
+        return time_group
@@ -0,0 +1,199 @@
+"""
+This module maps raw transaction descriptions to a canonical merchant and category
+"""
+
+import re
+from functools import lru_cache
+from typing import Optional
+
+UNCATEGORIZED = "Uncategorized"
+WEALTHFRONT_MERCHANT = "Wealthfront"
+
+# Normalized keyword -> (merchant, category). Keywords are matched as whole words against
+# the normalized description (lowercase, punctuation collapsed to single spaces). Short,
+# common words ("rent", "target") are left out, as they match unrelated descriptions.
+MERCHANT_PATTERNS: dict[str, tuple[str, str]] = {
+    # Savings & Investments
+    "wealthfront edi pymnts": (WEALTHFRONT_MERCHANT, "Savings & Investments"),
+    "wealthfront cash account deposit": (WEALTHFRONT_MERCHANT, "Savings & Investments"),
+    "vanguard": ("Vanguard", "Savings & Investments"),
+    "fidelity": ("Fidelity", "Savings & Investments"),
+    "schwab": ("Charles Schwab", "Savings & Investments"),
+    "robinhood": ("Robinhood", "Savings & Investments"),
+    "betterment": ("Betterment", "Savings & Investments"),
+    "coinbase": ("Coinbase", "Savings & Investments"),
+    # Income
+    "payroll": ("Payroll", "Income"),
+    "direct dep": ("Direct Deposit", "Income"),
+    "direct deposit": ("Direct Deposit", "Income"),
+    "interest payment": ("Interest", "Income"),
+    "interest paid": ("Interest", "Income"),
+    "irs treas": ("IRS", "Income"),
+    # Transfers
+    "zelle": ("Zelle", "Transfers"),
+    "venmo": ("Venmo", "Transfers"),
+    "cash app": ("Cash App", "Transfers"),
+    "paypal": ("PayPal", "Transfers"),
+    "online transfer": ("Transfer", "Transfers"),
+    "transfer from": ("Transfer", "Transfers"),
+    "transfer to": ("Transfer", "Transfers"),
+    "autopay": ("Credit Card Payment", "Transfers"),
+    "credit crd": ("Credit Card Payment", "Transfers"),
+    # Food & Drink
+    "starbucks": ("Starbucks", "Food & Drink"),
+    "dunkin": ("Dunkin'", "Food & Drink"),
+    "mcdonald s": ("McDonald's", "Food & Drink"),
+    "mcdonalds": ("McDonald's", "Food & Drink"),
+    "chipotle": ("Chipotle", "Food & Drink"),
+    "chick fil a": ("Chick-fil-A", "Food & Drink"),
+    "sweetgreen": ("Sweetgreen", "Food & Drink"),
+    "taco bell": ("Taco Bell", "Food & Drink"),
+    "panera": ("Panera Bread", "Food & Drink"),
+    "doordash": ("DoorDash", "Food & Drink"),
+    "grubhub": ("Grubhub", "Food & Drink"),
+    "uber eats": ("Uber Eats", "Food & Drink"),
+    # Groceries
+    "whole foods": ("Whole Foods", "Groceries"),
+    "wholefds": ("Whole Foods", "Groceries"),
+    "trader joe s": ("Trader Joe's", "Groceries"),
+    "safeway": ("Safeway", "Groceries"),
+    "kroger": ("Kroger", "Groceries"),
+    "costco": ("Costco", "Groceries"),
+    "instacart": ("Instacart", "Groceries"),
+    "aldi": ("Aldi", "Groceries"),
+    # Shopping
+    "amazon": ("Amazon", "Shopping"),
+    "amzn": ("Amazon", "Shopping"),
+    "walmart": ("Walmart", "Shopping"),
+    "wal mart": ("Walmart", "Shopping"),
+    "best buy": ("Best Buy", "Shopping"),
+    "apple store": ("Apple", "Shopping"),
+    "ebay": ("eBay", "Shopping"),
+    "etsy": ("Etsy", "Shopping"),
+    # Subscriptions
+    "netflix": ("Netflix", "Subscriptions"),
+    "spotify": ("Spotify", "Subscriptions"),
+    "hulu": ("Hulu", "Subscriptions"),
+    "disney plus": ("Disney+", "Subscriptions"),
+    "hbo max": ("Max", "Subscriptions"),
+    "youtube premium": ("YouTube Premium", "Subscriptions"),
+    "apple com bill": ("Apple", "Subscriptions"),
+    "google storage": ("Google", "Subscriptions"),
+    "openai": ("OpenAI", "Subscriptions"),
+    "adobe": ("Adobe", "Subscriptions"),
+    # Transportation
+    "uber": ("Uber", "Transportation"),
+    "lyft": ("Lyft", "Transportation"),
+    "shell oil": ("Shell", "Transportation"),
+    "chevron": ("Chevron", "Transportation"),
+    "exxonmobil": ("ExxonMobil", "Transportation"),
+    # Travel
+    "airbnb": ("Airbnb", "Travel"),
+    "delta air": ("Delta", "Travel"),
+    "united airlines": ("United Airlines", "Travel"),
+    "southwest": ("Southwest", "Travel"),
+    "american airlines": ("American Airlines", "Travel"),
+    "marriott": ("Marriott", "Travel"),
+    "hilton": ("Hilton", "Travel"),
+    "expedia": ("Expedia", "Travel"),
+    # Utilities
+    "comcast": ("Comcast", "Utilities"),
+    "xfinity": ("Xfinity", "Utilities"),
+    "verizon": ("Verizon", "Utilities"),
+    "t mobile": ("T-Mobile", "Utilities"),
+    "pg e": ("PG&E", "Utilities"),
+    "con ed": ("Con Edison", "Utilities"),
+    # Housing
+    "mortgage": ("Mortgage", "Housing"),
+    # Health
+    "cvs": ("CVS", "Health"),
+    "walgreens": ("Walgreens", "Health"),
+    "equinox": ("Equinox", "Health"),
+    "planet fitness": ("Planet Fitness", "Health"),
+    # Entertainment
+    "steam games": ("Steam", "Entertainment"),
+    "ticketmaster": ("Ticketmaster", "Entertainment"),
+    # Fees
+    "overdraft": ("Overdraft Fee", "Fees"),
+    "service fee": ("Service Fee", "Fees"),
+    "atm fee": ("ATM Fee", "Fees"),
+}
+
+NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+# Noise stripped from unmatched descriptions before they are used as the merchant
+PROCESSOR_PREFIX = re.compile(r"^(?:sq|tst|sp|pp|pos|dd|ach|debit|purchase)\b\s*")
+TRAILING_NOISE = re.compile(r"(?:\s+(?:#?\d[\w-]*|[a-z]{2}))+$")
+
+
+def build_trie_pattern(keywords) -> str:
+    """
+    Builds a regex alternation that shares common prefixes, e.g. ["uber", "uber eats"]
+    becomes "uber(?: eats)?". At any one position, longer keywords are tried before the
+    shorter keywords they start with.
+    """
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def to_pattern(node) -> str:
+        is_end = "" in node
+        branches = [
+            re.escape(char) + to_pattern(child)
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if is_end:
+            return f"(?:{body})?"
+        return body
+
+    return to_pattern(trie)
+
+
+# Zero width, so every position is tried and overlapping keywords are all found
+MERCHANT_MATCHER = re.compile(
+    rf"(?<![a-z0-9])(?=({build_trie_pattern(MERCHANT_PATTERNS)})(?![a-z0-9]))"
+)
+
+
+def normalize_text(description: str) -> str:
+    """Lowercases a description and collapses punctuation into single spaces"""
+    return NON_ALPHANUMERIC.sub(" ", (description or "").lower()).strip()
+
+
+def find_keyword(text: str) -> Optional[str]:
+    """
+    Finds the most specific (longest) keyword anywhere in a normalized description, the
+    leftmost one if several are as long
+    """
+    best = None
+    for match in MERCHANT_MATCHER.finditer(text):
+        keyword = match.group(1)
+        if best is None or len(keyword) > len(best):
+            best = keyword
+    return best
+
+
+@lru_cache(maxsize=8192)
+def normalize_description(description: str) -> tuple[str, str]:
+    """
+    Maps a raw description to its canonical (merchant, category)
+
+    All keywords are matched in one pass of a compiled prefix-sharing regex, and the most
+    specific one wins wherever it is, so "ONLINE TRANSFER TO Wealthfront EDI PYMNTS" is
+    Wealthfront rather than a transfer. Results are memoized on the raw description since
+    the same merchants repeat constantly. Unmatched descriptions keep a cleaned up
+    version of the description as the merchant.
+    """
+    text = normalize_text(description)
+    keyword = find_keyword(text)
+    if keyword:
+        return MERCHANT_PATTERNS[keyword]
+
+    cleaned = TRAILING_NOISE.sub("", PROCESSOR_PREFIX.sub("", text)).strip()
+    return (cleaned.title() if cleaned else description or "", UNCATEGORIZED)
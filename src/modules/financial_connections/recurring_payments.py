@@ -0,0 +1,237 @@
+"""
+This module detects recurring payments (subscriptions, bills, memberships) in a
+customer's transactions
+"""
+
+import statistics
+import time
+from typing import NamedTuple, Optional
+
+from src.modules.financial_connections.transaction_index import get_doc_key
+from src.utils import RecurringFrequency
+
+SECONDS_PER_DAY = 86400
+# Amounts within this share (or MIN_AMOUNT_TOLERANCE cents) of each other are the same
+AMOUNT_TOLERANCE = 0.15
+MIN_AMOUNT_TOLERANCE = 100
+# Share of the gaps in a series that must match its period
+MIN_REGULAR_SHARE = 0.75
+
+# Frequency -> (period in days, tolerance in days, minimum occurrences)
+FREQUENCY_PERIODS: dict[RecurringFrequency, tuple[float, float, int]] = {
+    RecurringFrequency.WEEKLY: (7.0, 1.5, 4),
+    RecurringFrequency.MONTHLY: (30.44, 4.0, 3),
+    RecurringFrequency.ANNUAL: (365.25, 10.0, 2),
+}
+
+
+class Occurrence(NamedTuple):
+    """The fields of a debit that recurring payment detection uses"""
+
+    transacted_at: int
+    amount: int
+    id: str
+    account: str
+    category: str
+    currency: str
+
+
+def get_occurrence(txn) -> Optional[Occurrence]:
+    """Gets the occurrence of a transaction, or None if it can't be a recurring payment"""
+    amount = int(txn.get("amount", 0) or 0)
+    if amount >= 0 or txn.get("status") == "void":
+        return None
+    return Occurrence(
+        transacted_at=int(txn.get("transacted_at", 0) or 0),
+        amount=amount,
+        id=txn.get("id"),
+        account=txn.get("account"),
+        category=txn.get("category"),
+        currency=txn.get("currency"),
+    )
+
+
+def split_by_amount(occurrences: list[Occurrence]) -> list[list[Occurrence]]:
+    """
+    Splits a merchant's debits into groups of similar amounts
+
+    Sorted by size, a group takes every following amount within AMOUNT_TOLERANCE of its
+    smallest one, so a price that drifts a little stays one series while a second plan at
+    the same merchant becomes its own.
+    """
+    ordered = sorted(occurrences, key=lambda occurrence: -occurrence.amount)
+    groups: list[list[Occurrence]] = []
+    smallest = 0
+    for occurrence in ordered:
+        size = -occurrence.amount
+        if groups and size - smallest <= max(
+            smallest * AMOUNT_TOLERANCE, MIN_AMOUNT_TOLERANCE
+        ):
+            groups[-1].append(occurrence)
+        else:
+            groups.append([occurrence])
+            smallest = size
+    return groups
+
+
+def find_frequency(days: list[float]) -> Optional[RecurringFrequency]:
+    """
+    Finds the frequency that a sorted list of days (one occurrence each) repeats at
+
+    The median gap has to be within the tolerance of the period, and at least
+    MIN_REGULAR_SHARE of all gaps have to be, so one late charge doesn't break a series.
+    """
+    gaps = [later - earlier for earlier, later in zip(days, days[1:])]
+    if not gaps:
+        return None
+
+    median_gap = statistics.median(gaps)
+    for frequency, (period, tolerance, min_occurrences) in FREQUENCY_PERIODS.items():
+        if len(days) < min_occurrences or abs(median_gap - period) > tolerance:
+            continue
+        regular = sum(abs(gap - period) <= tolerance for gap in gaps)
+        if regular >= MIN_REGULAR_SHARE * len(gaps):
+            return frequency
+    return None
+
+
+def find_series(merchant: str, occurrences: list[Occurrence]) -> list[dict]:
+    """Finds the recurring series among one merchant's debits"""
+    series = []
+    for group in split_by_amount(occurrences):
+        group.sort()
+        # Charges split over one day count as one occurrence
+        days: list[float] = []
+        for occurrence in group:
+            day = occurrence.transacted_at / SECONDS_PER_DAY
+            if not days or day - days[-1] >= 1:
+                days.append(day)
+
+        frequency = find_frequency(days)
+        if frequency is None:
+            continue
+
+        period = FREQUENCY_PERIODS[frequency][0]
+        latest = group[-1]
+        amount = int(statistics.median(occurrence.amount for occurrence in group))
+        series.append(
+            {
+                "merchant": merchant,
+                "category": latest.category,
+                "frequency": frequency.value,
+                "amount": amount,
+                "annualized_amount": int(round(amount * 365.25 / period)),
+                "currency": latest.currency,
+                "account": latest.account,
+                "occurrences": len(days),
+                "first_seen": group[0].transacted_at,
+                "last_seen": latest.transacted_at,
+                "next_expected": int(latest.transacted_at + period * SECONDS_PER_DAY),
+                "transaction_ids": [occurrence.id for occurrence in group],
+            }
+        )
+    return series
+
+
+class RecurringPaymentDetector:
+    """
+    Finds the recurring payments in one customer's transactions
+
+    Debits are grouped by normalized merchant, split into groups of similar amounts and
+    sorted by time, and the gaps between them are matched against weekly, monthly and
+    annual periods, O(n log n) overall. The detector is updated in place as new
+    transactions are fetched, and only the merchants whose debits changed are looked at
+    again.
+    """
+
+    def __init__(self):
+        self.__occurrences: dict[str, tuple[str, Occurrence]] = {}
+        self.__merchants: dict[str, set[str]] = {}
+        self.__series: dict[str, list[dict]] = {}
+        self.refreshed_at = 0.0
+
+    def update(self, transactions, windows: dict[str, int]):
+        """
+        Adds or replaces the given transactions
+
+        Args:
+            transactions (list): The cleaned transactions that were fetched
+            windows (dict): Maps each fetched account ID to the timestamp its fetch is
+                complete from. Known debits of those accounts inside the window that
+                weren't fetched again are removed.
+        """
+        fresh: dict[str, tuple[str, Occurrence]] = {}
+        for txn in transactions:
+            occurrence = get_occurrence(txn)
+            if occurrence is not None:
+                merchant = txn.get("merchant") or txn.get("description") or ""
+                fresh[get_doc_key(txn)] = (merchant, occurrence)
+
+        changed: set[str] = set()
+        for key, (merchant, occurrence) in list(self.__occurrences.items()):
+            since = windows.get(occurrence.account)
+            if key not in fresh and since is not None:
+                if occurrence.transacted_at >= since:
+                    self.__remove(key)
+                    changed.add(merchant)
+
+        for key, entry in fresh.items():
+            existing = self.__occurrences.get(key)
+            if existing == entry:
+                continue
+            if existing is not None:
+                self.__remove(key)
+                changed.add(existing[0])
+            self.__occurrences[key] = entry
+            self.__merchants.setdefault(entry[0], set()).add(key)
+            changed.add(entry[0])
+
+        for merchant in changed:
+            keys = self.__merchants.get(merchant)
+            series = []
+            if keys:
+                series = find_series(
+                    merchant, [self.__occurrences[key][1] for key in keys]
+                )
+            if series:
+                self.__series[merchant] = series
+            else:
+                self.__series.pop(merchant, None)
+
+        self.refreshed_at = time.monotonic()
+
+    def get_series(self, now: Optional[int] = None) -> list[dict]:
+        """
+        Gets the detected series, active ones first, then by annualized amount
+
+        A series is active unless its next payment is overdue by more than its tolerance.
+        """
+        now = int(now or time.time())
+        results = []
+        for merchant_series in self.__series.values():
+            for series in merchant_series:
+                tolerance = FREQUENCY_PERIODS[RecurringFrequency(series["frequency"])][
+                    1
+                ]
+                active = series["next_expected"] + tolerance * SECONDS_PER_DAY >= now
+                results.append({**series, "active": active})
+
+        results.sort(
+            key=lambda series: (not series["active"], series["annualized_amount"])
+        )
+        return results
+
+    def __remove(self, key: str):
+        """Removes a debit"""
+        merchant, _ = self.__occurrences.pop(key)
+        keys = self.__merchants[merchant]
+        keys.discard(key)
+        if not keys:
+            del self.__merchants[merchant]
+
+
+def detect_recurring_payments(transactions, now: Optional[int] = None) -> list[dict]:
+    """Detects the recurring payments in a list of transactions, without any caching"""
+    detector = RecurringPaymentDetector()
+    detector.update(transactions=transactions, windows={})
+    return detector.get_series(now)
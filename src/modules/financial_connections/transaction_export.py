@@ -0,0 +1,91 @@
+"""
+This module contains the streaming CSV encoder for transaction exports
+"""
+
+import csv
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+CSV_CHUNK_ROWS = 1000
+CENT = Decimal("0.01")
+# Spreadsheet apps evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+EXPORT_COLUMNS = (
+    "id",
+    "transacted_at",
+    "posted_at",
+    "account",
+    "institution_name",
+    "acct_display_name",
+    "acct_last4",
+    "description",
+    "merchant",
+    "category",
+    "amount",
+    "currency",
+    "status",
+)
+
+
+def get_posted_at(txn) -> Optional[int]:
+    """Gets when a transaction posted, if it has"""
+    return (txn.get("status_transitions") or {}).get("posted_at")
+
+
+def format_timestamp(timestamp: Optional[int]) -> str:
+    """Formats a unix timestamp as an ISO 8601 UTC string"""
+    if timestamp is None:
+        return ""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+def escape_cell(value) -> str:
+    """Escapes a text cell so spreadsheet apps don't run it as a formula"""
+    text = "" if value is None else str(value)
+    if text.startswith(FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def to_major_units(cents) -> Decimal:
+    """Converts an amount in cents to dollars without floating point rounding"""
+    return Decimal(int(cents or 0)).scaleb(-2).quantize(CENT)
+
+
+def iter_csv(transactions: Iterable) -> Iterator[bytes]:
+    """Encodes transactions as CSV, yielding a chunk every CSV_CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    rows = 0
+    for txn in transactions:
+        writer.writerow(
+            [
+                txn.get("id"),
+                format_timestamp(txn.get("transacted_at")),
+                format_timestamp(get_posted_at(txn)),
+                txn.get("account"),
+                escape_cell(txn.get("institution_name")),
+                escape_cell(txn.get("acct_display_name")),
+                txn.get("acct_last4"),
+                escape_cell(txn.get("description")),
+                escape_cell(txn.get("merchant")),
+                escape_cell(txn.get("category")),
+                to_major_units(txn.get("amount")),
+                txn.get("currency"),
+                txn.get("status"),
+            ]
+        )
+        rows += 1
+        if rows % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,184 @@
+"""
+This module contains the in-memory inverted index used to search a customer's transactions
+"""
+
+import bisect
+import re
+import time
+from collections.abc import Mapping
+from typing import Any, Optional
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Sorts after every character a token can contain, used as the end of a prefix range
+PREFIX_END = "\uffff"
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def get_doc_key(txn) -> str:
+    """
+    Gets the key of a transaction in the index
+
+    The account is part of the key, as corrected copies of a transaction (such as the
+    Wealthfront deposits) keep the original ID under another account.
+    """
+    return f"{txn.get('id')}:{txn.get('account')}"
+
+
+class TransactionIndex:
+    """
+    Inverted index over one customer's transactions
+
+    Descriptions are indexed by token, with the vocabulary kept sorted so prefix queries
+    are a binary search. Absolute amounts and transaction times are kept in sorted lists
+    for range queries. The index is updated in place as new transactions are fetched.
+    """
+
+    def __init__(self):
+        self.__docs: dict[str, Mapping[str, Any]] = {}
+        self.__postings: dict[str, set[str]] = {}
+        self.__vocabulary: list[str] = []
+        self.__amounts: list[tuple[int, str]] = []
+        self.__dates: list[tuple[int, str]] = []
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self.__docs)
+
+    def update(self, transactions, windows: dict[str, int]):
+        """
+        Adds or replaces the given transactions
+
+        Args:
+            transactions (list): The cleaned transactions that were fetched
+            windows (dict): Maps each fetched account ID to the timestamp its fetch is
+                complete from. Indexed transactions of those accounts inside the window
+                that weren't fetched again (such as pending rows that have posted) are
+                removed.
+        """
+        fresh = {get_doc_key(txn): txn for txn in transactions}
+        if not self.__docs:
+            self.__build(fresh)
+            return
+
+        for key, txn in list(self.__docs.items()):
+            since = windows.get(txn.get("account", ""))
+            if key not in fresh and since is not None:
+                if txn.get("transacted_at", 0) >= since:
+                    self.__remove(key)
+
+        for key, txn in fresh.items():
+            existing = self.__docs.get(key)
+            if existing is not None:
+                if self.__indexed_fields(existing) == self.__indexed_fields(txn):
+                    # Nothing searchable changed, only point at the newer record
+                    self.__docs[key] = txn
+                    continue
+                self.__remove(key)
+            self.__add(key, txn)
+
+        self.refreshed_at = time.monotonic()
+
+    def search(
+        self,
+        query: str = "",
+        min_amount: Optional[int] = None,
+        max_amount: Optional[int] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        limit: int = 50,
+    ):
+        """
+        Searches the transactions, newest first
+
+        Every query token must match the start of a description token, so "star" finds
+        "STARBUCKS". Amounts are compared by absolute value in cents, and start/end are
+        inclusive unix timestamps.
+        """
+        candidates: list[set[str]] = []
+        for term in tokenize(query):
+            candidates.append(self.__match_prefix(term))
+        if min_amount is not None or max_amount is not None:
+            candidates.append(
+                self.__match_range(self.__amounts, min_amount, max_amount)
+            )
+        if start is not None or end is not None:
+            candidates.append(self.__match_range(self.__dates, start, end))
+
+        if candidates:
+            candidates.sort(key=len)
+            keys = candidates[0].intersection(*candidates[1:])
+        else:
+            keys = set(self.__docs)
+
+        results = [self.__docs[key] for key in keys]
+        results.sort(key=lambda txn: txn.get("transacted_at", 0), reverse=True)
+        return results[:limit]
+
+    def __match_prefix(self, prefix: str) -> set[str]:
+        """Gets the keys of the documents with a token starting with prefix"""
+        lo = bisect.bisect_left(self.__vocabulary, prefix)
+        hi = bisect.bisect_left(self.__vocabulary, prefix + PREFIX_END, lo)
+        matches: set[str] = set()
+        for token in self.__vocabulary[lo:hi]:
+            matches.update(self.__postings[token])
+        return matches
+
+    def __match_range(self, values, low: Optional[int], high: Optional[int]):
+        """Gets the keys whose value in a sorted (value, key) list is within a range"""
+        lo = 0 if low is None else bisect.bisect_left(values, (low, ""))
+        hi = len(values)
+        if high is not None:
+            hi = bisect.bisect_right(values, (high, PREFIX_END))
+        return {key for _, key in values[lo:hi]}
+
+    def __build(self, docs: dict[str, Mapping[str, Any]]):
+        """Indexes a batch of transactions into an empty index"""
+        self.__docs = docs
+        for key, txn in docs.items():
+            for token in set(tokenize(txn.get("description", ""))):
+                self.__postings.setdefault(token, set()).add(key)
+            self.__amounts.append((abs(int(txn.get("amount", 0))), key))
+            self.__dates.append((int(txn.get("transacted_at", 0)), key))
+
+        self.__vocabulary = sorted(self.__postings)
+        self.__amounts.sort()
+        self.__dates.sort()
+        self.refreshed_at = time.monotonic()
+
+    def __add(self, key: str, txn: Mapping[str, Any]):
+        """Indexes a transaction"""
+        self.__docs[key] = txn
+        for token in set(tokenize(txn.get("description", ""))):
+            postings = self.__postings.get(token)
+            if postings is None:
+                postings = self.__postings[token] = set()
+                bisect.insort(self.__vocabulary, token)
+            postings.add(key)
+        bisect.insort(self.__amounts, (abs(int(txn.get("amount", 0))), key))
+        bisect.insort(self.__dates, (int(txn.get("transacted_at", 0)), key))
+
+    def __remove(self, key: str):
+        """Removes a transaction from the index"""
+        txn = self.__docs.pop(key)
+        for token in set(tokenize(txn.get("description", ""))):
+            postings = self.__postings[token]
+            postings.discard(key)
+            if not postings:
+                del self.__postings[token]
+                del self.__vocabulary[bisect.bisect_left(self.__vocabulary, token)]
+        self.__remove_sorted(self.__amounts, (abs(int(txn.get("amount", 0))), key))
+        self.__remove_sorted(self.__dates, (int(txn.get("transacted_at", 0)), key))
+
+    def __indexed_fields(self, txn: Mapping[str, Any]):
+        """Gets the fields of a transaction the index is built from"""
+        return (txn.get("description"), txn.get("amount"), txn.get("transacted_at"))
+
+    def __remove_sorted(self, values, entry):
+        """Removes an entry from a sorted list"""
+        i = bisect.bisect_left(values, entry)
+        if i < len(values) and values[i] == entry:
+            del values[i]
@@ -0,0 +1,97 @@
+"""
+This module contains the compact record types used while enriching transaction data
+"""
+
+from collections.abc import Mapping
+
+from src.modules.financial_connections.merchant_normalizer import normalize_description
+
+ACCOUNT_METADATA_KEYS = ("institution_name", "acct_display_name", "acct_last4")
+# Fields derived from the (possibly corrected) description by the merchant normalizer
+DERIVED_KEYS = ("merchant", "category")
+FIXED_KEYS = ACCOUNT_METADATA_KEYS + DERIVED_KEYS
+
+
+class AccountMetadata:
+    """Account level fields that are shared by every transaction of an account"""
+
+    __slots__ = ("account_id", "institution_name", "acct_display_name", "acct_last4")
+
+    def __init__(self, account, default_institution=None, default_display_name=None):
+        self.account_id = account.get("id", None)
+        self.institution_name = account.get("institution_name", default_institution)
+        self.acct_display_name = account.get("display_name", default_display_name)
+        self.acct_last4 = account.get("last4", None)
+
+
+class TransactionRecord(Mapping):
+    """
+    Read-only view of a Stripe transaction enriched with its account metadata.
+
+    The underlying transaction is referenced rather than copied, and account fields are
+    read from a shared AccountMetadata. Corrections (such as the Wealthfront deposit fix)
+    are stored as a small overrides dict. The merchant and category are derived from the
+    description on access, which is memoized per description. The record is only turned
+    into a dict when it is serialized.
+    """
+
+    __slots__ = ("txn", "meta", "overrides")
+
+    def __init__(self, txn, meta: AccountMetadata, overrides=None):
+        self.txn = txn
+        self.meta = meta
+        self.overrides = overrides
+
+    def __getitem__(self, key):
+        if self.overrides is not None and key in self.overrides:
+            return self.overrides[key]
+        if key in ACCOUNT_METADATA_KEYS:
+            return getattr(self.meta, key)
+        if key in DERIVED_KEYS:
+            return self.__derive(key)
+        return self.txn[key]
+
+    def __iter__(self):
+        yield from self.txn
+        for key in ACCOUNT_METADATA_KEYS:
+            if key not in self.txn:
+                yield key
+        if self.overrides is not None:
+            for key in self.overrides:
+                if key not in self.txn and key not in FIXED_KEYS:
+                    yield key
+        for key in DERIVED_KEYS:
+            if key not in self.txn:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        if self.overrides is not None and key in self.overrides:
+            return self.overrides[key]
+        if key in ACCOUNT_METADATA_KEYS:
+            return getattr(self.meta, key)
+        if key in DERIVED_KEYS:
+            return self.__derive(key)
+        return self.txn.get(key, default)
+
+    def to_dict(self) -> dict:
+        """Materializes the record into a plain dict"""
+        data = {
+            **self.txn,
+            "institution_name": self.meta.institution_name,
+            "acct_display_name": self.meta.acct_display_name,
+            "acct_last4": self.meta.acct_last4,
+        }
+        merchant, category = normalize_description(self.get("description") or "")
+        data["merchant"] = merchant
+        data["category"] = category
+        if self.overrides is not None:
+            data.update(self.overrides)
+        return data
+
+    def __derive(self, key):
+        """Gets a derived field from the normalized description"""
+        merchant, category = normalize_description(self.get("description") or "")
+        return merchant if key == "merchant" else category
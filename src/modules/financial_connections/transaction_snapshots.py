@@ -0,0 +1,465 @@
+"""
+This module contains the columnar transaction snapshots kept on the Lambda's local disk
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Optional, cast
+
+import numpy as np
+
+from src.modules.financial_connections.transaction_records import (
+    ACCOUNT_METADATA_KEYS,
+    AccountMetadata,
+    TransactionRecord,
+)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), "transaction_snapshots")
+# Lambda's /tmp is 512 MB by default, leave most of it for everything else
+DEFAULT_MAX_SNAPSHOT_BYTES = 128 * 1024 * 1024
+
+SNAPSHOT_MAGIC = b"FCSNAP1\n"
+SNAPSHOT_SUFFIX = ".snap"
+HEADER_LENGTH = struct.Struct("<Q")
+ALIGNMENT = 64
+# Stored in integer columns for missing values
+NULL_INT = -1
+NULL_STRING = -1
+
+INT_COLUMNS = ("amount", "transacted_at", "updated", "livemode", "posted_at", "void_at")
+STRING_COLUMNS = (
+    "id",
+    "object",
+    "account",
+    "currency",
+    "description",
+    "status",
+    "transaction_refresh",
+    "institution_name",
+    "acct_display_name",
+    "acct_last4",
+    "merchant",
+    "category",
+)
+# The string columns that hold the Stripe transaction's own fields
+TRANSACTION_STRING_COLUMNS = (
+    "id",
+    "object",
+    "account",
+    "currency",
+    "description",
+    "status",
+    "transaction_refresh",
+)
+
+
+def align(position: int) -> int:
+    """Rounds a file position up to the array alignment"""
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def get_snapshot_version(accounts) -> str:
+    """
+    Gets the version of a customer's transaction data from their accounts' cursors
+
+    Stripe only has new transactions for an account after a transaction refresh, so the
+    set of accounts and the ID and status of their latest refreshes identify the data.
+    """
+    cursors = []
+    for account in accounts:
+        refresh = account.get("transaction_refresh") or {}
+        cursors.append(
+            [
+                account.get("id"),
+                refresh.get("id"),
+                refresh.get("status"),
+                refresh.get("last_attempted_at"),
+            ]
+        )
+    cursors.sort(key=lambda cursor: str(cursor[0]))
+    return hashlib.sha256(json.dumps(cursors).encode("utf-8")).hexdigest()
+
+
+class TransactionSnapshot:
+    """
+    Read-only columnar view of a customer's cleaned transactions
+
+    Rows are sorted by transacted_at. Integer fields are int64 arrays and string fields
+    are int32 codes into an interned string table, all memory-mapped from the snapshot
+    file, so range queries are a binary search plus zero-copy slices of the columns.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.__buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic_end = len(SNAPSHOT_MAGIC)
+        if self.__buffer[:magic_end] != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a transaction snapshot: {path}")
+        header_start = magic_end + HEADER_LENGTH.size
+        (length,) = HEADER_LENGTH.unpack(self.__buffer[magic_end:header_start])
+        header_end = header_start + length
+        header = json.loads(self.__buffer[header_start:header_end])
+        data_start = align(header_end)
+
+        self.version: str = header["version"]
+        self.windows: dict[str, int] = header["windows"]
+        self.created_at: int = header["created_at"]
+        self.size = len(self.__buffer)
+        self.__arrays = {
+            name: np.frombuffer(
+                self.__buffer, dtype=dtype, count=count, offset=data_start + offset
+            )
+            for name, (dtype, offset, count) in header["arrays"].items()
+        }
+        self.__codes: dict[str, dict[str, int]] = {}
+        self.__strings: list[Optional[str]] = [None] * (
+            len(self.__arrays["string_offsets"]) - 1
+        )
+
+    def __len__(self):
+        return len(self.__arrays["transacted_at"])
+
+    def covers(self, account_ids, start: int) -> bool:
+        """Checks that every account's transactions are complete from start onward"""
+        return all(
+            account_id in self.windows and self.windows[account_id] <= start
+            for account_id in account_ids
+        )
+
+    def get_bounds(self, start: Optional[int] = None, end: Optional[int] = None):
+        """Gets the row positions of the transactions between start and end, inclusive"""
+        transacted_at = self.__arrays["transacted_at"]
+        lo = 0 if start is None else int(np.searchsorted(transacted_at, start, "left"))
+        hi = len(transacted_at)
+        if end is not None:
+            hi = int(np.searchsorted(transacted_at, end, "right"))
+        return lo, hi
+
+    def column(self, name: str, start: Optional[int] = None, end: Optional[int] = None):
+        """
+        Gets a column for the transactions between start and end as a read-only array.
+        String columns are returned as codes, see get_string.
+        """
+        lo, hi = self.get_bounds(start, end)
+        return self.__arrays[name][lo:hi]
+
+    def get_string(self, code: int) -> Optional[str]:
+        """Decodes an interned string, caching it for the life of the snapshot"""
+        if code == NULL_STRING:
+            return None
+        value = self.__strings[code]
+        if value is None:
+            offsets = self.__arrays["string_offsets"]
+            lo, hi = int(offsets[code]), int(offsets[code + 1])
+            value = bytes(self.__arrays["string_data"][lo:hi]).decode("utf-8")
+            self.__strings[code] = value
+        return value
+
+    def get_codes(self, name: str) -> dict[str, int]:
+        """Maps the distinct values of a low cardinality string column to their codes"""
+        codes = self.__codes.get(name)
+        if codes is None:
+            codes = {}
+            for code in self.__to_list(np.unique(self.__arrays[name])):
+                value = self.get_string(code)
+                if value is not None:
+                    codes[value] = code
+            self.__codes[name] = codes
+        return codes
+
+    def records(
+        self, start: Optional[int] = None, end: Optional[int] = None
+    ) -> list[TransactionRecord]:
+        """
+        Materializes the transactions between start and end, newest first, as the same
+        TransactionRecords get_transaction_data builds from Stripe
+        """
+        lo, hi = self.get_bounds(start, end)
+        ints = {
+            name: self.__to_list(self.__arrays[name][lo:hi]) for name in INT_COLUMNS
+        }
+        strings = {
+            name: [
+                self.get_string(code)
+                for code in self.__to_list(self.__arrays[name][lo:hi])
+            ]
+            for name in TRANSACTION_STRING_COLUMNS + ACCOUNT_METADATA_KEYS
+        }
+
+        # Rows of an account share their metadata, like they do when built from Stripe
+        metas: dict[tuple, AccountMetadata] = {}
+        records = []
+        for i in range(hi - lo - 1, -1, -1):
+            txn: dict[str, Any] = {
+                name: strings[name][i] for name in TRANSACTION_STRING_COLUMNS
+            }
+            txn.update(
+                {
+                    "amount": ints["amount"][i],
+                    "transacted_at": ints["transacted_at"][i],
+                    "updated": self.__to_optional(ints["updated"][i]),
+                    "livemode": ints["livemode"][i] == 1,
+                    "status_transitions": {
+                        "posted_at": self.__to_optional(ints["posted_at"][i]),
+                        "void_at": self.__to_optional(ints["void_at"][i]),
+                    },
+                }
+            )
+
+            meta_key = tuple(
+                strings[name][i] for name in ("account",) + ACCOUNT_METADATA_KEYS
+            )
+            meta = metas.get(meta_key)
+            if meta is None:
+                account_id, institution_name, display_name, last4 = meta_key
+                meta = metas[meta_key] = AccountMetadata(
+                    {
+                        "id": account_id,
+                        "institution_name": institution_name,
+                        "display_name": display_name,
+                        "last4": last4,
+                    }
+                )
+            records.append(TransactionRecord(txn, meta))
+        return records
+
+    def __to_list(self, array) -> list[int]:
+        """Converts an integer column slice into a list of ints"""
+        return cast(list[int], array.tolist())
+
+    def __to_optional(self, value: int) -> Optional[int]:
+        """Turns the NULL_INT placeholder back into None"""
+        return None if value == NULL_INT else value
+
+
+class TransactionSnapshotStore:
+    """
+    Keeps each customer's cleaned transactions as a TransactionSnapshot on local disk,
+    so warm containers can answer repeat requests without refetching from Stripe.
+
+    Snapshots are versioned by the customer's account cursors (see get_snapshot_version)
+    and written atomically. Opened snapshots are kept mapped across invocations. Once
+    the snapshots take more than max_bytes, the least recently used are deleted, and a
+    snapshot that is over max_bytes on its own isn't stored at all.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_SNAPSHOT_DIR,
+        max_bytes: int = DEFAULT_MAX_SNAPSHOT_BYTES,
+    ):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        # customer_id -> the snapshot currently on disk
+        self.__open: dict[str, TransactionSnapshot] = {}
+
+    def load(self, customer_id: str, version: str) -> Optional[TransactionSnapshot]:
+        """Gets a customer's snapshot if it is at the given version"""
+        snapshot = self.__read(customer_id)
+        if snapshot is None or snapshot.version != version:
+            return None
+        try:
+            os.utime(self.__get_path(customer_id))
+        except OSError:
+            pass
+        return snapshot
+
+    def save(
+        self, customer_id: str, version: str, windows: dict[str, int], transactions
+    ) -> Optional[TransactionSnapshot]:
+        """
+        Stores the transactions fetched for a customer, returning the new snapshot or
+        None if it wasn't stored
+
+        Args:
+            customer_id (str): The customer the transactions belong to
+            version (str): The version of the customer's data, see get_snapshot_version
+            windows (dict): Maps each fetched account ID to the timestamp its fetch is
+                complete from. If the previous snapshot is at the same version, older
+                transactions of those accounts are carried over from it, so a short fetch
+                doesn't shrink a long snapshot. After a new transaction refresh, older
+                transactions can have changed too, so they are dropped instead.
+            transactions (list): The cleaned transactions that were fetched
+        """
+        rows = list(transactions)
+        windows = dict(windows)
+        previous = self.__read(customer_id)
+        if previous is not None and previous.version == version:
+            rows, windows = self.__merge(previous, rows, windows)
+
+        os.makedirs(self.__directory, exist_ok=True)
+        path = self.__get_path(customer_id)
+        if not self.__write(path, version, windows, rows):
+            print(
+                f"Snapshot of {customer_id} is over {self.__max_bytes} bytes, skipped"
+            )
+            return None
+        self.__open.pop(customer_id, None)
+        self.__evict(keep=path)
+        return self.__read(customer_id)
+
+    def __merge(self, previous: TransactionSnapshot, rows: list, windows: dict):
+        """Adds the previous snapshot's transactions from before the new fetch windows"""
+        merged_windows = {}
+        # account_id -> timestamp the previous snapshot's transactions are kept up to
+        cutoffs = {}
+        for account_id, since in windows.items():
+            old_since = previous.windows.get(account_id)
+            merged_windows[account_id] = since
+            # The old data only extends the new data if there is no gap between them
+            if old_since is not None and old_since < since <= previous.created_at:
+                merged_windows[account_id] = old_since
+                cutoffs[account_id] = since
+
+        if not cutoffs:
+            return rows, merged_windows
+        fetched = {(txn.get("id"), txn.get("account")) for txn in rows}
+        kept = [
+            record
+            for record in previous.records(end=max(cutoffs.values()) - 1)
+            if record["transacted_at"] < cutoffs.get(record["account"], 0)
+            if (record["id"], record["account"]) not in fetched
+        ]
+        return rows + kept, merged_windows
+
+    def __write(self, path: str, version: str, windows: dict, rows: list) -> bool:
+        """
+        Writes a snapshot file, replacing any previous one atomically
+
+        Returns False without writing if the snapshot alone is over max_bytes.
+        """
+        # Sort oldest first, keeping the existing order of equal timestamps reversed so
+        # records() gives them back in their original order
+        rows = sorted(reversed(rows), key=lambda txn: txn.get("transacted_at", 0))
+
+        interned: dict[str, int] = {}
+        arrays = {}
+        for name in INT_COLUMNS:
+            arrays[name] = np.fromiter(
+                (self.__to_int(txn, name) for txn in rows),
+                dtype=np.int64,
+                count=len(rows),
+            )
+        for name in STRING_COLUMNS:
+            arrays[name] = np.fromiter(
+                (self.__intern(interned, txn.get(name)) for txn in rows),
+                dtype=np.int32,
+                count=len(rows),
+            )
+
+        encoded = [value.encode("utf-8") for value in interned]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        arrays["string_offsets"] = offsets
+        arrays["string_data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        layout = {}
+        position = 0
+        for name, array in arrays.items():
+            layout[name] = (array.dtype.str, position, len(array))
+            position = align(position + array.nbytes)
+
+        header = json.dumps(
+            {
+                "version": version,
+                "windows": windows,
+                "created_at": int(time.time()),
+                "arrays": layout,
+            }
+        ).encode("utf-8")
+        prefix = SNAPSHOT_MAGIC + HEADER_LENGTH.pack(len(header)) + header
+        data_start = align(len(prefix))
+        if data_start + position > self.__max_bytes:
+            return False
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.__directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(prefix)
+                for name, array in arrays.items():
+                    f.seek(data_start + layout[name][1])
+                    f.write(array.tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return True
+
+    def __evict(self, keep: str):
+        """
+        Deletes the least recently used snapshots until they fit in max_bytes, never the
+        one at keep that was just written
+        """
+        entries = []
+        with os.scandir(self.__directory) as it:
+            for entry in it:
+                if entry.name.endswith(SNAPSHOT_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.__max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.__forget(path)
+
+    def __read(self, customer_id: str) -> Optional[TransactionSnapshot]:
+        """Gets the snapshot on disk for a customer, mapping it on first use"""
+        snapshot = self.__open.get(customer_id)
+        if snapshot is not None:
+            return snapshot
+
+        try:
+            snapshot = TransactionSnapshot(self.__get_path(customer_id))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(e)
+            return None
+        self.__open[customer_id] = snapshot
+        return snapshot
+
+    def __forget(self, path: str):
+        """Drops the mapped snapshot of a deleted file"""
+        for customer_id in list(self.__open):
+            if self.__get_path(customer_id) == path:
+                del self.__open[customer_id]
+
+    def __get_path(self, customer_id: str) -> str:
+        """Gets the snapshot path of a customer"""
+        name = hashlib.sha256(customer_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.__directory, name + SNAPSHOT_SUFFIX)
+
+    def __intern(self, interned: dict[str, int], value) -> int:
+        """Gets the string table code of a value, adding it if needed"""
+        if value is None:
+            return NULL_STRING
+        value = str(value)
+        code = interned.get(value)
+        if code is None:
+            code = interned[value] = len(interned)
+        return code
+
+    def __to_int(self, txn, name: str) -> int:
+        """Gets an integer column value of a transaction"""
+        if name in ("posted_at", "void_at"):
+            value = (txn.get("status_transitions") or {}).get(name)
+        else:
+            value = txn.get(name)
+        if value is None:
+            return 0 if name in ("amount", "transacted_at") else NULL_INT
+        return int(value)
@@ -1,4 +1,7 @@
 """This module collects all of the functionality available in the sessions module"""
 
+from src.modules.sessions.context_builder import FinancialContextBuilder
+from src.modules.sessions.generation_service import GenerationService
+from src.modules.sessions.session_events import LocalSessionEventBus
 from src.modules.sessions.sessions_handler import SessionsHandler
 from src.modules.sessions.sessions_service import SessionsService
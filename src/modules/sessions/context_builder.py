@@ -0,0 +1,271 @@
+"""
+This module turns a customer's transactions into the compact, token budgeted context
+that is sent to the model for generation
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+
+from src.modules.financial_connections.recurring_payments import (
+    detect_recurring_payments,
+)
+from src.utils import RANGE_DAYS, ChatMessage, TransactionRange
+
+DEFAULT_TOKEN_BUDGET = 3000
+# Share of the budget reserved for the financial context, the rest goes to history
+CONTEXT_SHARE = 0.6
+CONTEXT_CACHE_TTL = 300
+MAX_CACHED_CONTEXTS = 200
+TOP_CATEGORIES = 8
+TOP_RECURRING = 8
+LARGEST_TRANSACTIONS = 5
+SECONDS_PER_DAY = 86400
+
+
+def format_cents(cents) -> str:
+    """Formats an amount in cents as dollars"""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}${abs(int(cents)) / 100:,.2f}"
+
+
+class FinancialContextBuilder:
+    """
+    This class builds a compact summary of a customer's finances for a generation request
+
+    The summary (totals and trends per range, per category spend, recurring payments and
+    largest transactions) is aggregated with numpy, cached per customer and range for the
+    MAX_CACHED_CONTEXTS most recently used pairs, and then fitted into a token budget
+    together with the chat history.
+    """
+
+    def __init__(
+        self,
+        financial_connections_service,
+        model_client,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+    ):
+        self.__financial_connections_service = financial_connections_service
+        self.__model_client = model_client
+        self.__token_budget = token_budget
+        # (customer_id, range) -> (expires_at, sections), least recently used first
+        self.__cache: OrderedDict[tuple[str, str], tuple[float, List[List[str]]]] = (
+            OrderedDict()
+        )
+
+    def build(
+        self,
+        customer_id: Optional[str],
+        tx_range: TransactionRange,
+        history: List[ChatMessage],
+        context: Optional[List[str]] = None,
+        token_budget: Optional[int] = None,
+    ):
+        """
+        Builds the context lines and trimmed history for a generation request
+
+        Args:
+            customer_id (str): The customer to summarize, or None to only use context
+            tx_range (TransactionRange): The range of transactions to summarize
+            history (list): The chat history, oldest first
+            context (list): Extra context lines sent with the request, kept first
+            token_budget (int): Overrides the default token budget
+
+        Returns:
+            dict: "context" holds the summary lines that fit the budget, and "history"
+                holds the most recent messages that fit in what is left, oldest first
+        """
+        budget = token_budget or self.__token_budget
+        # (is_summary, lines): the request's own lines first, then the summary sections
+        sections = [(False, [line]) for line in context or []]
+        if customer_id:
+            sections.extend(
+                (True, section) for section in self.get_summary(customer_id, tx_range)
+            )
+
+        fitted = self.__fit_sections(sections, int(budget * CONTEXT_SHARE))
+        used = sum(self.__model_client.count_tokens(line) for line in fitted)
+        trimmed_history = self.__trim_history(history, budget - used)
+
+        return {"context": fitted, "history": trimmed_history}
+
+    def get_summary(self, customer_id: str, tx_range: TransactionRange):
+        """Gets the summary sections for a customer and range, using the cache"""
+        key = (customer_id, str(tx_range))
+        cached = self.__cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.__cache.move_to_end(key)
+            return cached[1]
+
+        # Fetched first: it reads six months, which the range is then served from
+        recurring = None
+        try:
+            recurring = self.__financial_connections_service.get_recurring_payments(
+                customer_id
+            )
+        except Exception as e:
+            print(e)
+
+        transactions = self.__financial_connections_service.get_transaction_data(
+            customer_id=customer_id, tx_range=tx_range
+        )
+
+        sections = self.summarize(transactions, tx_range, recurring=recurring)
+        self.__cache[key] = (time.monotonic() + CONTEXT_CACHE_TTL, sections)
+        self.__cache.move_to_end(key)
+        if len(self.__cache) > MAX_CACHED_CONTEXTS:
+            self.__cache.popitem(last=False)
+        return sections
+
+    def invalidate(self, customer_id: str):
+        """Drops the cached summaries of a customer"""
+        for key in [key for key in self.__cache if key[0] == customer_id]:
+            del self.__cache[key]
+
+    def summarize(
+        self, transactions, tx_range: TransactionRange, now=None, recurring=None
+    ):
+        """
+        Summarizes transactions into sections of context lines, in priority order
+
+        Amounts are Stripe amounts in cents, negative for money leaving the account.
+        recurring takes the customer's detected recurring payments; if it isn't given,
+        they are detected from the transactions.
+        """
+        now = int(now or time.time())
+        tx_range = TransactionRange(tx_range)
+        if not transactions:
+            return [["No transactions found for this period."]]
+
+        count = len(transactions)
+        amounts = np.fromiter(
+            (txn.get("amount", 0) for txn in transactions), dtype=np.int64, count=count
+        )
+        timestamps = np.fromiter(
+            (txn.get("transacted_at", 0) for txn in transactions),
+            dtype=np.int64,
+            count=count,
+        )
+        descriptions = np.array(
+            [txn.get("description", "") or "" for txn in transactions], dtype=object
+        )
+        categories = np.array(
+            [txn.get("category") or "Uncategorized" for txn in transactions],
+            dtype=object,
+        )
+        spend = np.where(amounts < 0, -amounts, 0)
+        income = np.where(amounts > 0, amounts, 0)
+
+        return [
+            self.__summarize_ranges(tx_range, timestamps, spend, income, now),
+            self.__summarize_categories(categories, spend),
+            self.__summarize_recurring(
+                recurring
+                if recurring is not None
+                else detect_recurring_payments(transactions, now)
+            ),
+            self.__summarize_largest(descriptions, amounts, timestamps),
+        ]
+
+    def __summarize_ranges(self, tx_range, timestamps, spend, income, now):
+        """Builds the totals and spending pace for every range up to tx_range"""
+        max_days = RANGE_DAYS.get(tx_range, 0)
+        lines = ["Totals by period (spent / received / avg spent per day):"]
+        daily_rates = []
+        for period, days in RANGE_DAYS.items():
+            if days > max_days:
+                continue
+            mask = timestamps >= now - days * SECONDS_PER_DAY
+            spent = int(spend[mask].sum())
+            received = int(income[mask].sum())
+            daily_rates.append((period, spent / days))
+            lines.append(
+                f"- {period.value}: {format_cents(spent)} / {format_cents(received)} "
+                f"/ {format_cents(spent / days)}"
+            )
+
+        if len(daily_rates) > 1:
+            (recent, recent_rate), (_, overall_rate) = daily_rates[0], daily_rates[-1]
+            if overall_rate > 0:
+                change = (recent_rate - overall_rate) / overall_rate * 100
+                lines.append(
+                    f"- Trend: spending per day over the last {recent.value} is "
+                    f"{change:+.0f}% vs the {tx_range.value} average"
+                )
+        return lines
+
+    def __summarize_categories(self, categories, spend):
+        """Builds the spend per category, largest first"""
+        names, codes = np.unique(categories, return_inverse=True)
+        totals = np.bincount(codes, weights=spend, minlength=len(names))
+        order = np.argsort(-totals)[:TOP_CATEGORIES]
+
+        lines = ["Spending by category:"]
+        lines.extend(
+            f"- {names[i]}: {format_cents(totals[i])}" for i in order if totals[i] > 0
+        )
+        return lines
+
+    def __summarize_recurring(self, recurring):
+        """Builds the active recurring payments, largest yearly cost first"""
+        lines = ["Recurring payments (amount, frequency, next expected):"]
+        active = [series for series in recurring if series.get("active")]
+        active.sort(key=lambda series: series["annualized_amount"])
+        lines.extend(
+            f"- {series['merchant']}: {format_cents(-series['amount'])} "
+            f"{series['frequency']}, next "
+            f"{datetime.fromtimestamp(series['next_expected'], tz=timezone.utc):%Y-%m-%d}"
+            for series in active[:TOP_RECURRING]
+        )
+        return lines
+
+    def __summarize_largest(self, descriptions, amounts, timestamps):
+        """Builds the largest transactions by absolute amount"""
+        order = np.argsort(-np.abs(amounts), kind="stable")[:LARGEST_TRANSACTIONS]
+        lines = ["Largest transactions:"]
+        lines.extend(
+            f"- {datetime.fromtimestamp(int(timestamps[i]), tz=timezone.utc):%Y-%m-%d} "
+            f"{descriptions[i]}: {format_cents(amounts[i])}"
+            for i in order
+        )
+        return lines
+
+    def __fit_sections(
+        self, sections: List[tuple[bool, List[str]]], budget: int
+    ) -> List[str]:
+        """
+        Takes lines from the (is_summary, lines) sections in priority order until the
+        budget is spent
+        """
+        context: List[str] = []
+        for is_summary, section in sections:
+            # A summary header without at least one of its lines is not worth the tokens
+            if is_summary and len(section) < 2 and section[0].endswith(":"):
+                continue
+            costs = [self.__model_client.count_tokens(line) for line in section]
+            if sum(costs[:2]) > budget:
+                return context
+            for line, cost in zip(section, costs):
+                if cost > budget:
+                    return context
+                context.append(line)
+                budget -= cost
+        return context
+
+    def __trim_history(self, history: List[ChatMessage], budget: int):
+        """Keeps the most recent messages that fit in the budget, oldest first"""
+        trimmed: List[ChatMessage] = []
+        for message in reversed(history or []):
+            cost = self.__model_client.count_tokens(
+                message.get("message_content", "") or ""
+            )
+            if cost > budget:
+                break
+            trimmed.append(message)
+            budget -= cost
+
+        trimmed.reverse()
+        return trimmed
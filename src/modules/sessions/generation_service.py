@@ -0,0 +1,198 @@
+"""This module contains the chat generation functionality for sessions"""
+
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from src.modules.sessions.response_parser import MessageStreamParser
+from src.utils import (
+    DEV_PROMPT,
+    SUMMARY_PROMPT,
+    GenerationRequest,
+    MessageOwner,
+    TransactionRange,
+)
+
+DEFAULT_SESSION_NAME = "New Chat"
+
+
+class GenerationService:
+    """This class generates AI replies for a session and stores the exchange"""
+
+    def __init__(
+        self,
+        chat_logs_db,
+        session_info_db,
+        sessions_service,
+        model_client,
+        context_builder,
+    ):
+        self.__chat_logs_db = chat_logs_db
+        self.__session_info_db = session_info_db
+        self.__sessions_service = sessions_service
+        self.__model_client = model_client
+        self.__context_builder = context_builder
+
+    async def generate(self, session_id: str, body: GenerationRequest):
+        """
+        Generates a reply to a user message, yielding events as it streams
+
+        Yields ("token", {"delta": text}) for every piece of the reply's message text as
+        the model produces it, then ("done", ai_message) once the user and AI messages are
+        stored. The first message of a session also gets a title, generated alongside the
+        reply and saved after the messages, so it doesn't add to the response time. It is
+        then yielded as ("title", {"session_id": ..., "session_name": title}).
+        """
+        user_timestamp = self.__now()
+        history = body.get("history", []) or []
+        built = await run_in_threadpool(
+            self.__context_builder.build,
+            body.get("customer_id"),
+            body.get("range", TransactionRange.MONTH),
+            history,
+            body.get("context", []),
+        )
+        messages = self.__build_messages(body["message_content"], built)
+
+        title_task = None
+        if not history:
+            title_task = asyncio.ensure_future(
+                run_in_threadpool(self.__generate_title, body["message_content"])
+            )
+
+        parser = MessageStreamParser()
+        try:
+            async for chunk in iterate_in_threadpool(
+                self.__model_client.stream(messages)
+            ):
+                delta = parser.feed(chunk)
+                if delta:
+                    yield "token", {"delta": delta}
+
+            response = parser.result()
+            user_item = self.__build_item(
+                session_id,
+                body,
+                body["message_content"],
+                MessageOwner.USER,
+                user_timestamp,
+            )
+            ai_item = self.__build_item(
+                session_id,
+                body,
+                str(response.get("message", "")),
+                MessageOwner.AI,
+                self.__now(),
+                graph=response.get("graph"),
+            )
+            await run_in_threadpool(
+                self.__save_exchange, session_id, [user_item, ai_item]
+            )
+            self.__sessions_service.publish_messages(session_id, [user_item, ai_item])
+
+            yield "done", {**ai_item, "graph_data": response.get("graph")}
+
+            title = await title_task if title_task else None
+            if title:
+                await run_in_threadpool(self.__save_title, session_id, title)
+                yield "title", {"session_id": session_id, "session_name": title}
+        finally:
+            if title_task and not title_task.done():
+                title_task.cancel()
+
+    def __build_messages(self, message_content: str, built: dict):
+        """Builds the chat completion messages for a generation"""
+        messages = [{"role": "system", "content": DEV_PROMPT}]
+        if built["context"]:
+            context = "\n".join(built["context"])
+            messages.append(
+                {"role": "system", "content": f"User financial context:\n{context}"}
+            )
+        for message in built["history"]:
+            role = (
+                "user"
+                if message.get("message_type") == MessageOwner.USER
+                else "assistant"
+            )
+            messages.append(
+                {"role": role, "content": message.get("message_content", "") or ""}
+            )
+        messages.append({"role": "user", "content": message_content})
+        return messages
+
+    def __generate_title(self, message_content: str) -> Optional[str]:
+        """Generates a session title with SUMMARY_PROMPT, or None if it fails"""
+        try:
+            res = self.__model_client.complete(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": message_content},
+                ]
+            )
+            title = json.loads(res).get("title")
+            return str(title) if title else None
+        except Exception as e:
+            print(e)
+            return None
+
+    def __build_item(
+        self, session_id, body, content, owner, timestamp, graph=None
+    ) -> dict:
+        """Builds a chat_logs item"""
+        item = {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "thread_id": body.get("thread_id", ""),
+            "user_id": body.get("user_id", ""),
+            "message_content": content,
+            "message_type": owner.value,
+            "timestamp": timestamp,
+        }
+        if graph:
+            item["graph_data"] = json.dumps(graph)
+        return item
+
+    def __save_exchange(self, session_id: str, items: list[dict]):
+        """
+        Writes the chat_logs items and bumps session_info in one transaction, naming a
+        new session DEFAULT_SESSION_NAME until its title is saved
+        """
+        updated_at = items[-1]["timestamp"]
+        self.__chat_logs_db.meta.client.transact_write_items(
+            TransactItems=[
+                *(
+                    {"Put": {"TableName": self.__chat_logs_db.name, "Item": item}}
+                    for item in items
+                ),
+                {
+                    "Update": {
+                        "TableName": self.__session_info_db.name,
+                        "Key": {"session_id": session_id},
+                        "UpdateExpression": (
+                            "SET updated_at = :updated_at, "
+                            "session_name = if_not_exists(session_name, :name)"
+                        ),
+                        "ExpressionAttributeValues": {
+                            ":updated_at": updated_at,
+                            ":name": DEFAULT_SESSION_NAME,
+                        },
+                    }
+                },
+            ]
+        )
+
+    def __save_title(self, session_id: str, title: str):
+        """Renames a session with its generated title"""
+        self.__session_info_db.update_item(
+            Key={"session_id": session_id},
+            UpdateExpression="SET session_name = :name",
+            ExpressionAttributeValues={":name": title},
+        )
+
+    def __now(self) -> str:
+        """Gets the current time as an ISO timestamp"""
+        return datetime.now(timezone.utc).isoformat()
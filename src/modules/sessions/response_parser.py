@@ -0,0 +1,144 @@
+"""
+This module contains the incremental parser for the JSON responses streamed by the model
+"""
+
+import json
+import string
+
+HEX_DIGITS = frozenset(string.hexdigits)
+
+
+class MessageStreamParser:
+    """
+    Incrementally extracts the "message" field of a streamed JSON model response
+
+    Chunks are fed as they arrive and the decoded text of the top level "message" string
+    is returned as soon as it is complete enough to decode, so it can be forwarded to the
+    client while the rest of the response (such as "graph") is still streaming.
+    """
+
+    def __init__(self):
+        self.__chunks: list[str] = []
+        self.__depth = 0
+        self.__in_string = False
+        self.__escaped = False
+        self.__expect_key = False
+        self.__key: list[str] = []
+        self.__last_key = ""
+        self.__after_colon = False
+        self.__in_message = False
+        self.__pending = ""
+
+    def feed(self, chunk: str) -> str:
+        """Consumes a chunk and returns the newly decoded message text"""
+        self.__chunks.append(chunk)
+        decoded: list[str] = []
+        for char in chunk:
+            if self.__in_string:
+                self.__consume_string_char(char, decoded)
+            elif char == '"':
+                self.__in_string = True
+                if self.__depth == 1 and self.__expect_key:
+                    self.__key = []
+                elif self.__depth == 1 and self.__after_colon:
+                    self.__in_message = self.__last_key == "message"
+            elif char in "{[":
+                self.__depth += 1
+                self.__expect_key = self.__depth == 1 and char == "{"
+            elif char in "}]":
+                self.__depth -= 1
+            elif char == ":" and self.__depth == 1:
+                self.__expect_key = False
+                self.__after_colon = True
+            elif char == "," and self.__depth == 1:
+                self.__expect_key = True
+                self.__after_colon = False
+                self.__last_key = ""
+
+        if self.__in_message:
+            decoded.append(self.__flush(final=False))
+        return "".join(decoded)
+
+    def result(self) -> dict:
+        """Parses the complete response, falling back to treating it all as the message"""
+        text = "".join(self.__chunks)
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            try:
+                stop = end + 1
+                parsed = json.loads(text[start:stop], strict=False)
+                if isinstance(parsed, dict):
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+        return {"message": text}
+
+    def __consume_string_char(self, char: str, decoded: list[str]):
+        """Handles a character inside a JSON string"""
+        if self.__escaped:
+            self.__escaped = False
+        elif char == "\\":
+            self.__escaped = True
+        elif char == '"':
+            self.__in_string = False
+            if self.__in_message:
+                decoded.append(self.__flush(final=True))
+                self.__in_message = False
+            elif self.__depth == 1 and self.__expect_key:
+                self.__last_key = "".join(self.__key)
+            return
+
+        if self.__in_message:
+            self.__pending += char
+        elif self.__depth == 1 and self.__expect_key:
+            self.__key.append(char)
+
+    def __flush(self, final: bool) -> str:
+        """Decodes the pending message text, holding back an incomplete escape"""
+        raw = self.__pending
+        cut = len(raw) if final else self.__safe_cut(raw)
+        self.__pending = raw[cut:]
+        if cut == 0:
+            return ""
+        return self.__decode(raw[:cut])
+
+    def __decode(self, raw: str) -> str:
+        """Decodes JSON string text, keeping it as is if it has a malformed escape"""
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except json.JSONDecodeError:
+            return raw
+
+    def __safe_cut(self, raw: str) -> int:
+        """Finds the longest prefix of raw that doesn't end inside an escape sequence"""
+        i = 0
+        while i < len(raw):
+            if raw[i] != "\\":
+                i += 1
+                continue
+            if i + 1 >= len(raw):
+                return i
+            if raw[i + 1] != "u":
+                i += 2
+                continue
+            if i + 6 > len(raw):
+                return i
+            hex_start, hex_end = i + 2, i + 6
+            digits = raw[hex_start:hex_end]
+            if not all(char in HEX_DIGITS for char in digits):
+                # Malformed, so __decode keeps it as literal text
+                i += 2
+                continue
+            # A high surrogate needs its low surrogate escape before it can be decoded
+            code_point = int(digits, 16)
+            if 0xD800 <= code_point < 0xDC00:
+                low_start, low_end = i + 6, i + 8
+                if low_end > len(raw):
+                    return i
+                if raw[low_start:low_end] == "\\u":
+                    if i + 12 > len(raw):
+                        return i
+                    i += 12
+                    continue
+            i += 6
+        return i
@@ -0,0 +1,38 @@
+"""This module contains the pub/sub used to push new chat messages to listening clients"""
+
+import asyncio
+
+
+class LocalSessionEventBus:
+    """
+    In-process pub/sub of new chat_logs items, keyed by session ID
+
+    Subscribers only receive messages published in the same process, so this backs local
+    development and tests. Across Lambda containers, listeners fall back to polling
+    chat_logs with the delta query.
+    """
+
+    def __init__(self):
+        self.__subscribers: dict[
+            str, set[tuple[asyncio.Queue, asyncio.AbstractEventLoop]]
+        ] = {}
+
+    def publish(self, session_id: str, message: dict):
+        """Sends a message to every subscriber of a session, from any thread"""
+        for queue, loop in list(self.__subscribers.get(session_id, ())):
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def subscribe(self, session_id: str) -> asyncio.Queue:
+        """Registers a queue that receives the messages published for a session"""
+        queue: asyncio.Queue = asyncio.Queue()
+        subscriber = (queue, asyncio.get_running_loop())
+        self.__subscribers.setdefault(session_id, set()).add(subscriber)
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue):
+        """Removes a queue returned by subscribe"""
+        subscribers = self.__subscribers.get(session_id, set())
+        for subscriber in [sub for sub in subscribers if sub[0] is queue]:
+            subscribers.discard(subscriber)
+        if not subscribers:
+            self.__subscribers.pop(session_id, None)
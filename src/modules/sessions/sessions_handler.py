@@ -1,22 +1,30 @@
 """This module handles all requests to the /sessions endpoint"""
 
+import json
 import re
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from src.utils import CustomEncoder, GenerationRequest
 
 
 class SessionsHandler:
     """This class is responsible for handling any requests to /sessions"""
 
-    def __init__(self, sessions_service):
+    def __init__(self, sessions_service, generation_service):
         self.router = APIRouter(prefix="/sessions", tags=["sessions"])
         self.__sessions_service = sessions_service
+        self.__generation_service = generation_service
         self.__setup_routes()
 
     def __setup_routes(self):
         """Initializes all routes"""
         self.router.get("")(self.get_all_sessions)
         self.router.get("/{session_id}")(self.get_session)
+        self.router.get("/{session_id}/events")(self.stream_session_events)
+        self.router.post("/{session_id}/generate")(self.generate)
 
     async def get_all_sessions(self):
         """Get information for all sessions"""
@@ -25,18 +33,69 @@ class SessionsHandler:
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e)) from e
 
-    async def get_session(self, session_id: str):
-        """Get information for a specific session"""
+    async def get_session(self, session_id: str, since: Optional[str] = None):
+        """Get information for a specific session, or only the messages after since"""
         if not self.__validate_session_id(session_id):
             raise HTTPException(status_code=400, detail="Invalid session ID format")
 
         try:
-            return self.__sessions_service.get_session(session_id)
+            return self.__sessions_service.get_session(session_id, since)
         except Exception as e:
             raise HTTPException(
                 status_code=404, detail=f"Session not found: {session_id}\n\nError: {e}"
             ) from e
 
+    async def stream_session_events(
+        self,
+        session_id: str,
+        since: Optional[str] = None,
+        last_event_id: Optional[str] = Header(None),
+    ):
+        """Stream new messages for a session as server-sent events"""
+        if not self.__validate_session_id(session_id):
+            raise HTTPException(status_code=400, detail="Invalid session ID format")
+
+        events = self.__sessions_service.stream_session_events(
+            session_id, last_event_id or since
+        )
+
+        async def event_stream():
+            async for messages in events:
+                if not messages:
+                    yield ": keep-alive\n\n"
+                for message in messages:
+                    data = json.dumps(message, cls=CustomEncoder)
+                    yield f"id: {message['timestamp']}\nevent: message\ndata: {data}\n\n"
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def generate(self, session_id: str, body: GenerationRequest):
+        """Generate a reply to a message, streaming it as server-sent events"""
+        if not self.__validate_session_id(session_id):
+            raise HTTPException(status_code=400, detail="Invalid session ID format")
+
+        events = self.__generation_service.generate(session_id, body)
+
+        async def event_stream():
+            try:
+                async for event, payload in events:
+                    data = json.dumps(payload, cls=CustomEncoder)
+                    yield f"event: {event}\ndata: {data}\n\n"
+            except Exception as e:
+                print(e)
+                data = json.dumps({"detail": str(e)})
+                yield f"event: error\ndata: {data}\n\n"
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     def __validate_session_id(self, session_id: str) -> bool:
         """Validates the session ID format"""
 
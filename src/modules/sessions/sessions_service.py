@@ -1,16 +1,26 @@
 """This module contains all GET functionality needed for sessions"""
 
+import asyncio
 import json
+import time
+from typing import Optional
 
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import ConditionBase, Key
+from starlette.concurrency import run_in_threadpool
+
+# Seconds between chat_logs delta queries while a client is listening for events
+EVENTS_POLL_INTERVAL = 2
+# Streams are closed before the Lambda timeout, clients reconnect with Last-Event-ID
+EVENTS_MAX_DURATION = 25
 
 
 class SessionsService:
     """This class contains all functionality relevant to sessions"""
 
-    def __init__(self, chat_logs_db, session_info_db):
+    def __init__(self, chat_logs_db, session_info_db, event_bus):
         self.__chat_logs_db = chat_logs_db
         self.__session_info_db = session_info_db
+        self.__event_bus = event_bus
 
     def get_all_sessions_info(self):
         """This method returns all session info"""
@@ -30,10 +40,19 @@ class SessionsService:
 
         return sessions_info
 
-    def get_session(self, session_id: str):
-        """This method gets detailed data on a session"""
+    def get_session(self, session_id: str, since: Optional[str] = None):
+        """
+        This method gets detailed data on a session
+
+        If since is given, only the messages with a timestamp after it are returned, using
+        the timestamp sort key so older messages are never read.
+        """
+        condition: ConditionBase = Key("session_id").eq(session_id)
+        if since:
+            condition = condition & Key("timestamp").gt(since)
+
         response = self.__chat_logs_db.query(
-            KeyConditionExpression=Key("session_id").eq(session_id),
+            KeyConditionExpression=condition,
             ExpressionAttributeNames={"#timestamp": "timestamp"},
             ProjectionExpression="""
             id, session_id, thread_id, message_content, message_type, graph_data, #timestamp
@@ -44,11 +63,71 @@ class SessionsService:
             sorted_items = sorted(response["Items"], key=lambda x: x["timestamp"])
 
             for item in sorted_items:
-                if "graph_data" in item and item["graph_data"]:
-                    try:
-                        item["graph_data"] = json.loads(item["graph_data"])
-                    except json.JSONDecodeError:
-                        item["graph_data"] = None
+                self.__decode_graph_data(item)
 
             return sorted_items
         return []
+
+    def publish_messages(self, session_id: str, items: list[dict]):
+        """Pushes newly written chat_logs items to the clients listening on a session"""
+        for item in sorted(items, key=lambda x: x["timestamp"]):
+            message = dict(item)
+            self.__decode_graph_data(message)
+            self.__event_bus.publish(session_id, message)
+
+    async def stream_session_events(self, session_id: str, since: Optional[str] = None):
+        """
+        Yields batches of new messages for a session as they are written
+
+        Messages published in this process arrive immediately. Messages written by other
+        containers are picked up by a delta query every EVENTS_POLL_INTERVAL seconds. An
+        empty batch is yielded when nothing new arrived, so the caller can send a
+        heartbeat. The stream ends after EVENTS_MAX_DURATION seconds.
+        """
+        queue = self.__event_bus.subscribe(session_id)
+        deadline = time.monotonic() + EVENTS_MAX_DURATION
+        try:
+            if since is None:
+                # The client already has the history, only send what comes after it
+                since = await run_in_threadpool(self.__get_latest_timestamp, session_id)
+
+            while time.monotonic() < deadline:
+                messages = await run_in_threadpool(self.get_session, session_id, since)
+                if not messages:
+                    try:
+                        messages = [
+                            await asyncio.wait_for(
+                                queue.get(), timeout=EVENTS_POLL_INTERVAL
+                            )
+                        ]
+                        while not queue.empty():
+                            messages.append(queue.get_nowait())
+                    except asyncio.TimeoutError:
+                        pass
+
+                messages = [m for m in messages if m["timestamp"] > (since or "")]
+                if messages:
+                    since = messages[-1]["timestamp"]
+                yield messages
+        finally:
+            self.__event_bus.unsubscribe(session_id, queue)
+
+    def __get_latest_timestamp(self, session_id: str) -> str:
+        """Gets the timestamp of the newest message in a session"""
+        response = self.__chat_logs_db.query(
+            KeyConditionExpression=Key("session_id").eq(session_id),
+            ExpressionAttributeNames={"#timestamp": "timestamp"},
+            ProjectionExpression="#timestamp",
+            ScanIndexForward=False,
+            Limit=1,
+        )
+        items = response.get("Items", [])
+        return items[0]["timestamp"] if items else ""
+
+    def __decode_graph_data(self, item: dict):
+        """Decodes the JSON graph data stored on a chat_logs item in place"""
+        if "graph_data" in item and item["graph_data"]:
+            try:
+                item["graph_data"] = json.loads(item["graph_data"])
+            except json.JSONDecodeError:
+                item["graph_data"] = None
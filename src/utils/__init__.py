@@ -1,8 +1,12 @@
 """This module collects all of the functionality available in utils"""
 
 from src.utils.build_response import *
+from src.utils.clients import *
+from src.utils.dates import *
 from src.utils.exceptions import *
+from src.utils.model_clients import *
 from src.utils.paths import *
+from src.utils.profiling import *
 from src.utils.prompts import *
 from src.utils.requests import *
 from src.utils.types import *
@@ -6,13 +6,18 @@ including a custom JSON encoder for Decimal objects.
 import json
 from decimal import Decimal
 
+from fastapi import Response
+
 
 class CustomEncoder(json.JSONEncoder):
-    """Custom JSON encoder for handling Decimal objects."""
+    """Custom JSON encoder for handling Decimal objects and lazily built records."""
 
     def default(self, o):
         if isinstance(o, Decimal):
             return float(o)
+        to_dict = getattr(o, "to_dict", None)
+        if callable(to_dict):
+            return to_dict()
         return json.JSONEncoder.default(self, o)
 
 
@@ -29,3 +34,15 @@ def build_response(status_code, body=None):
     if body is not None:
         response["body"] = json.dumps(body, cls=CustomEncoder)
     return response
+
+
+def build_json_response(body, status_code=200):
+    """
+    Builds a FastAPI response by serializing the body directly with CustomEncoder,
+    skipping FastAPI's per-object jsonable_encoder pass
+    """
+    return Response(
+        content=json.dumps(body, cls=CustomEncoder),
+        status_code=status_code,
+        media_type="application/json",
+    )
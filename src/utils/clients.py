@@ -0,0 +1,188 @@
+"""
+This module builds the DynamoDB and Stripe clients on shared, tunable keep-alive
+connection pools
+"""
+
+import os
+from typing import Literal, Optional, cast, get_args
+
+import boto3
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from stripe import RequestsClient
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_CONNECT_TIMEOUT = 2.0
+DEFAULT_READ_TIMEOUT = 10.0
+# The retry modes botocore supports
+RetryMode = Literal["legacy", "standard", "adaptive"]
+DEFAULT_RETRY_MODE: RetryMode = "standard"
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_STRIPE_MAX_NETWORK_RETRIES = 2
+
+
+def get_retry_mode(value: str) -> RetryMode:
+    """Checks that a string is a botocore retry mode"""
+    if value not in get_args(RetryMode):
+        raise ValueError(f"Unknown retry mode: {value}")
+    return cast(RetryMode, value)
+
+
+def get_pool_manager_stats(pool_managers) -> dict:
+    """
+    Sums up the connection pools of urllib3 pool managers
+
+    Returns the number of host pools, their total size, the connections checked out
+    right now, the open idle connections kept alive, the connections opened so far and
+    the requests sent so far.
+    """
+    stats = {
+        "pools": 0,
+        "maxsize": 0,
+        "in_use": 0,
+        "idle": 0,
+        "opened": 0,
+        "requests": 0,
+    }
+    for manager in pool_managers:
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            stats["pools"] += 1
+            stats["maxsize"] += pool.pool.maxsize
+            stats["in_use"] += max(0, pool.pool.maxsize - pool.pool.qsize())
+            stats["idle"] += sum(conn is not None for conn in list(pool.pool.queue))
+            stats["opened"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+    return stats
+
+
+class ClientFactory:
+    """
+    This class builds the service clients so they share keep-alive connection pools
+    sized for concurrent requests, instead of the defaults (10 DynamoDB connections, a
+    new Stripe session per thread)
+
+    Create it once per container and reuse its clients across warm invocations. The
+    settings can be tuned from the environment, see from_env.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        retry_mode: RetryMode = DEFAULT_RETRY_MODE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        stripe_max_network_retries: int = DEFAULT_STRIPE_MAX_NETWORK_RETRIES,
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self.stripe_max_network_retries = stripe_max_network_retries
+        self.__dynamodb = None
+        self.__stripe_session: Optional[requests.Session] = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a factory from CLIENT_MAX_POOL_CONNECTIONS, CLIENT_CONNECT_TIMEOUT and
+        CLIENT_READ_TIMEOUT (seconds), AWS_RETRY_MODE, AWS_MAX_ATTEMPTS and
+        STRIPE_MAX_NETWORK_RETRIES, using the defaults for any that aren't set
+        """
+        return cls(
+            max_pool_connections=int(
+                os.getenv(
+                    "CLIENT_MAX_POOL_CONNECTIONS", str(DEFAULT_MAX_POOL_CONNECTIONS)
+                )
+            ),
+            connect_timeout=float(
+                os.getenv("CLIENT_CONNECT_TIMEOUT", str(DEFAULT_CONNECT_TIMEOUT))
+            ),
+            read_timeout=float(
+                os.getenv("CLIENT_READ_TIMEOUT", str(DEFAULT_READ_TIMEOUT))
+            ),
+            retry_mode=get_retry_mode(os.getenv("AWS_RETRY_MODE", DEFAULT_RETRY_MODE)),
+            max_attempts=int(os.getenv("AWS_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS))),
+            stripe_max_network_retries=int(
+                os.getenv(
+                    "STRIPE_MAX_NETWORK_RETRIES",
+                    str(DEFAULT_STRIPE_MAX_NETWORK_RETRIES),
+                )
+            ),
+        )
+
+    def get_botocore_config(self) -> Config:
+        """Gets the botocore config shared by the AWS clients"""
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries={"mode": self.retry_mode, "max_attempts": self.max_attempts},
+            tcp_keepalive=True,
+        )
+
+    def get_dynamodb(self, **kwargs):
+        """
+        Gets the DynamoDB resource, building it on first use
+
+        kwargs are passed on to boto3.resource, such as endpoint_url for a local DynamoDB.
+        """
+        if self.__dynamodb is None:
+            self.__dynamodb = boto3.resource(
+                "dynamodb", config=self.get_botocore_config(), **kwargs
+            )
+        return self.__dynamodb
+
+    def configure_stripe(self, stripe):
+        """
+        Points the stripe module at one pooled HTTP session shared by every thread
+
+        Stripe retries failed requests itself (with backoff and idempotency keys), so the
+        transport doesn't retry.
+        """
+        if self.__stripe_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=self.max_pool_connections,
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.__stripe_session = session
+
+        stripe.default_http_client = RequestsClient(
+            session=self.__stripe_session,
+            timeout=(self.connect_timeout, self.read_timeout),
+        )
+        stripe.max_network_retries = self.stripe_max_network_retries
+        return stripe
+
+    def get_pool_stats(self) -> dict:
+        """Gets the connection pool usage of the clients built so far"""
+        stats = {}
+        if self.__dynamodb is not None:
+            try:
+                # pylint: disable=protected-access
+                http_session = self.__dynamodb.meta.client._endpoint.http_session
+                managers = [
+                    http_session._manager,
+                    *http_session._proxy_managers.values(),
+                ]
+                stats["dynamodb"] = get_pool_manager_stats(managers)
+            except AttributeError as e:
+                print(e)
+
+        if self.__stripe_session is not None:
+            managers = [
+                adapter.poolmanager
+                for adapter in set(self.__stripe_session.adapters.values())
+                if isinstance(adapter, HTTPAdapter)
+            ]
+            stats["stripe"] = get_pool_manager_stats(managers)
+        return stats
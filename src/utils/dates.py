@@ -0,0 +1,36 @@
+"""This module contains date helpers shared by the transaction features"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from src.utils.types import TransactionRange
+
+RANGE_DAYS = {
+    TransactionRange.WEEK: 7,
+    TransactionRange.MONTH: 30,
+    TransactionRange.THREE_MONTH: 90,
+    TransactionRange.SIX_MONTH: 180,
+}
+
+
+def get_range_start(
+    tx_range: TransactionRange, now: Optional[datetime] = None
+) -> datetime:
+    """Gets the datetime a transaction range starts at"""
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(days=RANGE_DAYS.get(tx_range, 0))
+
+
+def to_day_key(timestamp: int) -> str:
+    """Converts a unix timestamp into its UTC day key (YYYY-MM-DD)"""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def next_day_key(day: str) -> str:
+    """Gets the day key following the given one"""
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def previous_day_key(day: str) -> str:
+    """Gets the day key preceding the given one"""
+    return (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
@@ -0,0 +1,60 @@
+"""
+This module contains the clients used to talk to the language model
+"""
+
+import os
+from typing import Iterator, List, Optional
+
+DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+
+# Rough number of characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens in a piece of text"""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class OpenAIModelClient:
+    """This class wraps the OpenAI chat completions API"""
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.__api_key = api_key
+        self.__model = model or os.getenv("OPENAI_MODEL", DEFAULT_OPENAI_MODEL)
+        self.__client = None
+
+    def __get_client(self):
+        """Creates the OpenAI client on first use, so importing the app needs no key"""
+        if self.__client is None:
+            from openai import OpenAI  # pylint: disable=import-outside-toplevel
+
+            self.__client = OpenAI(api_key=self.__api_key)
+        return self.__client
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens in a piece of text"""
+        return estimate_tokens(text)
+
+    def complete(self, messages: List[dict]) -> str:
+        """Generates a full JSON response for the given chat messages"""
+        res = self.__get_client().chat.completions.create(
+            model=self.__model,
+            messages=messages,
+            response_format={"type": "json_object"},
+        )
+        return res.choices[0].message.content or ""
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        """Generates a JSON response, yielding text chunks as the model produces them"""
+        res = self.__get_client().chat.completions.create(
+            model=self.__model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            stream=True,
+        )
+        for chunk in res:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
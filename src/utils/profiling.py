@@ -0,0 +1,287 @@
+"""
+This module contains the opt-in request profiler, an ASGI middleware that runs a request
+under cProfile or a stack sampler and saves the result
+"""
+
+import cProfile
+import hashlib
+import hmac
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional, Protocol
+
+from src.utils.types import ProfileMode
+
+logger = logging.getLogger()
+
+PROFILE_HEADER = b"x-profile-signature"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_SIGNATURE_MAX_AGE = 300
+PROFILE_TOP_FUNCTIONS = 20
+SAMPLE_INTERVAL = 0.005
+
+
+def sign_profile_request(
+    secret: str, method: str, path: str, timestamp: Optional[int] = None
+) -> str:
+    """
+    Builds the X-Profile-Signature header value that asks for a request to be profiled
+
+    The signature is an HMAC-SHA256 of "{timestamp}:{METHOD}:{path}", so it only works for
+    the one route and expires after PROFILE_SIGNATURE_MAX_AGE seconds.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    message = f"{timestamp}:{method.upper()}:{path}".encode("utf-8")
+    digest = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}:{digest}"
+
+
+class ProfileSink(Protocol):
+    """Where ProfilingMiddleware saves profiles"""
+
+    def save(self, name: str, data: bytes) -> str:
+        """Saves a profile, returning its location"""
+
+
+class LocalProfileSink:
+    """Saves profiles to a local directory, keeping only the newest max_files"""
+
+    def __init__(self, directory: str, max_files: int = 50):
+        self.__directory = directory
+        self.__max_files = max_files
+
+    def save(self, name: str, data: bytes) -> str:
+        """Saves a profile, returning its path"""
+        os.makedirs(self.__directory, exist_ok=True)
+        path = os.path.join(self.__directory, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        self.__evict()
+        return path
+
+    def __evict(self):
+        """Removes the oldest profiles past max_files"""
+        paths = [
+            os.path.join(self.__directory, name)
+            for name in os.listdir(self.__directory)
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        max_files = self.__max_files
+        for path in paths[max_files:]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(e)
+
+
+class S3ProfileSink:
+    """Saves profiles to an S3 bucket under a prefix"""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = ""):
+        self.__s3 = s3_client
+        self.__bucket = bucket
+        self.__prefix = prefix.strip("/")
+
+    def save(self, name: str, data: bytes) -> str:
+        """Saves a profile, returning its S3 URI"""
+        key = f"{self.__prefix}/{name}" if self.__prefix else name
+        self.__s3.put_object(Bucket=self.__bucket, Key=key, Body=data)
+        return f"s3://{self.__bucket}/{key}"
+
+
+class StackSampler:
+    """
+    Samples the stacks of every other thread every interval seconds, counting them as
+    collapsed stacks ("outer;...;inner count" lines, the input of flamegraph tools)
+
+    Unlike cProfile this also sees work the request hands to the thread pool, and its
+    overhead doesn't grow with the number of function calls.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.__interval = interval
+        self.__stacks: Counter = Counter()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.samples = 0
+
+    def start(self):
+        """Starts sampling"""
+        self.__thread.start()
+
+    def stop(self):
+        """Stops sampling"""
+        self.__stop.set()
+        self.__thread.join()
+
+    def collapsed(self) -> bytes:
+        """Gets the sampled stacks in the collapsed format"""
+        lines = [f"{stack} {count}" for stack, count in self.__stacks.most_common()]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def summary(self, limit: int = PROFILE_TOP_FUNCTIONS) -> str:
+        """Summarizes the functions that were on top of the stack most often"""
+        leaves: Counter = Counter()
+        for stack, count in self.__stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        lines = [f"{self.samples} samples, top functions by own time:"]
+        for frame, count in leaves.most_common(limit):
+            lines.append(f"{count / total:7.1%}  {frame}")
+        return "\n".join(lines)
+
+    def __run(self):
+        """Records the stack of every thread but this one until stopped"""
+        own_id = threading.get_ident()
+        while not self.__stop.wait(self.__interval):
+            self.samples += 1
+            # pylint: disable=protected-access
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.__stacks[self.__collapse(frame)] += 1
+
+    def __collapse(self, frame) -> str:
+        """Turns a frame into its stack, outermost call first"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a request when it carries a valid X-Profile-Signature
+    header (see sign_profile_request) or is picked by sample_rate
+
+    A profiled request runs under cProfile (pstats mode) or the StackSampler (collapsed
+    mode). The profile is saved to the sink, its location is returned in X-Profile-Id and
+    the top functions are logged. Only one request at a time is profiled, others run as
+    usual. Without a secret and with a zero sample rate, a request costs one extra call.
+    """
+
+    def __init__(
+        self,
+        app,
+        sink: ProfileSink,
+        secret: Optional[str] = None,
+        sample_rate: float = 0.0,
+        mode: ProfileMode = ProfileMode.PSTATS,
+    ):
+        self.app = app
+        self.__sink = sink
+        self.__secret = secret.encode("utf-8") if secret else None
+        self.__sample_rate = sample_rate
+        self.__mode = ProfileMode(mode)
+        self.__lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.__secret or self.__sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.__should_profile(scope) or not self.__lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.__profile(scope, receive, send)
+        finally:
+            self.__lock.release()
+
+    async def __profile(self, scope, receive, send):
+        """Runs the request under the profiler, then saves and logs the profile"""
+        name = self.__get_profile_name(scope)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, name.encode("utf-8")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        if self.__mode == ProfileMode.COLLAPSED:
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                sampler.stop()
+                self.__save(name, sampler.collapsed(), sampler.summary())
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active in this interpreter
+            print(e)
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            # Dumped first, since pstats.Stats takes the stats out of the profiler
+            data = marshal.dumps(profiler.stats)
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            self.__save(name, data, stream.getvalue())
+
+    def __save(self, name: str, data: bytes, summary: str):
+        """Saves a profile to the sink and logs its summary, never failing the request"""
+        try:
+            location = self.__sink.save(name, data)
+            logger.info(f"Saved request profile to {location}\n{summary}")
+        except Exception as e:
+            logger.warning(f"Saving request profile {name} failed: {e}\n{summary}")
+
+    def __should_profile(self, scope) -> bool:
+        """Checks if a request was sampled or asked to be profiled"""
+        if self.__sample_rate and random.random() < self.__sample_rate:
+            return True
+        if not self.__secret:
+            return False
+
+        for key, value in scope.get("headers", []):
+            if key == PROFILE_HEADER:
+                return self.__verify(scope, value.decode("latin-1"))
+        return False
+
+    def __verify(self, scope, signature: str) -> bool:
+        """Checks a request's signature against the secret, method, path and time"""
+        timestamp, _, digest = signature.partition(":")
+        if not timestamp.isdigit():
+            return False
+        if abs(time.time() - int(timestamp)) > PROFILE_SIGNATURE_MAX_AGE:
+            return False
+
+        secret = self.__secret
+        if secret is None:
+            return False
+
+        message = f"{timestamp}:{scope['method'].upper()}:{scope['path']}"
+        expected = hmac.new(secret, message.encode("utf-8"), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, digest)
+
+    def __get_profile_name(self, scope) -> str:
+        """Builds a unique file name for a request's profile"""
+        route = re.sub(r"[^a-zA-Z0-9]+", "-", scope["path"]).strip("-") or "root"
+        extension = "collapsed" if self.__mode == ProfileMode.COLLAPSED else "pstats"
+        timestamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        suffix = uuid.uuid4().hex[:8]
+        return f"{timestamp}-{scope['method'].lower()}-{route}-{suffix}.{extension}"
@@ -1,4 +1,5 @@
 """This module aggregates all of the type files"""
 
 from src.utils.types.financial_connections_types import *
+from src.utils.types.profiling_types import *
 from src.utils.types.sessions_types import *
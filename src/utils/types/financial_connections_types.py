@@ -13,6 +13,14 @@ class TransactionRange(str, Enum):
     SIX_MONTH = "sixMonth"
 
 
+class RecurringFrequency(str, Enum):
+    """The periods a recurring payment can repeat at"""
+
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    ANNUAL = "annual"
+
+
 class TransactionData(TypedDict):
     """This class represents the shape of the Transaction data request"""
 
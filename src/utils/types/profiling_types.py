@@ -0,0 +1,10 @@
+"""Types for request profiling"""
+
+from enum import Enum
+
+
+class ProfileMode(str, Enum):
+    """The profilers a request can be run under"""
+
+    PSTATS = "pstats"
+    COLLAPSED = "collapsed"
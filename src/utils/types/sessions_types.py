@@ -1,7 +1,11 @@
 """This module contains all session types"""
 
 from enum import Enum
-from typing import List, Optional, TypedDict
+from typing import List, Optional
+
+from typing_extensions import NotRequired, TypedDict
+
+from src.utils.types.financial_connections_types import TransactionRange
 
 
 class ChartType(str, Enum):
@@ -57,3 +61,5 @@ class GenerationRequest(TypedDict):
     message_content: str
     history: List[ChatMessage]
     context: List[str]
+    customer_id: NotRequired[str]
+    range: NotRequired[TransactionRange]
@@ -0,0 +1 @@
+"""This package contains the tests, run with python -m unittest"""
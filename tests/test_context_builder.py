@@ -0,0 +1,165 @@
+"""Tests for the financial context builder, run against the local model client"""
+
+import unittest
+
+from local_backends import LocalModelClient
+from src.modules.sessions import context_builder
+from src.modules.sessions.context_builder import FinancialContextBuilder
+from src.utils import TransactionRange
+
+NOW = 1_735_689_600  # 2025-01-01T00:00:00Z
+DAY = 86400
+
+
+def make_transaction(txn_id: str, amount: int, days_ago: int, description: str):
+    """Builds a cleaned transaction like the ones get_transaction_data returns"""
+    return {
+        "id": txn_id,
+        "account": "fca_checking",
+        "amount": amount,
+        "transacted_at": NOW - days_ago * DAY,
+        "description": description,
+        "category": "Food & Drink" if amount < 0 else "Income",
+        "status": "posted",
+    }
+
+
+TRANSACTIONS = [
+    make_transaction("fctxn_1", -1250, 1, "STARBUCKS 1234"),
+    make_transaction("fctxn_2", -480000, 3, "RENT PAYMENT"),
+    make_transaction("fctxn_3", 520000, 5, "PAYROLL ACME"),
+    make_transaction("fctxn_4", -2599, 12, "CHIPOTLE 88"),
+]
+
+RECURRING = [
+    {
+        "merchant": "Netflix",
+        "amount": -1599,
+        "frequency": "monthly",
+        "annualized_amount": -19188,
+        "next_expected": NOW + 10 * DAY,
+        "active": True,
+    }
+]
+
+
+class StubFinancialConnectionsService:
+    """Serves fixed transactions and recurring payments, counting the calls"""
+
+    def __init__(self):
+        self.transaction_calls = 0
+        self.recurring_calls = 0
+
+    def get_transaction_data(self, customer_id: str, tx_range: TransactionRange):
+        """Gets the fixed transactions"""
+        self.transaction_calls += 1
+        return list(TRANSACTIONS)
+
+    def get_recurring_payments(self, customer_id: str):
+        """Gets the fixed recurring payments"""
+        self.recurring_calls += 1
+        return RECURRING
+
+
+def make_message(message_id: str, content: str):
+    """Builds a chat history message"""
+    return {
+        "message_id": message_id,
+        "user_id": "user",
+        "message_content": content,
+        "message_type": "user",
+        "session_id": "session",
+        "timestamp": "2025-01-01T00:00:00+00:00",
+        "graph_data": None,
+    }
+
+
+class FinancialContextBuilderTest(unittest.TestCase):
+    """Tests FinancialContextBuilder with LocalModelClient"""
+
+    def setUp(self):
+        self.service = StubFinancialConnectionsService()
+        self.model_client = LocalModelClient()
+        self.builder = FinancialContextBuilder(
+            financial_connections_service=self.service,
+            model_client=self.model_client,
+        )
+
+    def count_tokens(self, lines) -> int:
+        """Counts the tokens of context lines"""
+        return sum(self.model_client.count_tokens(line) for line in lines)
+
+    def test_summary_sections(self):
+        sections = self.builder.summarize(
+            TRANSACTIONS, TransactionRange.MONTH, now=NOW, recurring=RECURRING
+        )
+        headers = [section[0] for section in sections]
+        self.assertEqual(
+            headers,
+            [
+                "Totals by period (spent / received / avg spent per day):",
+                "Spending by category:",
+                "Recurring payments (amount, frequency, next expected):",
+                "Largest transactions:",
+            ],
+        )
+        self.assertIn("- Food & Drink: $4,838.49", sections[1])
+        self.assertIn("- Netflix: $15.99 monthly, next 2025-01-11", sections[2])
+        self.assertEqual(sections[3][1], "- 2024-12-27 PAYROLL ACME: $5,200.00")
+
+    def test_build_fits_budget(self):
+        history = [make_message(str(i), "message " * 20) for i in range(50)]
+        result = self.builder.build(
+            customer_id="cus_test",
+            tx_range=TransactionRange.MONTH,
+            history=history,
+            context=["The user is asking about last month."],
+            token_budget=400,
+        )
+
+        context_tokens = self.count_tokens(result["context"])
+        history_tokens = self.count_tokens(
+            message["message_content"] for message in result["history"]
+        )
+        self.assertEqual(result["context"][0], "The user is asking about last month.")
+        self.assertLessEqual(context_tokens, int(400 * context_builder.CONTEXT_SHARE))
+        self.assertLessEqual(context_tokens + history_tokens, 400)
+        self.assertTrue(result["history"])
+        # The most recent messages are kept, oldest first
+        self.assertEqual(result["history"][-1]["message_id"], "49")
+
+    def test_summary_is_cached(self):
+        for _ in range(3):
+            self.builder.get_summary("cus_test", TransactionRange.MONTH)
+        self.assertEqual(self.service.transaction_calls, 1)
+        self.assertEqual(self.service.recurring_calls, 1)
+
+        self.builder.invalidate("cus_test")
+        self.builder.get_summary("cus_test", TransactionRange.MONTH)
+        self.assertEqual(self.service.transaction_calls, 2)
+
+    def test_cache_is_bounded(self):
+        limit = context_builder.MAX_CACHED_CONTEXTS
+        for i in range(limit + 1):
+            self.builder.get_summary(f"cus_{i}", TransactionRange.WEEK)
+        self.assertEqual(self.service.transaction_calls, limit + 1)
+
+        # The most recent customer is still cached, the first one was evicted
+        self.builder.get_summary(f"cus_{limit}", TransactionRange.WEEK)
+        self.assertEqual(self.service.transaction_calls, limit + 1)
+        self.builder.get_summary("cus_0", TransactionRange.WEEK)
+        self.assertEqual(self.service.transaction_calls, limit + 2)
+
+    def test_no_customer_only_uses_request_context(self):
+        result = self.builder.build(
+            customer_id=None,
+            tx_range=TransactionRange.MONTH,
+            history=[make_message("1", "hi")],
+            context=["Extra context"],
+        )
+        self.assertEqual(result["context"], ["Extra context"])
+        self.assertEqual(self.service.transaction_calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
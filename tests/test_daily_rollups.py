@@ -0,0 +1,126 @@
+"""Tests for the daily rollups, run against the local DynamoDB stand-in"""
+
+import unittest
+
+from local_backends import LocalTable
+from src.modules.financial_connections.daily_rollups import (
+    DailyRollupStore,
+    aggregate_transactions,
+)
+
+DAY = 86400
+TODAY = "2025-01-10"
+TODAY_START = 1_736_467_200  # 2025-01-10T00:00:00Z
+
+
+def make_transaction(account: str, amount: int, days_ago: int):
+    """Builds a cleaned transaction at noon, days_ago days before today"""
+    return {
+        "account": account,
+        "amount": amount,
+        "transacted_at": TODAY_START - days_ago * DAY + DAY // 2,
+    }
+
+
+class CountingTable(LocalTable):
+    """Local rollups table that counts the DDB calls made to it"""
+
+    def __init__(self):
+        super().__init__("daily_rollups", client=None)
+        self.calls = 0
+
+    def query(self, KeyConditionExpression, **kwargs):
+        self.calls += 1
+        return super().query(KeyConditionExpression, **kwargs)
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        self.calls += 1
+        return super().put_item(Item, ConditionExpression, **kwargs)
+
+    def delete_item(self, Key, **kwargs):
+        self.calls += 1
+        return super().delete_item(Key, **kwargs)
+
+
+class AggregateTransactionsTest(unittest.TestCase):
+    """Tests aggregate_transactions"""
+
+    def test_groups_by_account_and_day(self):
+        transactions = [
+            make_transaction("fca_a", -500, 1),
+            make_transaction("fca_a", -250, 1),
+            make_transaction("fca_a", 1000, 1),
+            make_transaction("fca_a", -100, 5),
+            make_transaction("fca_b", -100, 1),
+        ]
+        computed = aggregate_transactions(transactions, {"fca_a": "2025-01-07"})
+        self.assertEqual(computed, {"fca_a": {"2025-01-09": (750, 1000, 3)}})
+
+
+class DailyRollupStoreTest(unittest.TestCase):
+    """Tests DailyRollupStore with a local table"""
+
+    def setUp(self):
+        self.table = CountingTable()
+        self.store = DailyRollupStore(self.table)
+        self.transactions = [
+            make_transaction("fca_a", -500, days_ago)
+            for days_ago in range(0, 6)
+            for _ in range(days_ago + 1)
+        ]
+
+    def ingest(self, days: int):
+        """Ingests a fetch that started days before today"""
+        self.store.ingest(
+            windows={"fca_a": TODAY_START - days * DAY - 1},
+            transactions=self.transactions,
+            today=TODAY,
+        )
+
+    def test_summarize_matches_transactions(self):
+        self.ingest(5)
+        self.assertTrue(self.store.is_covered("fca_a", "2025-01-05", "2025-01-09"))
+        self.assertFalse(self.store.is_covered("fca_a", "2025-01-05", TODAY))
+        self.assertEqual(
+            self.store.summarize("fca_a", "2025-01-08", "2025-01-09"),
+            {"debits": 500 * 5, "credits": 0, "count": 5},
+        )
+
+    def test_reingesting_the_same_data_is_free(self):
+        self.ingest(5)
+        calls = self.table.calls
+        self.ingest(5)
+        self.assertEqual(self.table.calls, calls)
+
+        # Only the changed day is written
+        self.transactions.append(make_transaction("fca_a", 200, 2))
+        self.ingest(5)
+        self.assertEqual(self.table.calls, calls + 1)
+        self.assertEqual(
+            self.store.summarize("fca_a", "2025-01-08", "2025-01-08"),
+            {"debits": 1500, "credits": 200, "count": 4},
+        )
+
+    def test_adjacent_window_extends_coverage(self):
+        self.ingest(5)
+        self.ingest(2)
+        self.assertTrue(self.store.is_covered("fca_a", "2025-01-05", "2025-01-09"))
+
+        # Another container's store reads the same rows
+        other = DailyRollupStore(self.table)
+        self.assertEqual(
+            other.summarize("fca_a", "2025-01-05", "2025-01-09")["count"], 20
+        )
+
+    def test_clear_resets_coverage(self):
+        self.ingest(5)
+        self.store.clear("fca_a")
+        self.assertFalse(self.store.is_covered("fca_a", "2025-01-09", "2025-01-09"))
+
+        self.ingest(2)
+        self.assertFalse(self.store.is_covered("fca_a", "2025-01-07", "2025-01-09"))
+        self.assertTrue(self.store.is_covered("fca_a", "2025-01-08", "2025-01-09"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+"""Tests for recurring payment detection"""
+
+import unittest
+
+from src.modules.financial_connections.recurring_payments import (
+    RecurringPaymentDetector,
+    detect_recurring_payments,
+)
+
+NOW = 1_735_689_600  # 2025-01-01T00:00:00Z
+DAY = 86400
+
+
+def make_transaction(
+    txn_id: str, merchant: str, amount: int, days_ago: float, account="fca_a"
+):
+    """Builds a cleaned transaction"""
+    return {
+        "id": txn_id,
+        "account": account,
+        "merchant": merchant,
+        "description": merchant.upper(),
+        "category": "Bills",
+        "amount": amount,
+        "currency": "usd",
+        "status": "posted",
+        "transacted_at": int(NOW - days_ago * DAY),
+    }
+
+
+def monthly(merchant: str, amount: int, months: int, account="fca_a"):
+    """Builds a debit every 30 days, newest first, the latest one 10 days ago"""
+    return [
+        make_transaction(f"{merchant}{i}", merchant, amount, 10 + 30 * i, account)
+        for i in range(months)
+    ]
+
+
+def get_merchants(series) -> list[tuple[str, str]]:
+    """Gets the (merchant, frequency) of detected series, in order"""
+    return [(payment["merchant"], payment["frequency"]) for payment in series]
+
+
+class DetectRecurringPaymentsTest(unittest.TestCase):
+    """Tests detect_recurring_payments"""
+
+    def test_finds_weekly_monthly_and_annual_series(self):
+        transactions = [
+            *monthly("Netflix", -1549, 4),
+            *monthly("Rent", -200000, 3),
+            *[make_transaction(f"gym{i}", "Gym", -2500, 3 + 7 * i) for i in range(5)],
+            *[
+                make_transaction(f"dom{i}", "Domains", -1200, 20 + 365 * i)
+                for i in range(2)
+            ],
+        ]
+        series = detect_recurring_payments(transactions, now=NOW)
+        self.assertEqual(
+            get_merchants(series),
+            [
+                ("Rent", "monthly"),
+                ("Gym", "weekly"),
+                ("Netflix", "monthly"),
+                ("Domains", "annual"),
+            ],
+        )
+        netflix = series[2]
+        self.assertEqual(netflix["amount"], -1549)
+        self.assertEqual(netflix["occurrences"], 4)
+        self.assertEqual(netflix["last_seen"], NOW - 10 * DAY)
+        self.assertTrue(netflix["active"])
+
+    def test_ignores_irregular_credits_and_voids(self):
+        transactions = [
+            *[
+                make_transaction(f"cafe{i}", "Cafe", -450, days)
+                for i, days in enumerate([1, 2, 9, 40])
+            ],
+            *monthly("Payroll", 520000, 4),
+            *[{**txn, "status": "void"} for txn in monthly("Voided", -999, 4)],
+        ]
+        self.assertEqual(detect_recurring_payments(transactions, now=NOW), [])
+
+    def test_price_change_and_second_plan(self):
+        transactions = [
+            *monthly("Spotify", -1099, 2),
+            make_transaction("Spotify9", "Spotify", -1199, 70),
+            *monthly("Storage", -299, 3),
+            *[
+                make_transaction(f"Pro{i}", "Storage", -999, 12 + 30 * i)
+                for i in range(3)
+            ],
+        ]
+        series = detect_recurring_payments(transactions, now=NOW)
+        self.assertEqual(
+            sorted((payment["merchant"], payment["amount"]) for payment in series),
+            [("Spotify", -1099), ("Storage", -999), ("Storage", -299)],
+        )
+
+    def test_overdue_series_is_inactive(self):
+        series = detect_recurring_payments(
+            monthly("Netflix", -1549, 4), now=NOW + 60 * DAY
+        )
+        self.assertFalse(series[0]["active"])
+
+
+class RecurringPaymentDetectorTest(unittest.TestCase):
+    """Tests updating RecurringPaymentDetector in place"""
+
+    def setUp(self):
+        self.detector = RecurringPaymentDetector()
+        self.detector.update(
+            monthly("Netflix", -1549, 4) + monthly("Hulu", -799, 3, account="fca_b"),
+            windows={"fca_a": NOW - 180 * DAY, "fca_b": NOW - 180 * DAY},
+        )
+
+    def test_update_adds_new_occurrences(self):
+        self.assertEqual(
+            get_merchants(self.detector.get_series(now=NOW)),
+            [("Netflix", "monthly"), ("Hulu", "monthly")],
+        )
+        # A fetch of the last 25 days returns the new charge and the latest known one
+        self.detector.update(
+            [
+                make_transaction("Netflix-1", "Netflix", -1549, -20),
+                make_transaction("Netflix0", "Netflix", -1549, 10),
+            ],
+            windows={"fca_a": NOW - 25 * DAY},
+        )
+        netflix = self.detector.get_series(now=NOW)[0]
+        self.assertEqual(netflix["occurrences"], 5)
+        self.assertEqual(netflix["last_seen"], NOW + 20 * DAY)
+
+    def test_update_removes_debits_missing_from_the_window(self):
+        # Only the latest Hulu charge is in the window, and it is gone
+        self.detector.update([], windows={"fca_b": NOW - 20 * DAY})
+        self.assertEqual(
+            get_merchants(self.detector.get_series(now=NOW)), [("Netflix", "monthly")]
+        )
+
+        # Accounts outside the windows are kept
+        self.detector.update([], windows={"fca_c": NOW - 180 * DAY})
+        self.assertEqual(len(self.detector.get_series(now=NOW)), 1)
+
+    def test_refreshed_at_is_set_by_update(self):
+        self.assertEqual(RecurringPaymentDetector().refreshed_at, 0.0)
+        self.assertGreater(self.detector.refreshed_at, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for the incremental parser of streamed model responses"""
+
+import json
+import unittest
+
+from src.modules.sessions.response_parser import MessageStreamParser
+
+
+def feed_all(chunks) -> tuple[str, MessageStreamParser]:
+    """Feeds chunks to a new parser, returning the decoded message text and the parser"""
+    parser = MessageStreamParser()
+    return "".join(parser.feed(chunk) for chunk in chunks), parser
+
+
+def split_every(text: str, size: int) -> list[str]:
+    """Splits text into chunks of size characters"""
+    return [text[start:][:size] for start in range(0, len(text), size)]
+
+
+class MessageStreamParserTest(unittest.TestCase):
+    """Tests MessageStreamParser"""
+
+    def assert_streams(self, response: dict):
+        """Checks the message of a response decodes the same at every chunk size"""
+        text = json.dumps(response)
+        for size in range(1, 13):
+            message, parser = feed_all(split_every(text, size))
+            self.assertEqual(message, response["message"], f"chunk size {size}")
+            self.assertEqual(parser.result(), response)
+
+    def test_message_is_streamed_before_the_rest(self):
+        parser = MessageStreamParser()
+        self.assertEqual(parser.feed('{"message": "Hello, '), "Hello, ")
+        self.assertEqual(parser.feed('world", "graph": {"message": "x"'), "world")
+        self.assertEqual(parser.feed("}}"), "")
+        self.assertEqual(parser.result()["graph"], {"message": "x"})
+
+    def test_split_escapes(self):
+        self.assert_streams({"message": 'Line\nbreak, "quote", tab\t and \\ é'})
+
+    def test_surrogate_pairs(self):
+        self.assert_streams({"message": "Budget 😀 done 🎉", "graph": None})
+
+    def test_high_surrogate_without_a_low_surrogate(self):
+        parser = MessageStreamParser()
+        self.assertEqual(
+            parser.feed('{"message": "\\ud83dabcde\\\\u'), "\ud83dabcde\\u"
+        )
+        self.assertEqual(parser.feed('"}'), "")
+
+    def test_malformed_unicode_escape_is_kept_as_text(self):
+        message, parser = feed_all(['{"message": "bad \\u12G4 ', 'escape"}'])
+        self.assertEqual(message, "bad \\u12G4 escape")
+        self.assertEqual(
+            parser.result()["message"], '{"message": "bad \\u12G4 escape"}'
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Tests for the streaming CSV encoder of transaction exports"""
+
+import csv
+import io
+import unittest
+
+from src.modules.financial_connections.transaction_export import (
+    EXPORT_COLUMNS,
+    iter_csv,
+)
+
+
+def read_rows(transactions) -> list[dict]:
+    """Encodes transactions and parses the CSV back into rows"""
+    text = b"".join(iter_csv(transactions)).decode("utf-8")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+class IterCsvTest(unittest.TestCase):
+    """Tests iter_csv"""
+
+    def test_encodes_columns(self):
+        rows = read_rows(
+            [
+                {
+                    "id": "fctxn1",
+                    "transacted_at": 1_735_689_600,
+                    "status_transitions": {"posted_at": None},
+                    "description": "STARBUCKS, 1234",
+                    "amount": -1050,
+                }
+            ]
+        )
+        self.assertEqual(list(rows[0]), list(EXPORT_COLUMNS))
+        self.assertEqual(rows[0]["transacted_at"], "2025-01-01T00:00:00Z")
+        self.assertEqual(rows[0]["posted_at"], "")
+        self.assertEqual(rows[0]["description"], "STARBUCKS, 1234")
+        self.assertEqual(rows[0]["amount"], "-10.50")
+
+    def test_formula_cells_are_escaped(self):
+        rows = read_rows(
+            [
+                {"description": '=HYPERLINK("http://x")', "merchant": "@SUM(A1)"},
+                {"description": "+1 555", "merchant": "-Store", "amount": -100},
+            ]
+        )
+        self.assertEqual(rows[0]["description"], '\'=HYPERLINK("http://x")')
+        self.assertEqual(rows[0]["merchant"], "'@SUM(A1)")
+        self.assertEqual(rows[1]["description"], "'+1 555")
+        self.assertEqual(rows[1]["merchant"], "'-Store")
+        # Amounts are numbers, not formulas
+        self.assertEqual(rows[1]["amount"], "-1.00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests for the in-memory transaction search index"""
+
+import unittest
+
+from src.modules.financial_connections.transaction_index import TransactionIndex
+
+NOW = 1_735_689_600  # 2025-01-01T00:00:00Z
+DAY = 86400
+
+
+def make_transaction(
+    txn_id: str, description: str, amount: int, days_ago: int, account="fca_a"
+):
+    """Builds a cleaned transaction"""
+    return {
+        "id": txn_id,
+        "account": account,
+        "description": description,
+        "amount": amount,
+        "transacted_at": NOW - days_ago * DAY,
+    }
+
+
+TRANSACTIONS = [
+    make_transaction("fctxn1", "STARBUCKS 1234", -550, 1),
+    make_transaction("fctxn2", "Star Market groceries", -8420, 3),
+    make_transaction("fctxn3", "PAYROLL ACME", 520000, 5),
+    make_transaction("fctxn4", "Starbucks Reserve", -1250, 20),
+    make_transaction("fctxn4", "Starbucks Reserve", -1250, 21, account="fca_wf"),
+]
+
+
+def get_ids(results) -> list[tuple[str, str]]:
+    """Gets the (id, account) of search results, in order"""
+    return [(txn["id"], txn["account"]) for txn in results]
+
+
+class TransactionIndexTest(unittest.TestCase):
+    """Tests TransactionIndex"""
+
+    def setUp(self):
+        self.index = TransactionIndex()
+        self.index.update(TRANSACTIONS, {"fca_a": NOW - 30 * DAY})
+
+    def test_prefix_search_newest_first(self):
+        self.assertEqual(
+            get_ids(self.index.search("star")),
+            [
+                ("fctxn1", "fca_a"),
+                ("fctxn2", "fca_a"),
+                ("fctxn4", "fca_a"),
+                ("fctxn4", "fca_wf"),
+            ],
+        )
+        self.assertEqual(
+            get_ids(self.index.search("starb res")),
+            [("fctxn4", "fca_a"), ("fctxn4", "fca_wf")],
+        )
+        self.assertEqual(self.index.search("coffee"), [])
+
+    def test_amount_and_date_ranges(self):
+        self.assertEqual(
+            get_ids(self.index.search(min_amount=1000, max_amount=10000)),
+            [("fctxn2", "fca_a"), ("fctxn4", "fca_a"), ("fctxn4", "fca_wf")],
+        )
+        self.assertEqual(
+            get_ids(self.index.search("star", start=NOW - 3 * DAY, end=NOW - DAY)),
+            [("fctxn1", "fca_a"), ("fctxn2", "fca_a")],
+        )
+        self.assertEqual(len(self.index.search(limit=2)), 2)
+
+    def test_update_replaces_and_removes_within_the_window(self):
+        renamed = make_transaction("fctxn1", "PEET'S COFFEE", -550, 1)
+        self.index.update([renamed], {"fca_a": NOW - 2 * DAY})
+
+        self.assertEqual(get_ids(self.index.search("peet")), [("fctxn1", "fca_a")])
+        self.assertNotIn(("fctxn1", "fca_a"), get_ids(self.index.search("star")))
+        # Rows of the account outside the window and of other accounts are kept
+        self.assertEqual(len(self.index), 5)
+
+        self.index.update([renamed], {"fca_a": NOW - 10 * DAY})
+        self.assertEqual(self.index.search("market"), [])
+        self.assertEqual(self.index.search("payroll"), [])
+        self.assertEqual(len(self.index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
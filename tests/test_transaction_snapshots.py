@@ -0,0 +1,120 @@
+"""Tests for the columnar transaction snapshots"""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.modules.financial_connections.transaction_snapshots import (
+    TransactionSnapshotStore,
+    get_snapshot_version,
+)
+
+DAY = 86400
+NOW = int(time.time())
+WEEK_START = NOW - 7 * DAY
+SIX_MONTH_START = NOW - 180 * DAY
+
+
+def make_transaction(txn_id: str, amount: int, days_ago: int):
+    """Builds a cleaned transaction of the fca_a account"""
+    transacted_at = NOW - days_ago * DAY
+    return {
+        "id": txn_id,
+        "object": "financial_connections.transaction",
+        "account": "fca_a",
+        "amount": amount,
+        "currency": "usd",
+        "description": f"Merchant {txn_id}",
+        "status": "posted",
+        "status_transitions": {"posted_at": transacted_at + 60, "void_at": None},
+        "transacted_at": transacted_at,
+        "transaction_refresh": "fctxnref_1",
+        "updated": transacted_at,
+        "livemode": False,
+        "institution_name": "Bank",
+        "acct_display_name": "Checking",
+        "acct_last4": "6789",
+    }
+
+
+def make_account(refresh_id: str):
+    """Builds an account whose latest transaction refresh is refresh_id"""
+    return {
+        "id": "fca_a",
+        "transaction_refresh": {
+            "id": refresh_id,
+            "status": "succeeded",
+            "last_attempted_at": NOW,
+        },
+    }
+
+
+class TransactionSnapshotStoreTest(unittest.TestCase):
+    """Tests TransactionSnapshotStore on a temporary directory"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = TransactionSnapshotStore(directory=self.directory)
+        self.version = get_snapshot_version([make_account("fctxnref_1")])
+        self.transactions = [
+            make_transaction("fctxn1", -500, 1),
+            make_transaction("fctxn2", 1200, 3),
+            make_transaction("fctxn3", -11917, 8),
+            make_transaction("fctxn4", -2000, 40),
+        ]
+        self.store.save(
+            "cus_a", self.version, {"fca_a": SIX_MONTH_START}, self.transactions
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        snapshot = self.store.load("cus_a", self.version)
+        self.assertIsNotNone(snapshot)
+        records = snapshot.records()
+        self.assertEqual(
+            [txn["id"] for txn in records], ["fctxn1", "fctxn2", "fctxn3", "fctxn4"]
+        )
+        self.assertEqual(records[2]["amount"], -11917)
+        self.assertEqual(records[0]["acct_last4"], "6789")
+        self.assertEqual(
+            [txn["id"] for txn in snapshot.records(start=WEEK_START)],
+            ["fctxn1", "fctxn2"],
+        )
+        self.assertTrue(snapshot.covers(["fca_a"], SIX_MONTH_START))
+        self.assertIsNone(self.store.load("cus_a", "another version"))
+
+    def test_same_version_merges_older_rows(self):
+        self.store.save(
+            "cus_a", self.version, {"fca_a": WEEK_START}, self.transactions[:2]
+        )
+        snapshot = self.store.load("cus_a", self.version)
+        self.assertEqual(len(snapshot), 4)
+        self.assertTrue(snapshot.covers(["fca_a"], SIX_MONTH_START))
+
+    def test_new_version_drops_older_rows(self):
+        # After a new transaction refresh, an 8 day old transaction changed at Stripe
+        version = get_snapshot_version([make_account("fctxnref_2")])
+        self.store.save("cus_a", version, {"fca_a": WEEK_START}, self.transactions[:2])
+
+        snapshot = self.store.load("cus_a", version)
+        self.assertEqual(
+            [txn["id"] for txn in snapshot.records()], ["fctxn1", "fctxn2"]
+        )
+        self.assertTrue(snapshot.covers(["fca_a"], WEEK_START))
+        self.assertFalse(snapshot.covers(["fca_a"], SIX_MONTH_START))
+
+    def test_oversized_snapshot_is_skipped(self):
+        store = TransactionSnapshotStore(directory=self.directory, max_bytes=1024)
+        self.assertIsNone(
+            store.save(
+                "cus_b", self.version, {"fca_a": SIX_MONTH_START}, self.transactions
+            )
+        )
+        self.assertIsNone(store.load("cus_b", self.version))
+
+
+if __name__ == "__main__":
+    unittest.main()